@@ -8,6 +8,7 @@ import Dataset from 'types/Dataset';
 import ConfirmDelete from 'components/ConfirmDelete';
 import colours from 'lib/colours';
 import DownloadFileButton from 'components/DownloadFileButton';
+import {describeIngestion, isDatasetReady} from 'lib/dataset';
 
 const DatasetTable: React.FC = () => {
   const [datasets, setDatasets] = useAtom(datasetsAtom);
@@ -30,14 +31,27 @@ const DatasetTable: React.FC = () => {
     {name: 'Source', display: () => 'Local'},
     {name: 'File Count', display: dataset => dataset.files.length},
     {
-      name: 'Download',
+      name: 'Processed Files',
+      display: dataset => dataset.ingestion?.summary?.files ?? '-',
+    },
+    {
+      name: 'Status',
       display: dataset => (
-        <DownloadFileButton
-          downloadFile={() => downloadDataset(dataset.name)}
-          filename={`${dataset.name}.zip`}
-        />
+        <span title={dataset.ingestion?.error}>
+          {describeIngestion(dataset)}
+        </span>
       ),
     },
+    {
+      name: 'Download',
+      display: dataset =>
+        isDatasetReady(dataset) && (
+          <DownloadFileButton
+            downloadFile={() => downloadDataset(dataset.name)}
+            filename={`${dataset.name}.zip`}
+          />
+        ),
+    },
     {
       name: 'Delete',
       display: dataset => (
@@ -0,0 +1,58 @@
+import React from 'react';
+import {MetricSeries} from 'types/Metrics';
+
+type Props = {
+  tag: string;
+  series: MetricSeries;
+};
+
+const WIDTH = 300;
+const HEIGHT = 100;
+
+/** A minimal line chart of one training metric over the training steps. */
+const MetricsChart: React.FC<Props> = ({tag, series}) => {
+  const {steps, values} = series;
+  if (steps.length === 0) return <></>;
+
+  const minStep = steps[0];
+  const maxStep = steps[steps.length - 1];
+  const minValue = Math.min(...values);
+  const maxValue = Math.max(...values);
+
+  const x = (step: number) =>
+    maxStep === minStep
+      ? WIDTH / 2
+      : ((step - minStep) / (maxStep - minStep)) * WIDTH;
+  const y = (value: number) =>
+    maxValue === minValue
+      ? HEIGHT / 2
+      : HEIGHT - ((value - minValue) / (maxValue - minValue)) * HEIGHT;
+
+  const points = steps
+    .map((step, index) => `${x(step)},${y(values[index])}`)
+    .join(' ');
+
+  return (
+    <div className="space-y-1">
+      <div className="flex justify-between text-xs">
+        <span className="font-semibold">{tag}</span>
+        <span>{values[values.length - 1].toPrecision(4)}</span>
+      </div>
+      <svg
+        viewBox={`0 0 ${WIDTH} ${HEIGHT}`}
+        className="w-full h-24 bg-slate-50 rounded"
+        preserveAspectRatio="none"
+      >
+        <polyline
+          points={points}
+          fill="none"
+          stroke="currentColor"
+          strokeWidth={1.5}
+          vectorEffect="non-scaling-stroke"
+        />
+      </svg>
+    </div>
+  );
+};
+
+export default MetricsChart;
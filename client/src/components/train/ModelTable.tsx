@@ -1,6 +1,12 @@
 import {useAtom} from 'jotai';
 import fileDownload from 'js-file-download';
-import {deleteModel, downloadModel, trainModel} from 'lib/api/models';
+import {
+  cancelTraining,
+  deleteModel,
+  downloadModel,
+  getModelStatus,
+  trainModel,
+} from 'lib/api/models';
 import colours from 'lib/colours';
 import urls from 'lib/urls';
 import Link from 'next/link';
@@ -13,6 +19,13 @@ import DataTable, {Section} from 'components/DataTable';
 import ConfirmDelete from 'components/ConfirmDelete';
 import DownloadFileButton from 'components/DownloadFileButton';
 
+const STATUS_REFRESH_RATE = 5000;
+
+const sleep = (ms: number) => new Promise(resolve => setTimeout(resolve, ms));
+
+const isActive = (status?: TrainingStatus) =>
+  status === TrainingStatus.Queued || status === TrainingStatus.Training;
+
 const ModelTable: React.FC = () => {
   const [models, setModels] = useAtom(modelsAtom);
 
@@ -27,25 +40,46 @@ const ModelTable: React.FC = () => {
     }
   };
 
-  const setModelStatus = (index: number, status: TrainingStatus) => {
-    const nextModel = {...models[index], status};
-    setModels([
-      ...models.slice(0, index),
-      nextModel,
-      ...models.slice(index + 1),
-    ]);
+  // Polling outlives renders, so update models by name rather than index.
+  const setModelStatus = (name: string, status: TrainingStatus) => {
+    setModels(models =>
+      models.map(model => (model.name === name ? {...model, status} : model))
+    );
   };
 
   const _trainModel = async (index: number) => {
-    setModelStatus(index, TrainingStatus.Training);
-    const response = await trainModel(models[index].name);
-    if (response.ok) {
-      setModelStatus(index, TrainingStatus.Finished);
-    } else {
-      setModelStatus(index, TrainingStatus.Error);
-      const error = await response.json();
+    const name = models[index].name;
+    setModelStatus(name, TrainingStatus.Queued);
+    const response = await trainModel(name);
+    if (!response.ok) {
+      setModelStatus(name, TrainingStatus.Error);
+      const error = await response.text();
       console.log(error);
       alert(error);
+      return;
+    }
+
+    // Training happens in the background, so poll until it's done.
+    let status = TrainingStatus.Queued;
+    while (isActive(status)) {
+      await sleep(STATUS_REFRESH_RATE);
+      const statusResponse = await getModelStatus(name);
+      if (!statusResponse.ok) {
+        status = TrainingStatus.Error;
+      } else {
+        const data = await statusResponse.json();
+        status = data.status;
+      }
+      setModelStatus(name, status);
+    }
+  };
+
+  const _cancelTraining = async (name: string) => {
+    const response = await cancelTraining(name);
+    if (response.ok) {
+      setModelStatus(name, TrainingStatus.Cancelled);
+    } else {
+      alert(await response.text());
     }
   };
 
@@ -68,11 +102,13 @@ const ModelTable: React.FC = () => {
       name: 'Train',
       display: (model, index) => (
         <button
-          onClick={() => _trainModel(index)}
-          disabled={
-            model.status === TrainingStatus.Training ||
-            model.status === TrainingStatus.Finished
+          onClick={() =>
+            isActive(model.status)
+              ? _cancelTraining(model.name)
+              : _trainModel(index)
           }
+          title={isActive(model.status) ? 'Cancel training' : ''}
+          disabled={model.status === TrainingStatus.Finished}
         >
           <TrainingStatusIndicator
             status={model.status ?? TrainingStatus.Waiting}
@@ -1,6 +1,6 @@
 import React from 'react';
 import {TrainingStatus} from 'types/Model';
-import {Play, Loader, Check, AlertTriangle} from 'react-feather';
+import {Play, Loader, Check, AlertTriangle, Clock} from 'react-feather';
 import colours from 'lib/colours';
 
 type Status = {
@@ -10,7 +10,10 @@ type Status = {
 const TrainingStatusIndicator: React.FC<Status> = ({status}) => {
   switch (status) {
     case TrainingStatus.Waiting:
+    case TrainingStatus.Cancelled:
       return <Play color={colours.start} />;
+    case TrainingStatus.Queued:
+      return <Clock color={colours.unavailable} />;
     case TrainingStatus.Training:
       return <Loader color={colours.unavailable} className="animate-spin" />;
     case TrainingStatus.Finished:
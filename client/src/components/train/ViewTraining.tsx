@@ -1,10 +1,17 @@
-import {getModelLogs} from 'lib/api/models';
+import {
+  getModelLogs,
+  getModelMetrics,
+  startTensorboard,
+  streamModelLogs,
+  tailModelLogs,
+} from 'lib/api/models';
 import fileDownload from 'js-file-download';
 import React, {useEffect, useState} from 'react';
 import Model, {TrainingStatus} from 'types/Model';
-import Link from 'next/link';
 import {tensorboard} from 'lib/urls';
 import TrainingStatusIndicator from 'components/train/TrainingStatusIndicator';
+import MetricsChart from 'components/train/MetricsChart';
+import {TrainingMetrics} from 'types/Metrics';
 import {Button} from 'components/ui/button';
 import {Download} from 'react-feather';
 
@@ -12,35 +19,79 @@ type Props = {
   model: Model;
 };
 
-const LOGS_REFRESH_RATE = 2000;
+const METRICS_REFRESH_RATE = 10000;
 
 const ViewTraining: React.FC<Props> = ({model}) => {
   const [logs, setLogs] = useState<string[]>([]);
+  const [metrics, setMetrics] = useState<TrainingMetrics>();
 
-  // Continuously pull model logs if it's training.
+  // Stream new log lines while the model is training, otherwise read them
+  // all in chunks.
   useEffect(() => {
+    setLogs([]);
+    if (
+      model.status === TrainingStatus.Queued ||
+      model.status === TrainingStatus.Training
+    ) {
+      const events = streamModelLogs(model.name);
+      events.onmessage = event => {
+        const lines: string[] = JSON.parse(event.data);
+        setLogs(logs => [...logs, ...lines]);
+      };
+      events.addEventListener('done', () => events.close());
+      return () => events.close();
+    }
+
+    let cancelled = false;
     const fetchModelLogs = async () => {
-      const response = await getModelLogs(model.name);
-      if (response.ok) {
-        const blob = await response.blob();
-        const logs = await blob.text();
-        setLogs(logs.split('\n'));
-      } else {
-        const error = await response.text();
-        console.error('Error fetching model logs: ', error);
+      let since = 0;
+      let more = true;
+      while (more && !cancelled) {
+        const response = await tailModelLogs(model.name, since);
+        if (!response.ok) {
+          const error = await response.text();
+          console.error('Error fetching model logs: ', error);
+          return;
+        }
+        const data = await response.json();
+        if (!cancelled) setLogs(logs => [...logs, ...data.lines]);
+        since = data.offset;
+        more = data.more;
       }
     };
     fetchModelLogs();
+    return () => {
+      cancelled = true;
+    };
+  }, [model.status, model.name]);
+
+  // Refresh the metrics charts while the model is training.
+  useEffect(() => {
+    const fetchMetrics = async () => {
+      const response = await getModelMetrics(model.name);
+      if (response.ok) setMetrics(await response.json());
+    };
+    fetchMetrics();
     const interval =
       model.status === TrainingStatus.Training
-        ? setInterval(() => {
-            fetchModelLogs();
-          }, LOGS_REFRESH_RATE)
+        ? setInterval(fetchMetrics, METRICS_REFRESH_RATE)
         : undefined;
 
     return () => clearInterval(interval);
   }, [model.status, model.name]);
 
+  // Tensorboard is started on demand, so open its tab once it's serving.
+  const openTensorboard = async () => {
+    const tab = window.open('', '_blank');
+    const response = await startTensorboard(model.name);
+    if (response.ok) {
+      if (tab) tab.location.href = tensorboard;
+    } else {
+      tab?.close();
+      console.error('Error starting tensorboard: ', await response.text());
+    }
+  };
+
   const downloadLogs = async () => {
     const response = await getModelLogs(model.name);
     if (response.ok) {
@@ -64,6 +115,13 @@ const ViewTraining: React.FC<Props> = ({model}) => {
           />
         </div>
       </div>
+      {metrics && Object.keys(metrics.series).length > 0 && (
+        <div className="grid grid-cols-2 gap-4">
+          {Object.entries(metrics.series).map(([tag, series]) => (
+            <MetricsChart key={tag} tag={tag} series={series} />
+          ))}
+        </div>
+      )}
       <div className="max-h-96 overflow-y-auto bg-slate-800 text-white font-mono text-xs rounded p-3">
         {logs.map((log, index) => (
           <p key={index}>{log}</p>
@@ -78,11 +136,9 @@ const ViewTraining: React.FC<Props> = ({model}) => {
           <Download size={20} />
           <span>Download Logs</span>
         </Button>
-        <Link href={tensorboard}>
-          <a target="_blank">
-            <Button variant="link">Tensorboard</Button>
-          </a>
-        </Link>
+        <Button variant="link" onClick={openTensorboard}>
+          Tensorboard
+        </Button>
       </div>
     </div>
   );
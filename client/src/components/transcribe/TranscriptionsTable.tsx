@@ -3,6 +3,7 @@ import urls from 'lib/urls';
 import {
   deleteTranscription,
   downloadFiles,
+  getTranscriptionStatus,
   resetTranscriptions,
   transcribe,
 } from 'lib/api/transcribe';
@@ -19,6 +20,9 @@ import ConfirmDelete from 'components/ConfirmDelete';
 import DownloadFileButton from 'components/DownloadFileButton';
 
 const TRANSCRIPTION_FILES_FILENAME = 'transcription_files.zip';
+const STATUS_REFRESH_RATE = 2000;
+
+const sleep = (ms: number) => new Promise(resolve => setTimeout(resolve, ms));
 
 const DatasetTable: React.FC = () => {
   const [transcriptions, setTranscriptions] = useAtom(transcriptionsAtom);
@@ -43,12 +47,33 @@ const DatasetTable: React.FC = () => {
       transcription.modelLocation,
       transcription.audioName
     );
-    if (response.ok) {
-      transcription.status = TranscriptionStatus.Finished;
-    } else {
+    if (!response.ok) {
       transcription.status = TranscriptionStatus.Error;
-      console.error('Could not train transcription!');
+      console.error('Could not queue transcription!');
+      updateTranscription(transcription);
+      return;
+    }
+
+    // Transcription happens in the background, so poll until it's done.
+    let status = TranscriptionStatus.Transcribing;
+    while (status === TranscriptionStatus.Transcribing) {
+      await sleep(STATUS_REFRESH_RATE);
+      const statusResponse = await getTranscriptionStatus(
+        transcription.modelLocation,
+        transcription.audioName
+      );
+      if (!statusResponse.ok) {
+        status = TranscriptionStatus.Error;
+        break;
+      }
+      const data = await statusResponse.json();
+      if (data.status === TranscriptionStatus.Finished) {
+        status = TranscriptionStatus.Finished;
+      } else if (data.status === TranscriptionStatus.Error) {
+        status = TranscriptionStatus.Error;
+      }
     }
+    transcription.status = status;
     updateTranscription(transcription);
   };
 
@@ -89,9 +114,8 @@ const DatasetTable: React.FC = () => {
   };
 
   const transcribeEverything = async () => {
-    for (const transcription of readyTranscriptions) {
-      await _transcribe(transcription);
-    }
+    // The server queues these, so they can all be submitted at once.
+    await Promise.all(readyTranscriptions.map(_transcribe));
   };
 
   const removeTranscription = async (index: number) => {
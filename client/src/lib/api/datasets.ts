@@ -31,6 +31,42 @@ export async function createDataset(
   });
 }
 
+// Creates a dataset from a folder on the server, within its import roots.
+export async function importDataset(
+  name: string,
+  path: string,
+  cleaningOptions: CleaningOptions,
+  elanOptions?: ElanOptions
+): Promise<Response> {
+  return fetch(serverRoute(route.import), {
+    method: 'POST',
+    mode: 'cors',
+    body: JSON.stringify({name, path, cleaningOptions, elanOptions}),
+    headers: {
+      'Content-Type': 'application/json',
+    },
+  });
+}
+
+export async function updateDataset(
+  name: string,
+  files: File[],
+  removed: string[] = []
+): Promise<Response> {
+  const formData = new FormData();
+
+  files.forEach(file => {
+    formData.append('file', file);
+  });
+  formData.append('remove', JSON.stringify(removed));
+
+  return fetch(serverRoute(route.update(name)), {
+    method: 'POST',
+    mode: 'cors',
+    body: formData,
+  });
+}
+
 export async function deleteDataset(name: string): Promise<Response> {
   return fetch(serverRoute(route.dataset(name)), {
     mode: 'cors',
@@ -41,3 +77,17 @@ export async function deleteDataset(name: string): Promise<Response> {
 export async function downloadDataset(name: string): Promise<Response> {
   return fetch(serverRoute(route.download(name)));
 }
+
+export async function getDatasetProgress(name: string): Promise<Response> {
+  return fetch(serverRoute(route.progress(name)));
+}
+
+export async function verifyDataset(
+  name: string,
+  repair = false
+): Promise<Response> {
+  return fetch(serverRoute(route.verify(name)), {
+    method: repair ? 'POST' : 'GET',
+    mode: 'cors',
+  });
+}
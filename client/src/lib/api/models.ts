@@ -1,6 +1,7 @@
 import {serializeModel} from 'lib/models';
 import urls, {serverRoute} from 'lib/urls';
 import Model from 'types/Model';
+import {SweepGrid} from 'types/Sweep';
 
 const route = urls.api.models;
 
@@ -19,6 +20,26 @@ export async function createModel(model: Model): Promise<Response> {
   });
 }
 
+export async function createSweep(
+  sweepName: string,
+  model: Model,
+  grid: SweepGrid
+): Promise<Response> {
+  const {job, isDatasetLocal} = serializeModel(model);
+  return fetch(serverRoute(route.sweep), {
+    method: 'POST',
+    mode: 'cors',
+    body: JSON.stringify({name: sweepName, job, isDatasetLocal, grid}),
+    headers: {
+      'Content-Type': 'application/json',
+    },
+  });
+}
+
+export async function getSweep(sweepName: string): Promise<Response> {
+  return fetch(serverRoute(route.sweepComparison(sweepName)));
+}
+
 export async function deleteModel(modelName: string): Promise<Response> {
   return fetch(serverRoute(route.model(modelName)), {
     mode: 'cors',
@@ -30,22 +51,51 @@ export async function trainModel(modelName: string): Promise<Response> {
   return fetch(serverRoute(route.train(modelName)));
 }
 
+export async function cancelTraining(modelName: string): Promise<Response> {
+  return fetch(serverRoute(route.cancel(modelName)), {
+    mode: 'cors',
+    method: 'POST',
+  });
+}
+
 export async function getModelLogs(modelName: string): Promise<Response> {
   return fetch(serverRoute(route.logs(modelName)));
 }
 
+export async function tailModelLogs(
+  modelName: string,
+  since: number
+): Promise<Response> {
+  return fetch(serverRoute(route.tailLogs(modelName, since)));
+}
+
+export function streamModelLogs(modelName: string): EventSource {
+  return new EventSource(serverRoute(route.streamLogs(modelName)));
+}
+
 export async function getModelStatus(modelName: string): Promise<Response> {
   return fetch(serverRoute(route.status(modelName)));
 }
 
-export async function uploadModel(modelZip: File): Promise<Response> {
-  const formData = new FormData();
-  formData.append('file', modelZip);
+export async function getModelMetrics(modelName: string): Promise<Response> {
+  return fetch(serverRoute(route.metrics(modelName)));
+}
 
-  return fetch(serverRoute(route.upload), {
+export async function startTensorboard(modelName: string): Promise<Response> {
+  return fetch(serverRoute(route.tensorboard(modelName)), {
+    mode: 'cors',
+    method: 'POST',
+  });
+}
+
+export async function uploadModel(modelZip: File): Promise<Response> {
+  // Send the zip as the body, so the server can extract it as it arrives.
+  const filename = encodeURIComponent(modelZip.name);
+  return fetch(serverRoute(`${route.upload}?filename=${filename}`), {
     method: 'POST',
     mode: 'cors',
-    body: formData,
+    headers: {'Content-Type': 'application/zip'},
+    body: modelZip,
   });
 }
 
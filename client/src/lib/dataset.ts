@@ -1,3 +1,5 @@
+import Dataset, {DatasetState} from 'types/Dataset';
+
 export const AUDIO_FORMATS = ['.wav'];
 export const TRANSCRIPTION_FORMATS = ['.eaf', '.txt'];
 
@@ -44,3 +46,26 @@ export const hasMatch = (fileName: string, fileNames: string[]): boolean => {
 
   return fileNames.some(name => potentialNames.includes(name));
 };
+
+// Datasets from before ingestion was tracked are ready.
+export const datasetState = (dataset: Dataset): DatasetState =>
+  dataset.ingestion?.state ?? DatasetState.Ready;
+
+export const isDatasetReady = (dataset: Dataset): boolean =>
+  datasetState(dataset) === DatasetState.Ready;
+
+export const isIngesting = (dataset: Dataset): boolean =>
+  [DatasetState.Queued, DatasetState.Processing].includes(
+    datasetState(dataset)
+  );
+
+export const describeIngestion = (dataset: Dataset): string => {
+  const state = datasetState(dataset);
+  const ingestion = dataset.ingestion;
+  if (state !== DatasetState.Processing || ingestion === undefined) {
+    return state;
+  }
+  return `${state} (${ingestion.processed + ingestion.failed}/${
+    ingestion.total
+  })`;
+};
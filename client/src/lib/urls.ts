@@ -29,16 +29,31 @@ export const urls = {
   api: {
     datasets: {
       index: '/api/datasets/', // Trailing slashes necessary for flask
+      import: '/api/datasets/import',
       dataset: (datasetName: string) => `/api/datasets/${datasetName}`,
       download: (datasetName: string) =>
         `/api/datasets/download/${datasetName}`,
+      progress: (datasetName: string) =>
+        `/api/datasets/progress/${datasetName}`,
+      update: (datasetName: string) => `/api/datasets/update/${datasetName}`,
+      verify: (datasetName: string) => `/api/datasets/verify/${datasetName}`,
     },
     models: {
       index: '/api/models/',
       model: (modelName: string) => `/api/models/${modelName}`,
       train: (modelName: string) => `/api/models/train/${modelName}`,
+      cancel: (modelName: string) => `/api/models/cancel/${modelName}`,
       logs: (modelName: string) => `/api/models/logs/${modelName}`,
+      tailLogs: (modelName: string, since: number) =>
+        `/api/models/logs/${modelName}?since=${since}`,
+      streamLogs: (modelName: string) =>
+        `/api/models/logs/stream/${modelName}`,
       status: (modelName: string) => `/api/models/status/${modelName}`,
+      metrics: (modelName: string) => `/api/models/metrics/${modelName}`,
+      tensorboard: (modelName: string) =>
+        `/api/models/tensorboard?model=${modelName}`,
+      sweep: '/api/models/sweep',
+      sweepComparison: (sweepName: string) => `/api/models/sweep/${sweepName}`,
       upload: '/api/models/upload',
       download: (modelName: string) => `/api/models/download/${modelName}`,
     },
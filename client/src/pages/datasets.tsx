@@ -2,7 +2,7 @@ import type {NextPage} from 'next';
 import DatasetTable from 'components/train/DatasetTable';
 import {useAtom} from 'jotai';
 import {datasetsAtom} from 'store';
-import {useEffect} from 'react';
+import {useCallback, useEffect} from 'react';
 import {getDatasets} from 'lib/api/datasets';
 import Link from 'next/link';
 import urls from 'lib/urls';
@@ -10,22 +10,34 @@ import ClientOnly from 'components/ClientOnly';
 import {Button} from 'components/ui/button';
 import {Plus} from 'lucide-react';
 import {ArrowRight} from 'react-feather';
+import {isIngesting} from 'lib/dataset';
+
+const POLL_INTERVAL_MS = 2000;
 
 const DatasetsPage: NextPage = () => {
   const [datasets, setDatasets] = useAtom(datasetsAtom);
 
+  const fetchDatasets = useCallback(async () => {
+    const response = await getDatasets();
+    if (response.ok) {
+      const datasets = await response.json();
+      setDatasets(datasets);
+    } else {
+      console.error("Couldn't download datasets!");
+    }
+  }, [setDatasets]);
+
   useEffect(() => {
-    const fetchDatasets = async () => {
-      const response = await getDatasets();
-      if (response.ok) {
-        const datasets = await response.json();
-        setDatasets(datasets);
-      } else {
-        console.error("Couldn't download datasets!");
-      }
-    };
     fetchDatasets();
-  }, [setDatasets]);
+  }, [fetchDatasets]);
+
+  // Refresh the progress of datasets being processed in the background.
+  const ingesting = datasets.some(isIngesting);
+  useEffect(() => {
+    if (!ingesting) return;
+    const interval = setInterval(fetchDatasets, POLL_INTERVAL_MS);
+    return () => clearInterval(interval);
+  }, [ingesting, fetchDatasets]);
 
   return (
     <div className="container">
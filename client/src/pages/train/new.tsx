@@ -40,6 +40,7 @@ import {
 import {getDefaults} from 'types/KeyInfo';
 import ListInput from 'components/ListInput';
 import {capitalise} from 'lib/utils';
+import {isDatasetReady} from 'lib/dataset';
 
 const NewModelPage = () => {
   const datasets = useAtomValue(datasetsAtom);
@@ -525,7 +526,7 @@ const NewModelPage = () => {
                         </SelectTrigger>
                       </FormControl>
                       <SelectContent>
-                        {datasets.map(dataset => (
+                        {datasets.filter(isDatasetReady).map(dataset => (
                           <SelectItem key={dataset.name} value={dataset.name}>
                             {dataset.name}
                           </SelectItem>
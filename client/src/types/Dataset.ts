@@ -5,11 +5,42 @@ export enum DatasetStage {
   Name,
 }
 
+export enum DatasetState {
+  Queued = 'queued',
+  Processing = 'processing',
+  Ready = 'ready',
+  Error = 'error',
+}
+
+// The number and size of a dataset's files, from its manifest.
+export type ManifestSummary = {
+  complete: boolean;
+  batches: number;
+  files: number;
+  sizeBytes: number;
+  rawFiles: number;
+  rawSizeBytes: number;
+  fingerprint: string;
+};
+
+export type Ingestion = {
+  state: DatasetState;
+  total: number;
+  processed: number;
+  failed: number;
+  error?: string;
+  summary?: ManifestSummary | null;
+  // Only included in progress responses.
+  fraction?: number | null;
+  etaSeconds?: number | null;
+};
+
 export type Dataset = {
   name: string;
   files: string[];
   cleaningOptions: CleaningOptions;
   elanOptions?: ElanOptions;
+  ingestion?: Ingestion;
 };
 
 export type CleaningOptions = {
@@ -0,0 +1,8 @@
+export type MetricSeries = {
+  steps: number[];
+  values: number[];
+};
+
+export type TrainingMetrics = {
+  series: Record<string, MetricSeries>;
+};
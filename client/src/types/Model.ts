@@ -1,8 +1,10 @@
 export enum TrainingStatus {
   Waiting = 'waiting',
+  Queued = 'queued',
   Training = 'training',
   Finished = 'finished',
   Error = 'error',
+  Cancelled = 'cancelled',
 }
 
 export type ModelArguments = {
@@ -0,0 +1,18 @@
+import {TrainingStatus} from 'types/Model';
+
+// Maps job arguments to the values to try for each.
+export type SweepGrid = Record<string, unknown[]>;
+
+export type SweepRow = {
+  name: string;
+  status: TrainingStatus;
+  parameters: Record<string, unknown>;
+  metrics: Record<string, number> | null;
+};
+
+export type SweepComparison = {
+  models: SweepRow[];
+  columns: string[];
+  best: string | null;
+  done: boolean;
+};
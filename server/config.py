@@ -1,14 +1,55 @@
 """Flask configuration."""
 import os
 from pathlib import Path
+from typing import List, Optional
 
+from server.archives import DEFAULT_ARCHIVE_CACHE_BYTES
+from server.inference import DEFAULT_STREAM_OVERLAP_S, DEFAULT_STREAM_WINDOW_S
+from server.inference_server import DEFAULT_REQUEST_TIMEOUT_S
 from server.interface import Interface
-from server.tensorboard import DEFAULT_TENSORBOARD_PORT
+from server.managers.model_manager import (
+    DEFAULT_TRAINING_CONCURRENCY,
+    TrainingSettings,
+)
+from server.managers.transcription_manager import (
+    DEFAULT_TRANSCRIPTION_BATCH_SIZE,
+    DEFAULT_TRANSCRIPTION_WORKERS,
+    TranscriptionSettings,
+)
+from server.pipeline_cache import DEFAULT_PIPELINE_CACHE_BYTES
+from server.preprocessing import DEFAULT_PREPROCESSING_WORKERS
+from server.result_cache import DEFAULT_RESULT_CACHE_BYTES
+from server.tensorboard import (
+    DEFAULT_TENSORBOARD_IDLE_SECONDS,
+    DEFAULT_TENSORBOARD_PORT,
+)
+from server.uploads import DEFAULT_UPLOAD_MAX_BYTES, DEFAULT_UPLOAD_MAX_FILES
+from server.vad import DEFAULT_VAD_THRESHOLD_DB
 
 BASE_FOLDER = Path(__file__).parent
 DEFAULT_DATA_DIR = BASE_FOLDER / "data"
 
 
+def env_list(key: str) -> List[str]:
+    """Reads a comma separated list from an environment variable."""
+    values = os.environ.get(key, "").split(",")
+    return [value.strip() for value in values if value.strip()]
+
+
+def env_int(key: str) -> Optional[int]:
+    """Reads an optional integer from an environment variable."""
+    value = os.environ.get(key)
+    return int(value) if value else None
+
+
+def env_flag(key: str, default: bool = False) -> bool:
+    """Reads a boolean flag, such as "1" or "true", from an environment variable."""
+    value = os.environ.get(key)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
 class Config:
     """Base config."""
 
@@ -16,8 +57,84 @@ class Config:
     STATIC_FOLDER = "static"
     TEMPLATES_FOLDER = "templates"
     DATA_DIR = Path(os.environ.get("DATA_DIR", DEFAULT_DATA_DIR))
-    INTERFACE = Interface(DATA_DIR)
+    TRANSCRIPTION_SETTINGS = TranscriptionSettings(
+        workers=int(
+            os.environ.get("TRANSCRIPTION_WORKERS", DEFAULT_TRANSCRIPTION_WORKERS)
+        ),
+        batch_size=int(
+            os.environ.get("TRANSCRIPTION_BATCH_SIZE", DEFAULT_TRANSCRIPTION_BATCH_SIZE)
+        ),
+        # Set to 0 for an unbounded pipeline cache.
+        pipeline_cache_bytes=int(
+            os.environ.get("PIPELINE_CACHE_BYTES", DEFAULT_PIPELINE_CACHE_BYTES)
+        ),
+        pinned_models=env_list("PINNED_MODELS"),
+        streaming=env_flag("TRANSCRIPTION_STREAMING"),
+        stream_window_s=float(
+            os.environ.get("STREAM_WINDOW_SECONDS", DEFAULT_STREAM_WINDOW_S)
+        ),
+        stream_overlap_s=float(
+            os.environ.get("STREAM_OVERLAP_SECONDS", DEFAULT_STREAM_OVERLAP_S)
+        ),
+        result_cache=env_flag("RESULT_CACHE", default=True),
+        # Set to 0 for an unbounded result cache.
+        result_cache_bytes=int(
+            os.environ.get("RESULT_CACHE_BYTES", DEFAULT_RESULT_CACHE_BYTES)
+        ),
+        # Set above 0 to run inference in worker processes, off the GIL.
+        inference_processes=int(os.environ.get("INFERENCE_PROCESSES", 0)),
+        # The socket of a shared inference server, see server/inference_server.py
+        inference_socket=os.environ.get("INFERENCE_SOCKET"),
+        # Set to 0 to wait for as long as the inference server takes.
+        inference_timeout_s=float(
+            os.environ.get("INFERENCE_TIMEOUT_SECONDS", DEFAULT_REQUEST_TIMEOUT_S)
+        ),
+        use_quantized_models=env_flag("USE_QUANTIZED_MODELS", default=True),
+        vad=env_flag("VAD"),
+        vad_threshold_db=float(
+            os.environ.get("VAD_THRESHOLD_DB", DEFAULT_VAD_THRESHOLD_DB)
+        ),
+    )
+    # Local model names or hub ids to load and warm up at startup.
+    PRELOAD_MODELS = env_list("PRELOAD_MODELS")
+    TRAINING_SETTINGS = TrainingSettings(
+        # The maximum number of models to train at once. Set to 0 to train as
+        # many as the cores allow, dividing them between training processes.
+        concurrency=int(
+            os.environ.get("TRAINING_CONCURRENCY", DEFAULT_TRAINING_CONCURRENCY)
+        ),
+        # Unset to let torch use every core, or its share of them when
+        # training several models at once, in each training process.
+        threads=env_int("TRAINING_THREADS"),
+        memory_bytes=env_int("TRAINING_MEMORY_BYTES"),
+    )
+    INTERFACE = Interface(
+        DATA_DIR,
+        training_settings=TRAINING_SETTINGS,
+        transcription_settings=TRANSCRIPTION_SETTINGS,
+        # Set to 0 for an unbounded cache of download archives.
+        archive_cache_bytes=int(
+            os.environ.get("ARCHIVE_CACHE_BYTES", DEFAULT_ARCHIVE_CACHE_BYTES)
+        ),
+        # Processes to preprocess datasets with. Set to 0 for one per core.
+        preprocessing_workers=int(
+            os.environ.get("PREPROCESSING_WORKERS", DEFAULT_PREPROCESSING_WORKERS)
+        ),
+        # Hardlink or reflink files into datasets where possible. Set false to
+        # always copy them, e.g. if the originals may be edited in place.
+        link_dataset_files=env_flag("LINK_DATASET_FILES", default=True),
+    )
     TENSORBOARD_PORT = os.environ.get("TENSORBOARD_PORT", DEFAULT_TENSORBOARD_PORT)
+    # Tensorboard is started on request, and stopped after being idle this long.
+    TENSORBOARD_IDLE_SECONDS = float(
+        os.environ.get("TENSORBOARD_IDLE_SECONDS", DEFAULT_TENSORBOARD_IDLE_SECONDS)
+    )
+    # Limits on the extracted contents of uploaded model zip files.
+    UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", DEFAULT_UPLOAD_MAX_BYTES))
+    UPLOAD_MAX_FILES = int(os.environ.get("UPLOAD_MAX_FILES", DEFAULT_UPLOAD_MAX_FILES))
+    # Server folders which datasets may be imported from, without uploading.
+    # Importing is disabled unless some are set.
+    IMPORT_ROOTS = [Path(root) for root in env_list("IMPORT_ROOTS")]
 
 
 class ProdConfig(Config):
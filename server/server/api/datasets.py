@@ -2,26 +2,24 @@ import json
 import shutil
 from http import HTTPStatus
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 from elpis.datasets import Dataset
 from elpis.datasets.dataset import CleaningOptions, ElanOptions
 from elpis.datasets.preprocessing import has_finished_processing
 from flask import Blueprint, Response
 from flask import current_app as app
-from flask import jsonify, request, send_file
+from flask import jsonify, request
 from humps.main import camelize, decamelize
 from loguru import logger
 from werkzeug.utils import secure_filename
 
 from server.api.utils import bad_request
 from server.interface import Interface
-from server.managers.dataset_manager import FolderType
+from server.managers.dataset_manager import DatasetState, FolderType
 
 dataset_bp = Blueprint("dataset_bp", __name__, url_prefix="/datasets")
 
-TEMP_DIR = Path("/tmp")
-
 
 @dataset_bp.route("/", methods=["GET"])
 def get_datasets():
@@ -75,32 +73,223 @@ def create_dataset():
     except:
         return bad_request("Error deserializing options")
 
-    # Copy all files to dataset folder
+    # Reserve the name first, so an existing dataset's files aren't replaced.
     interface = Interface.from_app(app)
     manager = interface.dataset_manager
+    if not manager.reserve_upload(dataset_name):
+        return Response(
+            f"Dataset {dataset_name} already exists.", status=HTTPStatus.CONFLICT
+        )
+
+    try:
+        # Copy all files to dataset folder
+        raw_folder = manager.dataset_folder(dataset_name, FolderType.Raw)
+        raw_folder.mkdir(parents=True, exist_ok=True)
+
+        raw_files: List[Path] = []
+        for data_file, name in zip(files, names):
+            path = raw_folder / name
+            data_file.save(path)
+            raw_files.append(path)
+
+        # Build and add our dataset
+        dataset = Dataset(
+            name=dataset_name,
+            files=raw_files,
+            cleaning_options=cleaning_options,
+            elan_options=elan_options,
+        )
+
+        if not dataset.is_valid():
+            return bad_request("Dataset Invalid")
+
+        # Preprocess in the background, as large datasets can take a long time.
+        manager.ingest(dataset=dataset)
+    finally:
+        manager.release_upload(dataset_name)
+    progress = manager.ingestion(dataset_name).progress()
+    return jsonify(camelize(progress)), HTTPStatus.ACCEPTED
 
-    raw_folder = manager.dataset_folder(dataset_name, FolderType.Raw)
-    raw_folder.mkdir(parents=True, exist_ok=True)
 
-    raw_files: List[Path] = []
-    for data_file, name in zip(files, names):
-        path = raw_folder / name
-        data_file.save(path)
-        raw_files.append(path)
+@dataset_bp.route("/import", methods=["POST"])
+def import_dataset():
+    """Creates a dataset from a folder on the server, without uploading it.
+
+    Expects a dataset name, the path of a folder within one of the configured
+    import roots, and options as for creating a dataset. The folder's audio
+    and transcription files are linked into the dataset where possible, then
+    preprocessed in the background.
+    """
+    data = request.get_json(silent=True)
+    if data is None:
+        return bad_request("Request not json.")
+
+    data = decamelize(data)
+    if not isinstance(data, dict):
+        return bad_request("Request data should be a dictionary.")
+
+    roots: List[Path] = app.config.get("IMPORT_ROOTS", [])
+    if len(roots) == 0:
+        return Response("Importing is disabled.", status=HTTPStatus.FORBIDDEN)
+
+    dataset_name = secure_filename(str(data.get("name", "")))
+    if dataset_name == "":
+        return bad_request("Missing dataset name.")
+    if "path" not in data:
+        return bad_request("Missing folder to import.")
+
+    files = _import_files(Path(str(data["path"])), roots)
+    if files is None:
+        return Response(
+            "Can only import from folders within the import roots.",
+            status=HTTPStatus.FORBIDDEN,
+        )
+
+    try:
+        cleaning_options = CleaningOptions.from_dict(
+            data.get("cleaning_options", CleaningOptions().to_dict())
+        )
+        elan_options = data.get("elan_options")
+        if elan_options is not None:
+            elan_options = ElanOptions.from_dict(elan_options)
+    except:
+        return bad_request("Error deserializing options")
 
-    # Build and add our dataset
     dataset = Dataset(
         name=dataset_name,
-        files=raw_files,
+        files=files,
         cleaning_options=cleaning_options,
         elan_options=elan_options,
     )
-
     if not dataset.is_valid():
         return bad_request("Dataset Invalid")
 
-    manager.add_dataset(dataset=dataset)
-    return Response(status=HTTPStatus.NO_CONTENT)
+    interface = Interface.from_app(app)
+    manager = interface.dataset_manager
+    if not manager.reserve_upload(dataset_name):
+        return Response(
+            f"Dataset {dataset_name} already exists.", status=HTTPStatus.CONFLICT
+        )
+    try:
+        manager.ingest(dataset=dataset)
+    finally:
+        manager.release_upload(dataset_name)
+    progress = manager.ingestion(dataset_name).progress()
+    return jsonify(camelize(progress)), HTTPStatus.ACCEPTED
+
+
+def _import_files(folder: Path, roots: List[Path]) -> Optional[List[Path]]:
+    """Returns the audio and transcription files directly within a folder,
+    or None if it isn't a folder within one of the roots.
+
+    Paths are resolved first, so symlinks can't lead outside the roots, and
+    the resolved paths are returned, so a symlink swapped after checking
+    isn't followed.
+    """
+    folder = folder.resolve()
+    resolved_roots = [root.resolve() for root in roots]
+    if not folder.is_dir() or not any(
+        folder.is_relative_to(root) for root in resolved_roots
+    ):
+        return None
+
+    files = []
+    for path in sorted(folder.iterdir()):
+        target = path.resolve()
+        if not (Dataset.is_audio(target) or Dataset.is_transcript(target)):
+            continue
+        if target.is_file() and any(
+            target.is_relative_to(root) for root in resolved_roots
+        ):
+            files.append(target)
+    return files
+
+
+@dataset_bp.route("/update/<dataset_name>", methods=["POST"])
+def update_dataset(dataset_name: str):
+    """Adds or replaces the uploaded files in a dataset, and removes those
+    named in the JSON list "remove", then reprocesses only what changed."""
+    interface = Interface.from_app(app)
+    manager = interface.dataset_manager
+    if dataset_name not in manager:
+        return Response("Dataset not found", status=HTTPStatus.NOT_FOUND)
+    if manager.ingestion(dataset_name).state in (
+        DatasetState.QUEUED,
+        DatasetState.PROCESSING,
+    ):
+        return Response(
+            f"Dataset {dataset_name} is still being processed.",
+            status=HTTPStatus.CONFLICT,
+        )
+
+    files = request.files.getlist("file")
+    names = [secure_filename(str(file.filename)) for file in files]
+    if "" in names:
+        return bad_request("Invalid file name.")
+    try:
+        removed = json.loads(request.form.get("remove", "[]"))
+        removed = [secure_filename(str(name)) for name in removed]
+    except (ValueError, TypeError):
+        return bad_request("Error deserializing files to remove")
+    if len(files) == 0 and len(removed) == 0:
+        return bad_request("Nothing to update.")
+
+    upload_folder = manager.folder / dataset_name / "upload"
+    upload_folder.mkdir(parents=True, exist_ok=True)
+    try:
+        uploaded: List[Path] = []
+        for data_file, name in zip(files, names):
+            path = upload_folder / name
+            data_file.save(path)
+            uploaded.append(path)
+        manager.update_dataset(dataset_name, uploaded, removed)
+    except ValueError as e:
+        return bad_request(str(e))
+    finally:
+        shutil.rmtree(upload_folder, ignore_errors=True)
+
+    progress = manager.ingestion(dataset_name).progress()
+    return jsonify(camelize(progress)), HTTPStatus.ACCEPTED
+
+
+@dataset_bp.route("/progress/<dataset_name>", methods=["GET"])
+def get_ingestion_progress(dataset_name: str):
+    """Returns the state of preprocessing a dataset, the files processed out
+    of the total, and an estimate of the seconds left."""
+    interface = Interface.from_app(app)
+    manager = interface.dataset_manager
+    if dataset_name not in manager:
+        return Response("Dataset not found", status=HTTPStatus.NOT_FOUND)
+
+    return jsonify(camelize(manager.ingestion(dataset_name).progress()))
+
+
+@dataset_bp.route("/preprocessing/<dataset_name>", methods=["GET"])
+def get_preprocessing_report(dataset_name: str):
+    """Returns the timings and failures of each batch from when the dataset
+    was last preprocessed."""
+    interface = Interface.from_app(app)
+    report = interface.dataset_manager.preprocessing_report(dataset_name)
+    if report is None:
+        return Response("Preprocessing report not found", status=HTTPStatus.NOT_FOUND)
+
+    return jsonify(camelize(report))
+
+
+@dataset_bp.route("/verify/<dataset_name>", methods=["GET", "POST"])
+def verify_dataset(dataset_name: str):
+    """Compares a dataset's manifest with its files. Posting repairs any
+    drift, by reprocessing the files which changed."""
+    interface = Interface.from_app(app)
+    manager = interface.dataset_manager
+    if dataset_name not in manager:
+        return Response("Dataset not found", status=HTTPStatus.NOT_FOUND)
+
+    try:
+        result = manager.verify_dataset(dataset_name, repair=request.method == "POST")
+    except ValueError as e:
+        return Response(str(e), status=HTTPStatus.CONFLICT)
+    return jsonify(camelize(result))
 
 
 @dataset_bp.route("/<dataset_name>", methods=["DELETE"])
@@ -126,15 +315,9 @@ def download_dataset(dataset_name: str):
     if not manager.is_dataset_processed(dataset_name):
         return bad_request(f"Dataset {dataset_name} either doesn't exist or hasn't finished processing!")
 
-    zipped_dataset_path = TEMP_DIR / "dataset.zip"
-    zipped_dataset_path.parent.mkdir(exist_ok=True, parents=True)
-    logger.info(f"Creating zipped dataset at path: {zipped_dataset_path}")
-
-    shutil.make_archive(
-        str(zipped_dataset_path.parent / zipped_dataset_path.stem),
-        "zip",
+    summary = manager.summary(dataset_name)
+    return interface.archives.response(
         manager.dataset_folder(dataset_name, FolderType.Processed),
+        f"{dataset_name}.zip",
+        fingerprint=summary.fingerprint if summary is not None else None,
     )
-    logger.info(f"Zipped dataset created at path: {zipped_dataset_path}")
-
-    return send_file(zipped_dataset_path, as_attachment=True)
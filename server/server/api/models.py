@@ -1,10 +1,10 @@
 import json
-import os
 import shutil
+import time
 from functools import wraps
 from http import HTTPStatus
 from pathlib import Path
-from typing import Any, Callable, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 from elpis.models import DataArguments, Job, ModelArguments
 from flask import Blueprint, Response
@@ -15,14 +15,28 @@ from loguru import logger
 from transformers import TrainingArguments
 from werkzeug.utils import secure_filename
 
-from server.api.utils import bad_request
+from server.api.utils import bad_request, server_sent_event
+from server.files import read_new_lines
 from server.interface import Interface
 from server.managers.dataset_manager import FolderType
+from server.metrics import DEFAULT_METRICS_POINTS
 from server.named_job import JobStatus, NamedJob
+from server.quantization import DEFAULT_EVAL_SAMPLES
+from server.sweeps import comparison, expand_grid, sweep_model_name, validate_grid
+from server.tensorboard import TensorBoardService
+from server.uploads import (
+    DEFAULT_UPLOAD_MAX_BYTES,
+    DEFAULT_UPLOAD_MAX_FILES,
+    UploadError,
+    extract_stream,
+    staging_folder,
+)
 
 model_bp = Blueprint("model_bp", __name__, url_prefix="/models")
 
-TEMP_DIR = Path("/tmp")
+# The most log bytes returned by a single tailing request or event.
+LOG_CHUNK_BYTES = 1024 * 1024
+LOG_POLL_SECONDS = 1.0
 
 
 def requires_model(route: Callable[[str], Response]) -> Callable[[str], Response]:
@@ -98,6 +112,8 @@ def validate_raw_model(interface: Interface, data: Dict[str, Any]) -> Optional[s
 
         if dataset_name not in interface.dataset_manager:
             return f"Couldn't find dataset: {dataset_name}."
+        if not interface.dataset_manager.is_ready(dataset_name):
+            return f"Dataset {dataset_name} hasn't finished processing."
 
 
 def correct_raw_model(interface: Interface, data: Dict[str, Any]) -> Dict[str, Any]:
@@ -127,6 +143,93 @@ def correct_raw_model(interface: Interface, data: Dict[str, Any]) -> Dict[str, A
     return data
 
 
+@model_bp.route("/sweep", methods=["POST"])
+def create_sweep():
+    """Creates and queues a model for every combination of the values in a
+    parameter grid, each trained from the same base job.
+
+    Expects a name for the sweep, the base job and whether its dataset is
+    local as for creating a model, and a grid mapping job parameters to the
+    values to try.
+    """
+    data = request.get_json(silent=True)
+    if data is None:
+        return bad_request("Request not json.")
+
+    data = decamelize(data)
+    if not isinstance(data, dict):
+        return bad_request("Request data should be a dictionary.")
+
+    interface = Interface.from_app(app)
+    manager = interface.model_manager
+
+    error = validate_raw_model(interface, data)
+    if error is None:
+        error = validate_grid(data.get("grid"))
+    if error is not None:
+        return bad_request(error)
+
+    if not isinstance(data["job"], dict):
+        return bad_request("The base job should be a dictionary.")
+
+    sweep_name = secure_filename(str(data["name"]))
+    if sweep_name == "":
+        return bad_request("Invalid sweep name.")
+
+    grid = expand_grid(data["grid"])
+    names = [sweep_model_name(sweep_name, index) for index in range(len(grid))]
+    if len(manager.sweep(sweep_name)) > 0 or any(name in manager for name in names):
+        return Response(
+            f"Sweep {sweep_name} or one of its models already exists.",
+            status=HTTPStatus.CONFLICT,
+        )
+
+    jobs: List[NamedJob] = []
+    for model_name, parameters in zip(names, grid):
+
+        raw_model = correct_raw_model(
+            interface,
+            {
+                "name": model_name,
+                "job": data["job"] | parameters,
+                "is_dataset_local": data.get("is_dataset_local"),
+                "sweep": sweep_name,
+                "sweep_parameters": parameters,
+            },
+        )
+        try:
+            jobs.append(NamedJob.from_dict(raw_model))
+        except Exception as e:
+            logger.error(e)
+            return bad_request(f"Failed to deserialize model with {parameters}")
+
+    priority = request.args.get("priority", 0, type=int)
+    for job in jobs:
+        manager.add_job(job)
+        manager.train(job.name, priority)
+
+    logger.info(f"Queued sweep {sweep_name} of {len(jobs)} models")
+    data = {
+        "sweep": sweep_name,
+        "models": [job.name for job in jobs],
+        "queue": manager.queue_info(),
+    }
+    return jsonify(camelize(data)), HTTPStatus.ACCEPTED
+
+
+@model_bp.route("/sweep/<sweep_name>", methods=["GET"])
+def get_sweep(sweep_name: str):
+    """Compares the parameters and evaluation results of a sweep's models."""
+    manager = Interface.from_app(app).model_manager
+    models = manager.sweep(sweep_name)
+    if len(models) == 0:
+        return Response("Missing sweep.", status=HTTPStatus.NOT_FOUND)
+
+    table = comparison(models, manager.model_folder)
+    table["columns"] = [camelize(column) for column in table["columns"]]
+    return jsonify(camelize(table))
+
+
 @model_bp.route("/<model_name>", methods=["DELETE"])
 @requires_model
 def delete_model(model_name: str):
@@ -135,14 +238,45 @@ def delete_model(model_name: str):
     return Response(status=HTTPStatus.NO_CONTENT)
 
 
-@model_bp.route("/train/<model_name>", methods=["GET"])
+@model_bp.route("/train/<model_name>", methods=["GET", "POST"])
 @requires_model
 def train_model(model_name: str):
+    """Queues a model for training, responding immediately. Use the status
+    route to follow its progress."""
+    priority = request.args.get("priority", 0, type=int)
+
+    interface = Interface.from_app(app)
+    manager = interface.model_manager
+    status = manager.train(model_name, priority)
+    if status is None:
+        return Response("Missing model.", status=HTTPStatus.NOT_FOUND)
+
+    data = {
+        "status": status.value,
+        "queue_position": manager.queue_position(model_name),
+    }
+    return jsonify(camelize(data)), HTTPStatus.ACCEPTED
+
+
+@model_bp.route("/cancel/<model_name>", methods=["POST"])
+@requires_model
+def cancel_training(model_name: str):
     interface = Interface.from_app(app)
-    interface.model_manager.train(model_name)
+    if not interface.model_manager.cancel(model_name):
+        return Response(
+            "Only queued or training models can be cancelled.",
+            status=HTTPStatus.CONFLICT,
+        )
+
     return Response(status=HTTPStatus.NO_CONTENT)
 
 
+@model_bp.route("/queue", methods=["GET"])
+def get_training_queue():
+    interface = Interface.from_app(app)
+    return jsonify(camelize(interface.model_manager.queue_info()))
+
+
 @model_bp.route("/logs/<model_name>", methods=["GET"])
 @requires_model
 def get_model_logs(model_name: str):
@@ -153,21 +287,152 @@ def get_model_logs(model_name: str):
         return Response("Missing model.", status=HTTPStatus.NOT_FOUND)
 
     log_file = interface.model_manager.logs_path(model_name)
-    if not log_file.exists():
-        return Response("No logs found for training job.", status=HTTPStatus.NOT_FOUND)
+    if "since" not in request.args:
+        if not log_file.exists():
+            return Response(
+                "No logs found for training job.", status=HTTPStatus.NOT_FOUND
+            )
+        return send_file(log_file, as_attachment=True)
+
+    # Tail the logs from the given byte offset.
+    try:
+        offset = max(0, int(request.args["since"]))
+    except ValueError:
+        return bad_request("Invalid log offset")
+
+    size = log_file.stat().st_size if log_file.exists() else 0
+    lines, next_offset = read_new_lines(log_file, offset, max_bytes=LOG_CHUNK_BYTES)
+    # More is true when the read was cut short, rather than up to date. The read
+    # starts again from the beginning if the file was truncated.
+    start = offset if offset <= size else 0
+    data = {
+        "lines": lines,
+        "offset": next_offset,
+        "more": size - start > LOG_CHUNK_BYTES and next_offset < size,
+    }
+    return jsonify(data)
 
-    return send_file(log_file, as_attachment=True)
+
+@model_bp.route("/logs/stream/<model_name>", methods=["GET"])
+@requires_model
+def stream_model_logs(model_name: str):
+    """Streams new lines of a model's training logs as server-sent events
+    while it's queued or training, followed by a "done" event with its final
+    status.
+
+    Event ids are byte offsets into the logs, so clients can resume with the
+    Last-Event-ID header, or start from an offset with ?since=.
+    """
+    interface = Interface.from_app(app)
+    manager = interface.model_manager
+
+    if manager.status(model_name) is None:
+        return Response("Missing model.", status=HTTPStatus.NOT_FOUND)
+
+    log_file = manager.logs_path(model_name)
+    try:
+        offset = int(request.headers.get("Last-Event-ID", request.args.get("since", 0)))
+    except ValueError:
+        return bad_request("Invalid log offset")
+
+    def events():
+        nonlocal offset
+        while True:
+            # Check before reading, so the last lines aren't missed.
+            status = manager.status(model_name)
+            done = status not in (JobStatus.QUEUED, JobStatus.TRAINING)
+            lines, offset = read_new_lines(log_file, offset, max_bytes=LOG_CHUNK_BYTES)
+            if lines:
+                yield server_sent_event(lines, event_id=offset)
+                continue
+
+            if done:
+                yield server_sent_event(status.value if status else None, event="done")
+                return
+            time.sleep(LOG_POLL_SECONDS)
+
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
 
 
 @model_bp.route("/status/<model_name>", methods=["GET"])
 @requires_model
 def get_model_status(model_name: str):
     interface = Interface.from_app(app)
-    status = interface.model_manager.status(model_name)
+    manager = interface.model_manager
+    status = manager.status(model_name)
     if status is None:
         return Response("Missing model.", status=HTTPStatus.NOT_FOUND)
 
-    return jsonify(status.value)
+    job = manager.models[model_name]
+    data = {
+        "status": status.value,
+        "queue_position": manager.queue_position(model_name),
+        "priority": job.priority,
+        "queued_at": job.queued_at,
+        "progress": manager.progress(model_name),
+        "exit_code": job.exit_code,
+        "queue": manager.queue_info(),
+    }
+    return jsonify(camelize(data))
+
+
+@model_bp.route("/metrics/<model_name>", methods=["GET"])
+@requires_model
+def get_model_metrics(model_name: str):
+    """Returns the metrics logged while training a model, such as its loss,
+    as downsampled series of steps and values for each tag."""
+    interface = Interface.from_app(app)
+    manager = interface.model_manager
+
+    if manager.status(model_name) is None:
+        return Response("Missing model.", status=HTTPStatus.NOT_FOUND)
+
+    try:
+        max_points = int(request.args.get("points", DEFAULT_METRICS_POINTS))
+    except ValueError:
+        return bad_request("Invalid number of points")
+    if max_points < 1:
+        return bad_request("Invalid number of points")
+
+    # Tags aren't camelized, so they match those in TensorBoard.
+    return jsonify(manager.metrics(model_name, max_points))
+
+
+@model_bp.route("/tensorboard", methods=["GET", "POST", "DELETE"])
+def tensorboard():
+    """Reports on, starts or stops TensorBoard.
+
+    Posting starts TensorBoard over the models folder, or over a single
+    model's folder with ?model=, and keeps it from stopping for being idle.
+    """
+    service = TensorBoardService.from_app(app)
+
+    if request.method == "DELETE":
+        service.stop()
+        return Response(status=HTTPStatus.NO_CONTENT)
+
+    if request.method == "POST":
+        interface = Interface.from_app(app)
+        manager = interface.model_manager
+        logdir = manager.folder
+        model_name = request.args.get("model")
+        if model_name is not None:
+            if manager.status(model_name) is None:
+                return Response("Missing model.", status=HTTPStatus.NOT_FOUND)
+            logdir = manager.model_folder(model_name)
+
+        logdir.mkdir(parents=True, exist_ok=True)
+        try:
+            service.start(logdir)
+        except RuntimeError as e:
+            logger.error(f"Error starting tensorboard: {e}")
+            return Response(str(e), status=HTTPStatus.SERVICE_UNAVAILABLE)
+
+    return jsonify(camelize(service.info()))
 
 
 @model_bp.route("/save/<model_name>", methods=["GET"])
@@ -211,32 +476,51 @@ def upload_model():
     interface = Interface.from_app(app)
     manager = interface.model_manager
 
-    # Save files to model directory
-    zip_file = request.files.getlist("file")[0]
-    filename = secure_filename(str(zip_file.filename))
+    # Zip files can be sent as the request body, which is extracted as it
+    # arrives, or as a multipart form.
+    if request.mimetype == "multipart/form-data":
+        zip_file = request.files.getlist("file")[0]
+        filename = secure_filename(str(zip_file.filename))
+        stream = zip_file.stream
+    else:
+        filename = secure_filename(request.args.get("filename", ""))
+        stream = request.stream
 
     if filename == "" or Path(filename).suffix != ".zip":
         return bad_request("Invalid filename or not a zip-file")
 
-    zip_path = TEMP_DIR / filename
-    zip_path.parent.mkdir(parents=True, exist_ok=True)
-    logger.info(f"Saving the zipped model at {zip_path}")
-    zip_file.save(zip_path)
-
     model_name = Path(filename).stem
-    model_folder = manager.model_folder(model_name)
-    model_folder.mkdir(parents=True, exist_ok=True)
-    shutil.unpack_archive(zip_path, manager.model_folder(model_name))
+    if manager.status(model_name) in (JobStatus.QUEUED, JobStatus.TRAINING):
+        return Response(
+            f"Model {model_name} is training, so can't be replaced.",
+            status=HTTPStatus.CONFLICT,
+        )
 
-    os.remove(zip_path)
-    logger.info(f"Zipped model was unpacked and deleted")
+    if not manager.reserve_upload(model_name):
+        return Response(
+            f"Model {model_name} is already being uploaded.",
+            status=HTTPStatus.CONFLICT,
+        )
 
-    # Attempts to unpack a zip file if when unzipped, it resolves to a single directory.
-    folder_path = model_folder / model_name
-    if folder_path.exists and folder_path.is_dir():
-        for file in os.listdir(folder_path):
-            (folder_path / file).rename(folder_path.parent / file)
-        folder_path.rmdir()
+    model_folder = manager.model_folder(model_name)
+    staging = staging_folder(model_folder)
+    logger.info(f"Extracting uploaded model into {staging}")
+    try:
+        extract_stream(
+            stream,
+            staging,
+            max_bytes=app.config.get("UPLOAD_MAX_BYTES", DEFAULT_UPLOAD_MAX_BYTES),
+            max_files=app.config.get("UPLOAD_MAX_FILES", DEFAULT_UPLOAD_MAX_FILES),
+        )
+        manager.install(model_name, staging)
+    except UploadError as e:
+        return bad_request(str(e))
+    finally:
+        # Installing moves the staging folder away, so this only removes the
+        # partial extraction of a failed upload.
+        shutil.rmtree(staging, ignore_errors=True)
+        manager.release_upload(model_name)
+    logger.info(f"Uploaded model installed at {model_folder}")
 
     # Create a dummy job to add
     # TODO should save Job args in model folder when training.
@@ -263,15 +547,47 @@ def download_model(model_name: str):
     if manager.status(model_name) != JobStatus.FINISHED:
         return bad_request(f"Model {model_name} hasn't finished training!")
 
-    zipped_model_path = TEMP_DIR / "model.zip"
-    zipped_model_path.parent.mkdir(exist_ok=True, parents=True)
-    logger.info(f"Creating zipped model at path: {zipped_model_path}")
-
-    shutil.make_archive(
-        str(zipped_model_path.parent / zipped_model_path.stem),
-        "zip",
-        manager.model_folder(model_name),
+    return interface.archives.response(
+        manager.model_folder(model_name), f"{model_name}.zip"
     )
-    logger.info(f"Zipped model created at path: {zipped_model_path}")
 
-    return send_file(zipped_model_path, as_attachment=True)
+
+@model_bp.route("/quantize/<model_name>", methods=["GET", "POST", "DELETE"])
+@requires_model
+def quantize_model(model_name: str):
+    """Queues the int8 variant of a trained model to be built (POST), reports
+    on it (GET) or removes it (DELETE). Transcriptions use the variant whenever
+    it exists.
+
+    While the variant is being built, GET returns its progress with a 202.
+    """
+    interface = Interface.from_app(app)
+    manager = interface.model_manager
+
+    if request.method == "DELETE":
+        manager.remove_quantized(model_name)
+        return Response(status=HTTPStatus.NO_CONTENT)
+
+    quantization = manager.quantization(model_name)
+    if request.method == "GET":
+        if quantization is not None and quantization.active:
+            return jsonify(camelize(quantization.to_dict())), HTTPStatus.ACCEPTED
+        if quantization is not None and quantization.error is not None:
+            return bad_request(f"Failed to quantize model: {quantization.error}")
+
+        report = manager.quantization_report(model_name)
+        if report is None:
+            return Response("Model hasn't been quantized.", status=HTTPStatus.NOT_FOUND)
+        return jsonify(camelize(report))
+
+    if manager.status(model_name) is not JobStatus.FINISHED:
+        return bad_request("Model not finished training.")
+    if quantization is not None and quantization.active:
+        return Response(
+            f"Model {model_name} is already being quantized.",
+            status=HTTPStatus.CONFLICT,
+        )
+
+    max_samples = request.args.get("maxSamples", DEFAULT_EVAL_SAMPLES, type=int)
+    quantization = manager.queue_quantization(model_name, max_samples)
+    return jsonify(camelize(quantization.to_dict())), HTTPStatus.ACCEPTED
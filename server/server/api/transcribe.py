@@ -1,4 +1,6 @@
-import shutil
+import json
+import time
+import zipfile
 from functools import wraps
 from http import HTTPStatus
 from pathlib import Path
@@ -11,12 +13,19 @@ from humps.main import camelize
 from loguru import logger
 from werkzeug.utils import secure_filename
 
-from server.api.utils import bad_request
+from server.api.utils import bad_request, server_sent_event
+from server.files import read_new_lines
+from server.inference import PARTIAL_RESULTS_SUFFIX
 from server.interface import Interface
-from server.managers.transcription_manager import TranscriptionJob, TranscriptionStatus
+from server.managers.transcription_manager import (
+    TranscriptionJob,
+    TranscriptionStatus,
+)
 
 transcription_bp = Blueprint("transcription_bp", __name__, url_prefix="/transcriptions")
 
+STREAM_POLL_SECONDS = 0.5
+
 
 def requires_model_and_audio(
     route: Callable[[str, str], Response]
@@ -103,16 +112,15 @@ def transcribe(model_location: str, audio_name: str):
     if manager.get_transcription_job(model_location, audio_name) is None:
         return bad_request("Model Location and Audio name pair not found.")
 
-    logger.info(f"Starting transcription job: {model_location} - {audio_name}.wav")
+    logger.info(f"Queueing transcription job: {model_location} - {audio_name}.wav")
     status = manager.transcribe(model_location, audio_name)
-    if status != TranscriptionStatus.FINISHED:
-        logger.error(f"Error with transcription: {model_location} - {audio_name}")
+    if status is None:
+        logger.error(f"Error queueing transcription: {model_location} - {audio_name}")
         return Response(
             "Transcription failed.", status=HTTPStatus.INTERNAL_SERVER_ERROR
         )
 
-    logger.info(f"Finished transcription: {model_location} - {audio_name}")
-    return Response(status=HTTPStatus.NO_CONTENT)
+    return Response(status=HTTPStatus.ACCEPTED)
 
 
 @transcription_bp.route("/", methods=["DELETE"])
@@ -134,7 +142,139 @@ def delete_transcription(model_location: str, audio_name: str):
 def get_transcription_status(model_location: str, audio_name: str):
     interface = Interface.from_app(app)
     manager = interface.transcription_manager
-    return jsonify(completed=manager.has_completed(model_location, audio_name))
+
+    job = manager.get_transcription_job(model_location, audio_name)
+    completed = manager.has_completed(model_location, audio_name)
+    if job is None:
+        return jsonify(completed=completed)
+
+    data = {
+        "completed": completed,
+        "status": job.status.value,
+        "queue_position": manager.queue_position(job),
+        "queued_at": job.queued_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "wait_seconds": job.wait_seconds,
+        "transcribe_seconds": job.transcribe_seconds,
+        "audio_seconds": job.audio_seconds,
+        "skipped_seconds": job.skipped_seconds,
+        "queue": manager.queue_info(),
+    }
+    return jsonify(camelize(data))
+
+
+@transcription_bp.route("/queue", methods=["GET"])
+def get_queue():
+    interface = Interface.from_app(app)
+    manager = interface.transcription_manager
+    return jsonify(camelize(manager.queue_info()))
+
+
+@transcription_bp.route("/ready", methods=["GET"])
+def get_readiness():
+    """Reports whether the preloaded pipelines are ready, responding with a 503
+    until they are, for use by load balancers."""
+    interface = Interface.from_app(app)
+    manager = interface.transcription_manager
+    readiness = manager.readiness()
+    status = HTTPStatus.OK if readiness["ready"] else HTTPStatus.SERVICE_UNAVAILABLE
+    return jsonify(readiness), status
+
+
+@transcription_bp.route("/pipelines", methods=["GET"])
+def get_pipelines():
+    interface = Interface.from_app(app)
+    manager = interface.transcription_manager
+    return jsonify(camelize(manager.pipelines_info()))
+
+
+@transcription_bp.route("/pipelines/pin", methods=["POST", "DELETE"])
+def pin_pipeline():
+    model_location = request.args.get("modelLocation")
+    if not model_location:
+        return bad_request("Missing pretrained model location.")
+
+    interface = Interface.from_app(app)
+    manager = interface.transcription_manager
+    if request.method == "POST":
+        manager.pipelines.pin(model_location)
+    else:
+        manager.pipelines.unpin(model_location)
+
+    return Response(status=HTTPStatus.NO_CONTENT)
+
+
+@transcription_bp.route("/results", methods=["GET", "DELETE"])
+def result_cache():
+    """Reports on, or clears, the cache of previous transcription results."""
+    interface = Interface.from_app(app)
+    manager = interface.transcription_manager
+    if manager.results is None:
+        return bad_request("The transcription result cache is disabled.")
+
+    if request.method == "DELETE":
+        manager.results.clear()
+        return Response(status=HTTPStatus.NO_CONTENT)
+
+    return jsonify(camelize(manager.results.info()))
+
+
+@transcription_bp.route("/stream", methods=["GET"])
+@requires_model_and_audio
+def stream_transcription(model_location: str, audio_name: str):
+    """Streams the annotations of a job as server-sent events while it is
+    transcribed in streaming mode, followed by a "done" event with its final
+    status.
+
+    Event ids are byte offsets into the job's partial results, so clients
+    can resume with the Last-Event-ID header.
+    """
+    interface = Interface.from_app(app)
+    manager = interface.transcription_manager
+
+    job = manager.get_transcription_job(model_location, audio_name)
+    if job is None:
+        return bad_request("No transcription job for supplied parameters")
+
+    partial_results_file = manager.partial_results_file(job)
+    try:
+        offset = int(request.headers.get("Last-Event-ID", 0))
+    except ValueError:
+        return bad_request("Invalid Last-Event-ID header")
+
+    def is_done() -> bool:
+        if job.status in (TranscriptionStatus.FINISHED, TranscriptionStatus.ERROR):
+            return True
+        # A waiting job which isn't queued won't produce any more results.
+        return (
+            job.status == TranscriptionStatus.WAITING
+            and manager.queue_position(job) is None
+        )
+
+    def events():
+        nonlocal offset
+        while True:
+            # Check before reading, so the last results aren't missed.
+            done = is_done()
+            lines, offset = read_new_lines(partial_results_file, offset)
+
+            # Work out the offset of the end of each line for its event id.
+            line_end = offset - sum(len(line.encode()) + 1 for line in lines)
+            for line in lines:
+                line_end += len(line.encode()) + 1
+                yield server_sent_event(camelize(json.loads(line)), event_id=line_end)
+
+            if done:
+                yield server_sent_event(job.status.value, event="done")
+                return
+            time.sleep(STREAM_POLL_SECONDS)
+
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
 
 
 @transcription_bp.route("/text", methods=["GET"])
@@ -184,8 +324,11 @@ def download():
     if not manager.folder.exists:
         return Response("Empty transcription folder", status=HTTPStatus.NOT_FOUND)
 
-    # TODO standardize tmp folders
-    zip_path = Path("/tmp") / "transcriptions.zip"
-    shutil.make_archive(str(zip_path.parent / zip_path.stem), "zip", manager.folder)
-
-    return send_file(zip_path, as_attachment=True)
+    # Transcripts are mostly text, so are worth compressing. Partial results
+    # are kept for streaming clients, but are superseded by the final ones.
+    return interface.archives.response(
+        manager.folder,
+        "transcriptions.zip",
+        compression=zipfile.ZIP_DEFLATED,
+        exclude=[f"*{PARTIAL_RESULTS_SUFFIX}"],
+    )
@@ -1,4 +1,6 @@
+import json
 from http import HTTPStatus
+from typing import Any, Optional
 
 from flask import Response
 from loguru import logger
@@ -7,3 +9,15 @@ from loguru import logger
 def bad_request(error_message: str) -> Response:
     logger.error(error_message)
     return Response(error_message, status=HTTPStatus.BAD_REQUEST)
+
+
+def server_sent_event(
+    data: Any, event: Optional[str] = None, event_id: Optional[int] = None
+) -> str:
+    """Formats json serializable data as a server-sent event."""
+    message = ""
+    if event is not None:
+        message += f"event: {event}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    return message + f"data: {json.dumps(data)}\n\n"
@@ -0,0 +1,202 @@
+import os
+import threading
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+from flask import Response, send_file
+from loguru import logger
+
+from server.files import is_excluded, tree_fingerprint
+
+DEFAULT_ARCHIVE_CACHE_BYTES = 16 * 1024**3
+CHUNK_SIZE = 1024 * 1024
+# Entries which could come near the zip32 size limit are written as zip64.
+ZIP64_THRESHOLD = zipfile.ZIP64_LIMIT // 2
+
+
+class _ChunkWriter:
+    """A write only, unseekable file which collects what's written to it, so
+    a zip file can be streamed while it's being built."""
+
+    def __init__(self) -> None:
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(
+    folder: Path, compression: int = zipfile.ZIP_STORED, exclude: Iterable[str] = ()
+) -> Iterator[bytes]:
+    """Yields a zip archive of a folder's contents, chunk by chunk, without
+    writing it to disk. Files whose names match an exclude pattern are left
+    out."""
+    writer = _ChunkWriter()
+    with zipfile.ZipFile(writer, "w", compression=compression) as archive:
+        for path in sorted(folder.rglob("*")):
+            name = path.relative_to(folder).as_posix()
+            if path.is_dir():
+                archive.writestr(name + "/", b"")
+                continue
+            if is_excluded(path, exclude):
+                continue
+
+            size = path.stat().st_size
+            info = zipfile.ZipInfo.from_file(path, name)
+            info.compress_type = compression
+            with open(path, "rb") as source, archive.open(
+                info, "w", force_zip64=size >= ZIP64_THRESHOLD
+            ) as entry:
+                while chunk := source.read(CHUNK_SIZE):
+                    entry.write(chunk)
+                    yield writer.take()
+    yield writer.take()
+
+
+class ArchiveCache:
+    """A size bounded cache of zip archives of folders, keyed on a fingerprint
+    of the folder's contents.
+
+    An archive which isn't cached is streamed to the client as it's built,
+    and saved at the same time for later downloads. Cached archives are sent
+    as files, so clients can resume them with range requests.
+    """
+
+    def __init__(
+        self, folder: Path, max_bytes: Optional[int] = DEFAULT_ARCHIVE_CACHE_BYTES
+    ) -> None:
+        self.folder = folder
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes if max_bytes else None
+        self._building: Set[str] = set()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def response(
+        self,
+        source: Path,
+        download_name: str,
+        compression: int = zipfile.ZIP_STORED,
+        fingerprint: Optional[str] = None,
+        exclude: Iterable[str] = (),
+    ) -> Response:
+        """Returns a response which downloads a zip archive of the source
+        folder's contents.
+
+        The source is fingerprinted by listing it, unless the caller already
+        knows a fingerprint which changes whenever its contents do. Files
+        whose names match an exclude pattern are left out of the archive.
+
+        Downloads can only be resumed once the archive is cached, as the first
+        download is streamed while it's being built.
+        """
+        if fingerprint is None:
+            fingerprint = tree_fingerprint(source, exclude)
+        key = f"{fingerprint}-{compression}"
+        path = self.folder / f"{key}.zip"
+
+        with self._lock:
+            if path.is_file():
+                os.utime(path)
+                self.hits += 1
+                return send_file(
+                    path,
+                    mimetype="application/zip",
+                    as_attachment=True,
+                    download_name=download_name,
+                    etag=key,
+                    conditional=True,
+                )
+
+            self.misses += 1
+
+        return Response(
+            self._save_while_streaming(key, stream_zip(source, compression, exclude)),
+            mimetype="application/zip",
+            headers={
+                "Content-Disposition": f"attachment; filename={download_name}",
+                "ETag": f'"{key}"',
+                "Accept-Ranges": "none",
+            },
+        )
+
+    def _save_while_streaming(
+        self, key: str, chunks: Iterator[bytes]
+    ) -> Iterator[bytes]:
+        # Only one of any concurrent downloads saves the archive.
+        with self._lock:
+            if key in self._building:
+                yield from chunks
+                return
+            self._building.add(key)
+
+        path = self.folder / f"{key}.zip"
+        temp_path = path.with_suffix(".tmp")
+        complete = False
+        try:
+            with open(temp_path, "wb") as archive:
+                for chunk in chunks:
+                    archive.write(chunk)
+                    yield chunk
+            complete = True
+        finally:
+            with self._lock:
+                self._building.discard(key)
+                if complete:
+                    os.replace(temp_path, path)
+                    logger.info(f"Cached archive: {path.name}")
+                    self._evict()
+                else:
+                    # The download was abandoned part way.
+                    temp_path.unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            for path in self.folder.glob("*.zip"):
+                path.unlink(missing_ok=True)
+
+    def info(self) -> Dict[str, Any]:
+        entries = list(self.folder.glob("*.zip"))
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "size_bytes": sum(path.stat().st_size for path in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+    def _evict(self) -> None:
+        """Removes the least recently used archives until the cache fits
+        within its budget. Assumes the lock is held."""
+        if self.max_bytes is None:
+            return
+
+        entries = [(path.stat(), path) for path in self.folder.glob("*.zip")]
+        total = sum(stat.st_size for stat, _ in entries)
+        for stat, path in sorted(entries, key=lambda entry: entry[0].st_mtime):
+            if total <= self.max_bytes:
+                break
+
+            logger.info(f"Evicting cached archive: {path.name}")
+            path.unlink(missing_ok=True)
+            total -= stat.st_size
+            self.evictions += 1
@@ -0,0 +1,213 @@
+"""Deduplicates large model files by storing them once, by content hash.
+
+Model folders keep their usual layout, but each weights or tokenizer file in
+them is a hardlink to (or, across filesystems that support it, a reflink of)
+a shared, read-only blob. The store counts the files referencing each blob,
+and removes blobs once nothing references them.
+"""
+
+import json
+import os
+import shutil
+import threading
+import uuid
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Dict, List
+
+from loguru import logger
+
+from server.files import clone_file, hash_file
+
+BLOB_PATTERNS = [
+    "*.bin",
+    "*.safetensors",
+    "tokenizer*.json",
+    "vocab.json",
+    "special_tokens_map.json",
+]
+INDEX_FILE = "index.json"
+READ_ONLY = 0o444
+WRITABLE = 0o644
+
+
+class BlobStore:
+    def __init__(self, folder: Path) -> None:
+        self.folder = folder
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # The paths of the files referencing each blob, by hash.
+        self._refs: Dict[str, List[str]] = {}
+        self._hashes: Dict[str, str] = {}
+        self._load()
+
+    @property
+    def index_file(self) -> Path:
+        return self.folder / INDEX_FILE
+
+    def add_folder(self, folder: Path) -> int:
+        """Replaces the large model files in a folder with links to blobs.
+
+        Symlinked files, as in the Hugging Face hub cache, are deduplicated
+        through their targets, if those are within the folder too.
+
+        Returns:
+            The number of bytes no longer duplicated.
+        """
+        saved = 0
+        for path in sorted(folder.rglob("*")):
+            if not any(fnmatch(path.name, pattern) for pattern in BLOB_PATTERNS):
+                continue
+
+            path = path.resolve()
+            if path.is_file() and path.is_relative_to(folder.resolve()):
+                saved += self.add(path)
+
+        if saved > 0:
+            logger.info(f"Deduplicated {saved} bytes in {folder}")
+        return saved
+
+    def add(self, path: Path) -> int:
+        """Stores a file as a blob, or links it to an identical existing one.
+
+        Returns:
+            The number of bytes no longer duplicated.
+        """
+        with self._lock:
+            if str(path) in self._hashes:
+                return 0
+
+        digest = hash_file(path)
+        blob = self._blob_path(digest)
+        with self._lock:
+            if blob.exists():
+                if not _link_or_clone(blob, path):
+                    return 0
+                saved = blob.stat().st_size
+            else:
+                # The file becomes the blob, so nothing is copied.
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                if not _link_or_clone(path, blob):
+                    return 0
+                os.chmod(blob, READ_ONLY)
+                saved = 0
+
+            self._refs.setdefault(digest, []).append(str(path))
+            self._hashes[str(path)] = digest
+            self._save()
+        return saved
+
+    def detach_folder(self, folder: Path) -> None:
+        """Gives the files in a folder which share a blob's inode their own
+        copies, so that they can be safely rewritten, e.g. by training."""
+        folder = folder.resolve()
+        with self._lock:
+            for digest, paths in self._refs.items():
+                blob = self._blob_path(digest)
+                inside = [Path(path) for path in paths if _is_within(path, folder)]
+                shared = len(inside) < len(paths)
+                for path in inside:
+                    if not path.exists() or not os.path.samefile(path, blob):
+                        continue
+                    if shared:
+                        temp_path = _temp_path(path)
+                        shutil.copyfile(blob, temp_path)
+                        os.replace(temp_path, path)
+                    else:
+                        # The blob is about to be removed, leaving this link.
+                        os.chmod(path, WRITABLE)
+            self._release(folder)
+
+    def release_folder(self, folder: Path) -> None:
+        """Drops the references of the files in a folder, removing any blobs
+        which are no longer referenced."""
+        with self._lock:
+            self._release(folder.resolve())
+
+    def info(self) -> Dict[str, int]:
+        with self._lock:
+            blobs = [self._blob_path(digest) for digest in self._refs]
+            sizes = [blob.stat().st_size for blob in blobs if blob.exists()]
+            references = sum(len(paths) for paths in self._refs.values())
+            return {
+                "blobs": len(sizes),
+                "references": references,
+                "size_bytes": sum(sizes),
+            }
+
+    def _release(self, folder: Path) -> None:
+        """Assumes the lock is held."""
+        for digest in list(self._refs):
+            paths = []
+            for path in self._refs[digest]:
+                if _is_within(path, folder):
+                    del self._hashes[path]
+                else:
+                    paths.append(path)
+
+            self._refs[digest] = paths
+            if not paths:
+                self._remove(digest)
+        self._save()
+
+    def _remove(self, digest: str) -> None:
+        logger.info(f"Removing unreferenced blob: {digest}")
+        self._blob_path(digest).unlink(missing_ok=True)
+        del self._refs[digest]
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.folder / digest[:2] / digest
+
+    def _load(self) -> None:
+        """Loads the references, dropping those to files which have since been
+        removed without being released."""
+        if not self.index_file.is_file():
+            return
+
+        with open(self.index_file) as index:
+            refs: Dict[str, List[str]] = json.load(index)
+
+        for digest, paths in refs.items():
+            existing = [path for path in paths if Path(path).is_file()]
+            if existing:
+                self._refs[digest] = existing
+                self._hashes.update((path, digest) for path in existing)
+            else:
+                self._blob_path(digest).unlink(missing_ok=True)
+
+    def _save(self) -> None:
+        """Assumes the lock is held."""
+        temp_path = _temp_path(self.index_file)
+        with open(temp_path, "w") as index:
+            json.dump(self._refs, index)
+        os.replace(temp_path, self.index_file)
+
+
+def _link_or_clone(source: Path, destination: Path) -> bool:
+    """Replaces the destination with a hardlink to the source, or else a
+    reflink of it.
+
+    Returns:
+        True iff either worked. Neither does across filesystems without
+        reflink support.
+    """
+    temp_path = _temp_path(destination)
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        try:
+            clone_file(source, temp_path)
+        except OSError:
+            temp_path.unlink(missing_ok=True)
+            return False
+
+    os.replace(temp_path, destination)
+    return True
+
+
+def _is_within(path: str, folder: Path) -> bool:
+    return Path(path).is_relative_to(folder)
+
+
+def _temp_path(path: Path) -> Path:
+    return path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
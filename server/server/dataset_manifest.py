@@ -0,0 +1,312 @@
+"""Records what a dataset's raw files were processed into, so that updating a
+dataset only reprocesses the files which have changed.
+
+Each raw file is recorded by its content hash, and each batch, i.e. each
+transcription file and its audio, by the hashes of its inputs and the names
+of the processed files it produced. A batch needs processing again if either
+of its inputs has changed, and its outputs are removed once its inputs are.
+
+The manifest also answers whether a dataset is fully processed, and how many
+files it has, without listing its folders. Manifests which have drifted from
+the files on disk, e.g. after processed files were deleted by hand, can be
+checked and repaired with:
+
+    python -m server.dataset_manifest DATASET_FOLDER [--repair]
+
+after which the server reprocesses whatever was dropped when it next starts.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from elpis.datasets.dataset import ProcessingBatch
+
+from server.files import hash_file
+
+MANIFEST_FILE = "manifest.json"
+RAW_FOLDER = "raw"
+PROCESSED_FOLDER = "processed"
+
+
+@dataclass
+class InputFile:
+    hash: str
+    size: int
+    mtime_ns: int
+
+
+@dataclass
+class BatchRecord:
+    # The names and hashes of the batch's transcription and audio files.
+    inputs: Dict[str, str]
+    # The names and sizes of the files it was processed into.
+    outputs: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class ManifestSummary:
+    """What a dataset was processed into, kept small enough to be stored
+    with the dataset's state."""
+
+    complete: bool = False  # Every expected batch has been processed
+    batches: int = 0
+    files: int = 0  # Processed files
+    size_bytes: int = 0
+    raw_files: int = 0
+    raw_size_bytes: int = 0
+    # Changes whenever the processed files do.
+    fingerprint: str = ""
+
+
+@dataclass
+class ManifestDrift:
+    """The differences between a manifest and the files on disk."""
+
+    missing_outputs: List[str] = field(default_factory=list)
+    resized_outputs: List[str] = field(default_factory=list)
+    untracked_outputs: List[str] = field(default_factory=list)
+    changed_inputs: List[str] = field(default_factory=list)
+    unprocessed_batches: List[str] = field(default_factory=list)
+    # Batches which need processing again to fix the drift.
+    drifted_batches: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not any(self.__dict__.values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self.__dict__ | {"ok": self.ok}
+
+
+@dataclass
+class DatasetManifest:
+    inputs: Dict[str, InputFile] = field(default_factory=dict)
+    batches: Dict[str, BatchRecord] = field(default_factory=dict)
+    # The names of the batches in the dataset when it was last planned.
+    expected: List[str] = field(default_factory=list)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional[DatasetManifest]:
+        try:
+            with open(path) as manifest:
+                data = json.load(manifest)
+        except (OSError, ValueError):
+            return None
+
+        return cls(
+            inputs={
+                name: InputFile(**record) for name, record in data["inputs"].items()
+            },
+            batches={
+                name: BatchRecord(**record) for name, record in data["batches"].items()
+            },
+            expected=data.get("expected", []),
+        )
+
+    def save(self, path: Path) -> None:
+        temp_path = path.with_suffix(".tmp")
+        with open(temp_path, "w") as manifest:
+            json.dump(self.to_dict(), manifest)
+        os.replace(temp_path, path)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "inputs": {name: record.__dict__ for name, record in self.inputs.items()},
+            "batches": {name: record.__dict__ for name, record in self.batches.items()},
+            "expected": self.expected,
+        }
+
+    def summary(self) -> ManifestSummary:
+        digest = hashlib.sha256()
+        for name in sorted(self.batches):
+            record = self.batches[name]
+            digest.update(json.dumps([name, record.inputs, record.outputs]).encode())
+
+        return ManifestSummary(
+            complete=all(name in self.batches for name in self.expected),
+            batches=len(self.batches),
+            files=sum(len(record.outputs) for record in self.batches.values()),
+            size_bytes=sum(
+                sum(record.outputs.values()) for record in self.batches.values()
+            ),
+            raw_files=len(self.inputs),
+            raw_size_bytes=sum(record.size for record in self.inputs.values()),
+            fingerprint=digest.hexdigest(),
+        )
+
+    def hash_inputs(self, files: Iterable[Path]) -> Dict[str, str]:
+        """Records the hashes of the given raw files, and forgets any others.
+
+        Files whose size and modification time are unchanged since they were
+        last hashed aren't read again.
+
+        Returns:
+            The hash of each file, by name.
+        """
+        inputs: Dict[str, InputFile] = {}
+        for path in files:
+            if not path.is_file():
+                continue
+            stat = path.stat()
+            record = self.inputs.get(path.name)
+            if (
+                record is None
+                or record.size != stat.st_size
+                or record.mtime_ns != stat.st_mtime_ns
+            ):
+                record = InputFile(hash_file(path), stat.st_size, stat.st_mtime_ns)
+            inputs[path.name] = record
+
+        self.inputs = inputs
+        return {name: record.hash for name, record in inputs.items()}
+
+    def plan(
+        self, batches: List[ProcessingBatch]
+    ) -> Tuple[List[ProcessingBatch], List[str]]:
+        """Works out which batches need processing, given the current raw
+        files.
+
+        Returns:
+            The batches which are new or whose inputs have changed, and the
+            names of recorded batches which are no longer in the dataset or
+            need processing again, whose outputs are stale.
+        """
+        hashes = self.hash_inputs(
+            path
+            for batch in batches
+            for path in (batch.transcription_file, batch.audio_file)
+        )
+
+        pending: List[ProcessingBatch] = []
+        self.expected = [batch.transcription_file.name for batch in batches]
+        current = set(self.expected)
+        for batch in batches:
+            name = batch.transcription_file.name
+            record = self.batches.get(name)
+            if record is None or record.inputs != batch_inputs(batch, hashes):
+                pending.append(batch)
+
+        pending_names = {batch.transcription_file.name for batch in pending}
+        stale = [
+            name
+            for name in self.batches
+            if name not in current or name in pending_names
+        ]
+        return pending, stale
+
+    def verify(self, raw_folder: Path, output_dir: Path) -> ManifestDrift:
+        """Compares the manifest with the raw and processed files on disk.
+
+        Inputs are compared by size and modification time, and outputs by
+        size, so nothing is hashed.
+        """
+        drift = ManifestDrift()
+        drifted = set()
+        for name, record in self.batches.items():
+            for input_name in record.inputs:
+                recorded = self.inputs.get(input_name)
+                path = raw_folder / input_name
+                if (
+                    recorded is None
+                    or not path.is_file()
+                    or path.stat().st_size != recorded.size
+                    or path.stat().st_mtime_ns != recorded.mtime_ns
+                ):
+                    drift.changed_inputs.append(input_name)
+                    drifted.add(name)
+
+            for output_name, size in record.outputs.items():
+                path = output_dir / output_name
+                if not path.is_file():
+                    drift.missing_outputs.append(output_name)
+                    drifted.add(name)
+                elif path.stat().st_size != size:
+                    drift.resized_outputs.append(output_name)
+                    drifted.add(name)
+
+        tracked = {
+            output for record in self.batches.values() for output in record.outputs
+        }
+        if output_dir.is_dir():
+            drift.untracked_outputs = sorted(
+                path.name for path in output_dir.iterdir() if path.name not in tracked
+            )
+        drift.unprocessed_batches = [
+            name for name in self.expected if name not in self.batches
+        ]
+        drift.drifted_batches = sorted(drifted)
+        return drift
+
+    def repair(self, drift: ManifestDrift, output_dir: Path) -> None:
+        """Forgets drifted batches and removes their outputs, as well as any
+        untracked outputs, so that reprocessing the dataset fixes it."""
+        for name in drift.drifted_batches:
+            self.remove_outputs(name, output_dir)
+        for name in drift.untracked_outputs:
+            path = output_dir / name
+            if path.is_dir():
+                shutil.rmtree(path)
+            else:
+                path.unlink(missing_ok=True)
+
+    def remove_outputs(self, batch_name: str, output_dir: Path) -> None:
+        """Deletes the processed files of a batch, and forgets the batch."""
+        record = self.batches.pop(batch_name, None)
+        if record is None:
+            return
+        for name in record.outputs:
+            (output_dir / name).unlink(missing_ok=True)
+
+    def record(
+        self, batch: ProcessingBatch, outputs: List[str], output_dir: Path
+    ) -> None:
+        """Records the files a batch was processed into."""
+        hashes = {name: record.hash for name, record in self.inputs.items()}
+        self.batches[batch.transcription_file.name] = BatchRecord(
+            inputs=batch_inputs(batch, hashes),
+            outputs={name: (output_dir / name).stat().st_size for name in outputs},
+        )
+
+
+def batch_inputs(batch: ProcessingBatch, hashes: Dict[str, str]) -> Dict[str, str]:
+    names = [batch.transcription_file.name, batch.audio_file.name]
+    return {name: hashes.get(name, "") for name in names}
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Checks a dataset's manifest against its files."
+    )
+    parser.add_argument("dataset_folder", type=Path)
+    parser.add_argument(
+        "--repair",
+        action="store_true",
+        help="Forget drifted batches, so they're processed again.",
+    )
+    parsed = parser.parse_args(args)
+
+    path = parsed.dataset_folder / MANIFEST_FILE
+    manifest = DatasetManifest.load(path)
+    if manifest is None:
+        raise SystemExit(f"No readable manifest at {path}")
+
+    output_dir = parsed.dataset_folder / PROCESSED_FOLDER
+    drift = manifest.verify(parsed.dataset_folder / RAW_FOLDER, output_dir)
+    print(json.dumps(drift.to_dict(), indent=2))
+    if parsed.repair and not drift.ok:
+        manifest.repair(drift, output_dir)
+        manifest.save(path)
+    elif not drift.ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import fcntl
+import fnmatch
+import hashlib
+import os
+import shutil
+import uuid
+from enum import Enum
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+HASH_CHUNK_SIZE = 1024 * 1024
+COPY_CHUNK_SIZE = 1024 * 1024
+# From <linux/fs.h>
+FICLONE = 0x40049409
+
+
+class Placement(Enum):
+    """How a file was put in place by `link_or_copy`."""
+
+    HARDLINK = "hardlink"
+    REFLINK = "reflink"
+    COPY = "copy"
+
+
+def hash_file(path: Path) -> str:
+    """Returns the sha256 hex digest of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def clone_file(source: Path, destination: Path) -> None:
+    """Makes the destination a copy-on-write reflink of the source, which
+    shares its data until either is written to.
+
+    Raises:
+        OSError: If the filesystem doesn't support reflinks, or the files are
+            on different filesystems.
+    """
+    with open(source, "rb") as source_file, open(destination, "wb") as clone:
+        fcntl.ioctl(clone.fileno(), FICLONE, source_file.fileno())
+
+
+def copy_file_verified(source: Path, destination: Path) -> str:
+    """Copies a file and its metadata in chunks, checking the copy against
+    the source's checksum.
+
+    Returns:
+        The sha256 hex digest of the file's contents.
+
+    Raises:
+        OSError: If the copy doesn't match the source.
+    """
+    digest = hashlib.sha256()
+    with open(source, "rb") as source_file, open(destination, "wb") as copy:
+        while chunk := source_file.read(COPY_CHUNK_SIZE):
+            digest.update(chunk)
+            copy.write(chunk)
+        copy.flush()
+        os.fsync(copy.fileno())
+
+    if hash_file(destination) != digest.hexdigest():
+        destination.unlink(missing_ok=True)
+        raise OSError(f"Copy of {source} doesn't match its checksum")
+    shutil.copystat(source, destination)
+    return digest.hexdigest()
+
+
+def link_or_copy(source: Path, destination: Path) -> Placement:
+    """Puts a file at the destination without duplicating its data where
+    possible, replacing anything already there.
+
+    The file is hardlinked if both paths are on the same filesystem, else
+    reflinked if the filesystem supports it, else copied. Hardlinked files
+    share their inode with the source, so the destination is replaced rather
+    than written over, leaving the source untouched.
+    """
+    temp_path = destination.with_name(f".{destination.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        try:
+            os.link(source, temp_path)
+            placement = Placement.HARDLINK
+        except OSError:
+            try:
+                clone_file(source, temp_path)
+                shutil.copystat(source, temp_path)
+                placement = Placement.REFLINK
+            except OSError:
+                temp_path.unlink(missing_ok=True)
+                copy_file_verified(source, temp_path)
+                placement = Placement.COPY
+        os.replace(temp_path, destination)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    return placement
+
+
+def folder_fingerprint(folder: Path, ignore: Iterable[str] = ()) -> str:
+    """Returns a cheap fingerprint of the files directly within a folder,
+    which changes if any of them are added, removed or modified.
+
+    Files are identified by their name, size and modification time rather
+    than their contents, so large folders can be fingerprinted quickly.
+    """
+    ignored = set(ignore)
+    digest = hashlib.sha256()
+    for path in sorted(folder.iterdir()):
+        if path.name in ignored or not path.is_file():
+            continue
+        stat = path.stat()
+        digest.update(f"{path.name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def tree_fingerprint(folder: Path, exclude: Iterable[str] = ()) -> str:
+    """Returns a cheap fingerprint of all the files within a folder and its
+    subfolders, identified like those of `folder_fingerprint`, except those
+    whose names match an exclude pattern."""
+    digest = hashlib.sha256()
+    for path in sorted(folder.rglob("*")):
+        if not path.is_file() or is_excluded(path, exclude):
+            continue
+        stat = path.stat()
+        name = path.relative_to(folder).as_posix()
+        digest.update(f"{name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def is_excluded(path: Path, exclude: Iterable[str]) -> bool:
+    """Whether a path's name matches any of the glob patterns."""
+    return any(fnmatch.fnmatch(path.name, pattern) for pattern in exclude)
+
+
+def read_new_lines(
+    path: Path, offset: int = 0, max_bytes: Optional[int] = None
+) -> Tuple[List[str], int]:
+    """Reads the complete lines written to a file since the given byte offset.
+
+    A trailing line without a newline is assumed to still be being written,
+    so it is left for the next read.
+
+    Parameters:
+        path: The file to read.
+        offset: The byte offset to read from.
+        max_bytes: The most to read at once, if given. The rest of the file
+            is left for the next read, unless a single line is longer than
+            this, in which case it's returned whole.
+
+    Returns:
+        The new lines, and the offset to read from next time.
+    """
+    if not path.exists():
+        return [], offset
+
+    # Start again if the file has been truncated since the last read.
+    if offset > path.stat().st_size:
+        offset = 0
+
+    with open(path, "rb") as file:
+        file.seek(offset)
+        if max_bytes is None:
+            data = file.read()
+        else:
+            data = file.read(max_bytes)
+            if data and b"\n" not in data:
+                data += file.readline()
+
+    end = data.rfind(b"\n") + 1
+    lines = data[:end].decode(errors="replace").splitlines()
+    return lines, offset + end
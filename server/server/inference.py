@@ -0,0 +1,354 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+import numpy as np
+from elpis.models import Annotation
+from elpis.transcriber.results import build_elan, build_text
+from elpis.transcriber.transcribe import (
+    annotation_from_chunk,
+    build_pipeline,
+    transcribe,
+)
+from pedalboard.io import ReadableAudioFile
+from transformers import AutomaticSpeechRecognitionPipeline as ASRPipeline
+
+from server.pipeline_cache import quantized_key
+from server.quantization import load_quantized
+from server.vad import DEFAULT_VAD_THRESHOLD_DB, speech_regions
+
+CHUNK_LENGTH_S = 10
+WARM_UP_SECONDS = 1
+DEFAULT_STREAM_WINDOW_S = 30
+DEFAULT_STREAM_OVERLAP_S = 5
+PARTIAL_RESULTS_SUFFIX = ".partial.jsonl"
+
+
+@dataclass
+class InferenceTask:
+    """A group of audio files to transcribe with the same model, in a form
+    which can be sent to another process."""
+
+    model_location: str
+    pipeline_location: str  # The path or hub id to build the pipeline from
+    cache_dir: Path
+    audio_files: List[Path]
+    batch_size: int = 1
+    streaming: bool = False
+    stream_window_s: float = DEFAULT_STREAM_WINDOW_S
+    stream_overlap_s: float = DEFAULT_STREAM_OVERLAP_S
+    quantized_weights: Optional[Path] = None  # Use an int8 variant if set
+    vad: bool = False  # Skip silence, when not streaming
+    vad_threshold_db: float = DEFAULT_VAD_THRESHOLD_DB
+
+    @property
+    def pipeline_key(self) -> str:
+        """The key of the task's pipeline in a pipeline cache."""
+        if self.quantized_weights is not None:
+            return quantized_key(self.model_location)
+        return self.model_location
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = dict(self.__dict__)
+        result["cache_dir"] = str(self.cache_dir)
+        result["audio_files"] = [str(audio) for audio in self.audio_files]
+        if self.quantized_weights is not None:
+            result["quantized_weights"] = str(self.quantized_weights)
+        return result
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> InferenceTask:
+        task = cls(**data)
+        task.cache_dir = Path(task.cache_dir)
+        task.audio_files = [Path(audio) for audio in task.audio_files]
+        if task.quantized_weights is not None:
+            task.quantized_weights = Path(task.quantized_weights)
+        return task
+
+
+@dataclass
+class InferenceResult:
+    """The annotations inferred for an audio file, along with how much of it
+    was skipped as silence."""
+
+    annotations: List[Annotation]
+    audio_seconds: Optional[float] = None
+    skipped_seconds: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "annotations": [annotation.to_dict() for annotation in self.annotations],
+            "audio_seconds": self.audio_seconds,
+            "skipped_seconds": self.skipped_seconds,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> InferenceResult:
+        return cls(
+            annotations=[Annotation.from_dict(a) for a in data["annotations"]],
+            audio_seconds=data.get("audio_seconds"),
+            skipped_seconds=data.get("skipped_seconds", 0.0),
+        )
+
+
+def build_task_pipeline(task: InferenceTask) -> ASRPipeline:
+    """Builds the pipeline a task should be run with."""
+    asr = build_pipeline(task.pipeline_location, cache_dir=task.cache_dir)
+    if task.quantized_weights is not None:
+        asr = load_quantized(asr, task.quantized_weights)
+    return asr
+
+
+def run_task(task: InferenceTask, asr: ASRPipeline) -> List[InferenceResult]:
+    """Transcribes the audio files of a task, writing the text and elan
+    results for each alongside its audio.
+
+    Returns:
+        The inference results for each audio file, in the same order.
+    """
+    if task.streaming:
+        annotations = [_stream_to_file(audio, asr, task) for audio in task.audio_files]
+        results = [InferenceResult(anns) for anns in annotations]
+    elif task.vad:
+        results = [
+            transcribe_speech(audio, asr, task.batch_size, task.vad_threshold_db)
+            for audio in task.audio_files
+        ]
+    elif len(task.audio_files) == 1:
+        results = [InferenceResult(transcribe(task.audio_files[0], asr))]
+    else:
+        annotations = transcribe_batch(
+            task.audio_files, asr, batch_size=task.batch_size
+        )
+        results = [InferenceResult(anns) for anns in annotations]
+
+    for audio_file, result in zip(task.audio_files, results):
+        write_results(audio_file, result.annotations)
+    return results
+
+
+def write_results(audio_file: Path, annotations: List[Annotation]) -> None:
+    """Writes the text and elan files for an audio file's annotations."""
+    with open(audio_file.with_suffix(".txt"), "w") as text_file:
+        text_file.write(build_text(annotations))
+
+    build_elan(annotations).to_file(audio_file.with_suffix(".eaf"))
+
+
+def partial_results_file(audio_file: Path) -> Path:
+    """The file to which annotations are appended as they're transcribed
+    in streaming mode, one json object per line."""
+    return audio_file.with_suffix(PARTIAL_RESULTS_SUFFIX)
+
+
+def write_partial_results(file: TextIO, annotations: List[Annotation]) -> None:
+    for annotation in annotations:
+        data = annotation.to_dict()
+        data.pop("audio_file")
+        file.write(json.dumps(data) + "\n")
+    file.flush()
+
+
+def _stream_to_file(
+    audio_file: Path, asr: ASRPipeline, task: InferenceTask
+) -> List[Annotation]:
+    annotations: List[Annotation] = []
+    windows = transcribe_stream(
+        audio_file,
+        asr,
+        window_s=task.stream_window_s,
+        overlap_s=task.stream_overlap_s,
+    )
+    with open(partial_results_file(audio_file), "w") as partial_file:
+        for window_annotations in windows:
+            write_partial_results(partial_file, window_annotations)
+            annotations.extend(window_annotations)
+    return annotations
+
+
+def transcribe_batch(
+    audio_files: List[Path],
+    asr: ASRPipeline,
+    batch_size: int,
+    chunk_length_s: int = CHUNK_LENGTH_S,
+) -> List[List[Annotation]]:
+    """Transcribes several audio files with a single pass of the pipeline,
+    letting it batch their chunks together.
+
+    Parameters:
+        audio_files: The paths to the audio files to transcribe.
+        asr: The automatic speech recognition pipeline.
+        batch_size: The number of audio chunks to run through the model at once.
+        chunk_length_s: The amount of seconds per audio chunk in the pipeline.
+
+    Returns:
+        The inferred annotations for each audio file, in the same order.
+    """
+    preds: List[Dict[str, Any]] = asr(
+        [str(audio) for audio in audio_files],
+        chunk_length_s=chunk_length_s,
+        return_timestamps="word",
+        batch_size=batch_size,
+    )  # type: ignore
+
+    return [
+        [annotation_from_chunk(chunk, audio) for chunk in pred["chunks"]]
+        for pred, audio in zip(preds, audio_files)
+    ]
+
+
+def warm_up(asr: ASRPipeline) -> None:
+    """Runs a short pass of silence through the pipeline, so that one-off
+    setup costs aren't paid by the first real transcription."""
+    sampling_rate = asr.feature_extractor.sampling_rate  # type: ignore
+    silence = np.zeros(WARM_UP_SECONDS * sampling_rate, dtype=np.float32)
+    asr(
+        {"raw": silence, "sampling_rate": sampling_rate},
+        chunk_length_s=CHUNK_LENGTH_S,
+        return_timestamps="word",
+    )
+
+
+def transcribe_stream(
+    audio_file: Path,
+    asr: ASRPipeline,
+    window_s: float = DEFAULT_STREAM_WINDOW_S,
+    overlap_s: float = DEFAULT_STREAM_OVERLAP_S,
+) -> Iterator[List[Annotation]]:
+    """Transcribes an audio file in overlapping windows, yielding the
+    annotations of each window as soon as it's done.
+
+    Only one window of audio is held in memory at a time. Each window owns
+    the half of the overlap nearest to it, and words are kept by the window
+    which owns their midpoint, so words at a boundary appear exactly once.
+
+    Parameters:
+        audio_file: The path to the audio file to transcribe.
+        asr: The automatic speech recognition pipeline.
+        window_s: The length of each window in seconds.
+        overlap_s: The overlap between consecutive windows in seconds.
+
+    Returns:
+        An iterator over the annotations for each window, with timestamps
+            relative to the start of the audio file.
+    """
+    sampling_rate = asr.feature_extractor.sampling_rate  # type: ignore
+    window = int(window_s * sampling_rate)
+    overlap = min(int(overlap_s * sampling_rate), window // 2)
+    step = window - overlap
+
+    with ReadableAudioFile(str(audio_file)).resampled_to(sampling_rate) as audio:
+        buffer = np.zeros(0, dtype=np.float32)
+        start = 0  # The frame at which the buffer starts
+        first = True
+        while True:
+            frames = audio.read(window - len(buffer))
+            buffer = np.concatenate([buffer, frames.mean(axis=0)])
+            last = len(buffer) < window or audio.tell() >= audio.frames
+
+            owned_from = start if first else start + overlap / 2
+            owned_to = start + len(buffer) if last else start + window - overlap / 2
+            if len(buffer) > 0:
+                yield _transcribe_window(
+                    buffer,
+                    asr,
+                    audio_file,
+                    offset_s=start / sampling_rate,
+                    owned_s=(owned_from / sampling_rate, owned_to / sampling_rate),
+                )
+
+            if last:
+                return
+
+            buffer = buffer[step:]
+            start += step
+            first = False
+
+
+def transcribe_speech(
+    audio_file: Path,
+    asr: ASRPipeline,
+    batch_size: int = 1,
+    threshold_db: float = DEFAULT_VAD_THRESHOLD_DB,
+) -> InferenceResult:
+    """Transcribes only the regions of an audio file which contain speech,
+    skipping silence and background noise.
+
+    Parameters:
+        audio_file: The path to the audio file to transcribe.
+        asr: The automatic speech recognition pipeline.
+        batch_size: The number of audio chunks to run through the model at once.
+        threshold_db: How far above the noise floor audio must be to count as
+            speech.
+
+    Returns:
+        The annotations, with timestamps relative to the start of the audio
+            file, and the amount of audio skipped.
+    """
+    sampling_rate = asr.feature_extractor.sampling_rate  # type: ignore
+    with ReadableAudioFile(str(audio_file)).resampled_to(sampling_rate) as audio:
+        samples = audio.read(audio.frames).mean(axis=0)
+
+    regions = speech_regions(samples, sampling_rate, threshold_db=threshold_db)
+    annotations: List[Annotation] = []
+    if len(regions) > 0:
+        preds: List[Dict[str, Any]] = asr(
+            [
+                {"raw": samples[start:stop], "sampling_rate": sampling_rate}
+                for start, stop in regions
+            ],
+            chunk_length_s=CHUNK_LENGTH_S,
+            return_timestamps="word",
+            batch_size=batch_size,
+        )  # type: ignore
+        for (start, _), pred in zip(regions, preds):
+            offset_s = start / sampling_rate
+            for chunk in pred["chunks"]:
+                annotations.append(_offset_annotation(chunk, audio_file, offset_s))
+
+    speech = sum(stop - start for start, stop in regions)
+    return InferenceResult(
+        annotations,
+        audio_seconds=len(samples) / sampling_rate,
+        skipped_seconds=(len(samples) - speech) / sampling_rate,
+    )
+
+
+def _transcribe_window(
+    window: np.ndarray,
+    asr: ASRPipeline,
+    audio_file: Path,
+    offset_s: float,
+    owned_s: Tuple[float, float],
+) -> List[Annotation]:
+    sampling_rate = asr.feature_extractor.sampling_rate  # type: ignore
+    preds: Dict[str, Any] = asr(
+        {"raw": window, "sampling_rate": sampling_rate},
+        chunk_length_s=CHUNK_LENGTH_S,
+        return_timestamps="word",
+    )  # type: ignore
+
+    annotations = []
+    owned_from, owned_to = owned_s
+    for chunk in preds["chunks"]:
+        start, stop = chunk["timestamp"]
+        if owned_from <= offset_s + (start + stop) / 2 < owned_to:
+            annotations.append(_offset_annotation(chunk, audio_file, offset_s))
+    return annotations
+
+
+def _offset_annotation(
+    chunk: Dict[str, Any], audio_file: Path, offset_s: float
+) -> Annotation:
+    """Builds an annotation from a chunk of some audio which starts offset_s
+    seconds into the audio file."""
+    start, stop = chunk["timestamp"]
+    return Annotation(
+        transcript=chunk["text"],
+        start_ms=int((start + offset_s) * 1000),
+        stop_ms=int((stop + offset_s) * 1000) + 1,
+        audio_file=audio_file,
+    )
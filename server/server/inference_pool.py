@@ -0,0 +1,127 @@
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Any, Dict, Iterable, List, Optional
+
+from transformers import AutomaticSpeechRecognitionPipeline as ASRPipeline
+
+from server.inference import (
+    InferenceResult,
+    InferenceTask,
+    build_task_pipeline,
+    run_task,
+    warm_up,
+)
+from server.pipeline_cache import DEFAULT_PIPELINE_CACHE_BYTES, PipelineCache
+
+# The pipelines owned by the current worker process.
+_pipelines: Optional[PipelineCache] = None
+
+
+class InferencePool:
+    """Runs inference tasks in a pool of worker processes, so that model
+    inference and building results don't compete with request handling for
+    the GIL.
+
+    Each process builds and caches its own pipelines. Processes are started
+    lazily, on the first task submitted.
+    """
+
+    def __init__(
+        self,
+        processes: int,
+        pipeline_cache_bytes: Optional[int] = DEFAULT_PIPELINE_CACHE_BYTES,
+        pinned: Iterable[str] = (),
+    ) -> None:
+        self.processes = processes
+        self._pipeline_cache_bytes = pipeline_cache_bytes
+        self._pinned = list(pinned)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def run(self, task: InferenceTask) -> List[InferenceResult]:
+        """Runs a task in one of the worker processes, blocking until it's done.
+
+        Returns:
+            The inference results for each of the task's audio files.
+
+        Raises:
+            BrokenProcessPool: If a worker process died, e.g. running out of
+                memory. The next task starts a fresh pool.
+        """
+        executor = self._get_executor()
+        try:
+            return executor.submit(_run_task, task).result()
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise
+
+    def warm_up(self, task: InferenceTask) -> None:
+        """Builds, pins and warms up the task's pipeline in the worker processes.
+
+        One warm up is submitted per process. As idle processes take the next
+        waiting task, these will usually, but not certainly, land on distinct
+        processes.
+        """
+        executor = self._get_executor()
+        try:
+            futures: List[Future] = [
+                executor.submit(_warm_up, task) for _ in range(self.processes)
+            ]
+            for future in futures:
+                future.result()
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise
+
+    def clear(self) -> None:
+        """Stops the worker processes, freeing their pipelines. New processes
+        are started for the next task."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        """Drops a broken executor, unless another thread already has."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def info(self) -> Dict[str, Any]:
+        return {"processes": self.processes, "started": self._executor is not None}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Forking a process with loaded torch models and running
+                # threads isn't safe, so start fresh interpreters instead.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=get_context("spawn"),
+                    initializer=_init_process,
+                    initargs=(self._pipeline_cache_bytes, self._pinned),
+                )
+            return self._executor
+
+
+def _init_process(max_bytes: Optional[int], pinned: List[str]) -> None:
+    global _pipelines
+    _pipelines = PipelineCache(max_bytes=max_bytes, pinned=pinned)
+
+
+def _get_pipeline(task: InferenceTask) -> ASRPipeline:
+    assert _pipelines is not None, "Inference process wasn't initialized"
+    return _pipelines.get(task.pipeline_key, lambda: build_task_pipeline(task))
+
+
+def _run_task(task: InferenceTask) -> List[InferenceResult]:
+    return run_task(task, _get_pipeline(task))
+
+
+def _warm_up(task: InferenceTask) -> None:
+    assert _pipelines is not None, "Inference process wasn't initialized"
+    warm_up(_get_pipeline(task))
+    _pipelines.pin(task.pipeline_key)
@@ -0,0 +1,243 @@
+"""A model serving sidecar, which lets several server processes share one
+copy of each pipeline.
+
+Run it with:
+
+    python -m server.inference_server --socket /tmp/elpis-inference.sock
+
+and point the server at it with the INFERENCE_SOCKET environment variable.
+
+Requests and responses are single lines of json over a Unix socket, one
+request per connection. Each request has a "type" of "run", "warm_up",
+"clear" or "info", and "run" and "warm_up" requests carry an inference
+"task". Responses either carry the request's "result", or an "error".
+Requests whose client gives up waiting before their inference starts are
+dropped, rather than holding up the requests behind them.
+"""
+
+import argparse
+import json
+import os
+import select
+import socket
+import socketserver
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from loguru import logger
+from transformers import AutomaticSpeechRecognitionPipeline as ASRPipeline
+
+from server.inference import (
+    InferenceResult,
+    InferenceTask,
+    build_task_pipeline,
+    run_task,
+    warm_up,
+)
+from server.pipeline_cache import DEFAULT_PIPELINE_CACHE_BYTES, PipelineCache
+
+# How long to wait for a response, which for a run includes transcribing.
+# Configurable, as long recordings can take longer.
+DEFAULT_REQUEST_TIMEOUT_S = 600.0
+
+
+class InferenceError(RuntimeError):
+    """Raised when the inference server fails to handle a request."""
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves inference requests from a single cache of pipelines.
+
+    Connections are handled concurrently, but inference is run one request at
+    a time, so memory use is bounded by the pipelines rather than the number
+    of clients.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        socket_path: Path,
+        pipeline_cache_bytes: Optional[int] = DEFAULT_PIPELINE_CACHE_BYTES,
+        pinned: Iterable[str] = (),
+    ) -> None:
+        self.pipelines = PipelineCache(max_bytes=pipeline_cache_bytes, pinned=pinned)
+        self._inference_lock = threading.Lock()
+
+        # Replace the socket of a previous server which wasn't shut down cleanly
+        if socket_path.exists():
+            socket_path.unlink()
+        super().__init__(str(socket_path), _InferenceHandler)
+
+    def handle_request_data(
+        self,
+        data: Dict[str, Any],
+        disconnected: Callable[[], bool] = lambda: False,
+    ) -> Any:
+        """Handles a request, dropping it if the client has disconnected by
+        the time its inference would start."""
+        request_type = data.get("type")
+        if request_type == "info":
+            return self.pipelines.info()
+
+        if request_type == "clear":
+            # Pinned pipelines were preloaded for every server process.
+            self.pipelines.clear(keep_pinned=True)
+            return None
+
+        if request_type not in ("warm_up", "run"):
+            raise ValueError(f"Unknown request type: {request_type}")
+        if "task" not in data:
+            raise ValueError(f"Missing the task of a {request_type} request")
+
+        task = InferenceTask.from_dict(data["task"])
+        if request_type == "warm_up":
+            with self._inference_lock:
+                if disconnected():
+                    return self._drop(request_type, task)
+                warm_up(self._get_pipeline(task))
+                self.pipelines.pin(task.pipeline_key)
+            return None
+
+        with self._inference_lock:
+            if disconnected():
+                return self._drop(request_type, task)
+            results = run_task(task, self._get_pipeline(task))
+        return [result.to_dict() for result in results]
+
+    def _drop(self, request_type: str, task: InferenceTask) -> None:
+        logger.warning(
+            f"Dropping a {request_type} request for {task.model_location}, "
+            "as its client stopped waiting"
+        )
+
+    def _get_pipeline(self, task: InferenceTask) -> ASRPipeline:
+        return self.pipelines.get(task.pipeline_key, lambda: build_task_pipeline(task))
+
+
+class _InferenceHandler(socketserver.StreamRequestHandler):
+    server: InferenceServer
+
+    def handle(self) -> None:
+        try:
+            data = json.loads(self.rfile.readline())
+            result = self.server.handle_request_data(data, self._disconnected)
+            response = {"result": result}
+        except Exception as e:
+            logger.error(f"Error handling inference request: {e}")
+            response = {"error": str(e)}
+
+        try:
+            self.wfile.write((json.dumps(response) + "\n").encode())
+        except OSError:
+            # The client timed out, so there's no one to respond to.
+            pass
+
+    def _disconnected(self) -> bool:
+        """Whether the client has closed its end of the connection. Clients
+        send nothing after their request, so a readable socket means it's
+        been closed."""
+        try:
+            readable, _, _ = select.select([self.connection], [], [], 0)
+            return bool(readable) and self.connection.recv(1, socket.MSG_PEEK) == b""
+        except OSError:
+            return True
+
+
+class InferenceClient:
+    """Sends inference tasks to an inference server over its Unix socket.
+
+    Requests fail if there's no response within the timeout, in seconds,
+    which for a run includes transcribing. None or 0 waits for as long as
+    inference takes.
+    """
+
+    def __init__(
+        self, socket_path: Path, timeout: Optional[float] = DEFAULT_REQUEST_TIMEOUT_S
+    ) -> None:
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def run(self, task: InferenceTask) -> List[InferenceResult]:
+        """Runs a task on the server, blocking until it's done.
+
+        Returns:
+            The inference results for each of the task's audio files.
+        """
+        results = self._request({"type": "run", "task": task.to_dict()})
+        return [InferenceResult.from_dict(data) for data in results]
+
+    def warm_up(self, task: InferenceTask) -> None:
+        """Builds, pins and warms up the task's pipeline on the server."""
+        self._request({"type": "warm_up", "task": task.to_dict()})
+
+    def clear(self) -> None:
+        """Frees the server's unpinned pipelines. Pinned ones are kept, as
+        they're shared by every server process."""
+        self._request({"type": "clear"})
+
+    def info(self) -> Dict[str, Any]:
+        return self._request({"type": "info"})
+
+    def _request(self, data: Dict[str, Any]) -> Any:
+        """Sends a request to the server, and returns its result.
+
+        Raises:
+            InferenceError: If the server fails the request, or doesn't
+                respond within the timeout.
+        """
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+                # A hung server mustn't block transcription workers forever.
+                connection.settimeout(self.timeout or None)
+                connection.connect(str(self.socket_path))
+                connection.sendall((json.dumps(data) + "\n").encode())
+                with connection.makefile("rb") as response_file:
+                    response = json.loads(response_file.readline())
+        except TimeoutError as e:
+            raise InferenceError(
+                f"No response from the inference server in {self.timeout}s"
+            ) from e
+
+        if "error" in response:
+            raise InferenceError(response["error"])
+        return response["result"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--socket",
+        default=os.environ.get("INFERENCE_SOCKET"),
+        help="The path of the Unix socket to listen on.",
+    )
+    parser.add_argument(
+        "--pipeline-cache-bytes",
+        type=int,
+        default=int(
+            os.environ.get("PIPELINE_CACHE_BYTES", DEFAULT_PIPELINE_CACHE_BYTES)
+        ),
+        help="The memory budget for loaded pipelines, or 0 for no limit.",
+    )
+    parser.add_argument(
+        "--pin",
+        action="append",
+        default=[],
+        help="A model location to never evict from the cache. May be repeated.",
+    )
+    args = parser.parse_args()
+    if not args.socket:
+        parser.error("A socket path is required, via --socket or INFERENCE_SOCKET.")
+
+    socket_path = Path(args.socket)
+    with InferenceServer(socket_path, args.pipeline_cache_bytes, args.pin) as server:
+        logger.info(f"Serving inference on {socket_path}")
+        try:
+            server.serve_forever()
+        finally:
+            socket_path.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,12 @@ from pathlib import Path
 
 from flask import Flask
 
+from server.archives import DEFAULT_ARCHIVE_CACHE_BYTES, ArchiveCache
+from server.blob_store import BlobStore
 from server.managers import DatasetManager, ModelManager, TranscriptionManager
+from server.managers.model_manager import TrainingSettings
+from server.managers.transcription_manager import TranscriptionSettings
+from server.preprocessing import DEFAULT_PREPROCESSING_WORKERS
 
 FALLBACK_PATH = Path("/tmp/elpis")
 INTERFACE_KEY = "INTERFACE"
@@ -15,19 +20,41 @@ INTERFACE_KEY = "INTERFACE"
 class Interface:
     path: Path
     overwrite: bool = False
+    training_settings: TrainingSettings = field(default_factory=TrainingSettings)
+    transcription_settings: TranscriptionSettings = field(
+        default_factory=TranscriptionSettings
+    )
+    archive_cache_bytes: int = DEFAULT_ARCHIVE_CACHE_BYTES
+    preprocessing_workers: int = DEFAULT_PREPROCESSING_WORKERS
+    link_dataset_files: bool = True
     dataset_manager: DatasetManager = field(init=False)
     model_manager: ModelManager = field(init=False)
     transcription_manager: TranscriptionManager = field(init=False)
+    archives: ArchiveCache = field(init=False)
+    blobs: BlobStore = field(init=False)
 
     def __post_init__(self):
+        self.blobs = BlobStore(self.path / "blobs")
         self.dataset_manager = DatasetManager(
-            data_dir=self.path, overwrite=self.overwrite
+            data_dir=self.path,
+            overwrite=self.overwrite,
+            preprocessing_workers=self.preprocessing_workers,
+            link_files=self.link_dataset_files,
+        )
+        self.model_manager = ModelManager(
+            data_dir=self.path,
+            overwrite=self.overwrite,
+            settings=self.training_settings,
+            blobs=self.blobs,
         )
-        self.model_manager = ModelManager(data_dir=self.path, overwrite=self.overwrite)
         self.transcription_manager = TranscriptionManager(
             data_dir=self.path,
             models_dir=self.model_manager.folder,
             overwrite=self.overwrite,
+            settings=self.transcription_settings,
+        )
+        self.archives = ArchiveCache(
+            self.path / "cache" / "archives", self.archive_cache_bytes
         )
 
     @classmethod
@@ -39,3 +66,4 @@ class Interface:
         self.dataset_manager.reset()
         self.model_manager.reset()
         self.transcription_manager.reset()
+        self.archives.clear()
@@ -0,0 +1,98 @@
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+
+class JobQueue:
+    """A thread-safe queue of job keys, whose waiting jobs can be inspected
+    and removed.
+
+    Keys with a higher priority are served first, and keys of equal priority
+    in the order they were added.
+    """
+
+    def __init__(self) -> None:
+        self._keys: Deque[str] = deque()
+        self._priorities: Dict[str, int] = {}
+        self._condition = threading.Condition()
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._keys)
+
+    def __contains__(self, key: str) -> bool:
+        with self._condition:
+            return key in self._keys
+
+    def put(self, key: str, priority: int = 0) -> None:
+        """Adds a key behind any waiting keys of the same or higher priority,
+        if it isn't already waiting."""
+        with self._condition:
+            if key in self._keys:
+                return
+
+            index = len(self._keys)
+            for position, other in enumerate(self._keys):
+                if self._priorities[other] < priority:
+                    index = position
+                    break
+
+            self._keys.insert(index, key)
+            self._priorities[key] = priority
+            self._condition.notify()
+
+    def priority(self, key: str) -> Optional[int]:
+        """Returns the priority of a waiting key, or None if it isn't waiting."""
+        with self._condition:
+            return self._priorities.get(key)
+
+    def get(self, timeout: Optional[float] = None) -> Optional[str]:
+        """Removes and returns the key at the front of the queue, blocking
+        until one is available.
+
+        Returns:
+            The next key, or None if the timeout elapsed first.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: len(self._keys) > 0, timeout):
+                return None
+            key = self._keys.popleft()
+            self._priorities.pop(key)
+            return key
+
+    def take(self, predicate: Callable[[str], bool], limit: int) -> List[str]:
+        """Removes and returns up to limit waiting keys which satisfy the
+        predicate, in queue order."""
+        with self._condition:
+            taken = [key for key in self._keys if predicate(key)][: max(0, limit)]
+            for key in taken:
+                self._keys.remove(key)
+                self._priorities.pop(key)
+            return taken
+
+    def remove(self, key: str) -> bool:
+        """Removes a waiting key from the queue. Returns true iff it was found."""
+        with self._condition:
+            try:
+                self._keys.remove(key)
+            except ValueError:
+                return False
+            self._priorities.pop(key)
+            return True
+
+    def position(self, key: str) -> Optional[int]:
+        """Returns the zero-based position of a waiting key, or None if it
+        isn't in the queue."""
+        with self._condition:
+            try:
+                return self._keys.index(key)
+            except ValueError:
+                return None
+
+    def clear(self) -> List[str]:
+        """Empties the queue, returning the keys which were waiting."""
+        with self._condition:
+            keys = list(self._keys)
+            self._keys.clear()
+            self._priorities.clear()
+            return keys
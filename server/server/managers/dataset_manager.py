@@ -1,14 +1,35 @@
+from __future__ import annotations
+
 import json
 import shutil
+import threading
+import time
+from dataclasses import dataclass
 from enum import Enum
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Set
 
 from elpis.datasets.dataset import Dataset
-from elpis.datasets.preprocessing import has_finished_processing, process_batch
+from elpis.datasets.preprocessing import has_finished_processing
+from loguru import logger
 from typing_extensions import override
 
+from server.dataset_manifest import MANIFEST_FILE, DatasetManifest, ManifestSummary
+from server.files import Placement, copy_file_verified, link_or_copy
+from server.job_queue import JobQueue
 from server.managers.manager import Manager, ManagerType, auto_save
+from server.preprocessing import (
+    DEFAULT_PREPROCESSING_WORKERS,
+    BatchReport,
+    PreprocessingError,
+    PreprocessingPool,
+    PreprocessingReport,
+)
+
+PREPROCESSING_REPORT_FILE = "preprocessing.json"
+# How often to save the manifest while preprocessing, so that an interrupted
+# ingestion resumes where it left off.
+MANIFEST_SAVE_INTERVAL_S = 5.0
 
 
 class FolderType(Enum):
@@ -16,11 +37,92 @@ class FolderType(Enum):
     Processed = "processed"
 
 
+class DatasetState(Enum):
+    QUEUED = "queued"
+    PROCESSING = "processing"
+    READY = "ready"
+    ERROR = "error"
+
+
+@dataclass
+class Ingestion:
+    """The progress of preprocessing a dataset's files."""
+
+    state: DatasetState = DatasetState.QUEUED
+    total: int = 0  # Transcription files to process
+    processed: int = 0
+    failed: int = 0
+    queued_at: Optional[float] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    # From the dataset's manifest, once processed.
+    summary: Optional[ManifestSummary] = None
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        """Estimates the time left from the average time per file so far."""
+        if self.state != DatasetState.PROCESSING or self.started_at is None:
+            return None
+        done = self.processed + self.failed
+        if done == 0:
+            return None
+        elapsed = time.time() - self.started_at
+        return elapsed / done * (self.total - done)
+
+    def progress(self) -> Dict[str, Any]:
+        done = self.processed + self.failed
+        return self.to_dict() | {
+            "fraction": done / self.total if self.total else None,
+            "eta_seconds": self.eta_seconds,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = dict(self.__dict__)
+        result["state"] = self.state.value
+        if self.summary is not None:
+            result["summary"] = self.summary.__dict__
+        return result
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> Ingestion:
+        summary = data.get("summary")
+        return cls(
+            **(
+                data
+                | {
+                    "state": DatasetState(data["state"]),
+                    "summary": ManifestSummary(**summary) if summary else None,
+                }
+            )
+        )
+
+
 class DatasetManager(Manager):
     _datasets: Dict[str, Dataset] = {}
+    _ingestions: Dict[str, Ingestion] = {}
+
+    def __init__(
+        self,
+        data_dir: Path,
+        overwrite: bool = False,
+        preprocessing_workers: int = DEFAULT_PREPROCESSING_WORKERS,
+        link_files: bool = True,
+    ) -> None:
+        self.preprocessing = PreprocessingPool(preprocessing_workers)
+        # Whether to hardlink or reflink files into datasets, rather than
+        # copying them, where the filesystem allows.
+        self.link_files = link_files
+
+        # Loading the state requeues datasets, so the queue must exist first.
+        self._queue = JobQueue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+        self._uploading: Set[str] = set()
 
-    def __init__(self, data_dir: Path, overwrite: bool = False) -> None:
         super().__init__(ManagerType.DATASET.value, data_dir, overwrite)
+        if len(self._queue) > 0:
+            self._start_worker()
 
     def __contains__(self, name: str) -> bool:
         return name in self.datasets
@@ -33,9 +135,21 @@ class DatasetManager(Manager):
     def datasets(self, value: Dict[str, Dataset]):
         DatasetManager._datasets = value
 
+    @property
+    def ingestions(self) -> Dict[str, Ingestion]:
+        return DatasetManager._ingestions
+
+    @ingestions.setter
+    def ingestions(self, value: Dict[str, Ingestion]):
+        DatasetManager._ingestions = value
+
     @override
     def serialize(self):
-        return {dataset.name: dataset.to_dict() for dataset in self._datasets.values()}
+        return {
+            dataset.name: dataset.to_dict()
+            | {"ingestion": self.ingestion(dataset.name).to_dict()}
+            for dataset in list(self.datasets.values())
+        }
 
     @override
     def load_state(self, state_file: Path) -> None:
@@ -45,16 +159,87 @@ class DatasetManager(Manager):
         self.datasets = {
             name: Dataset.from_dict(dataset) for (name, dataset) in raw_datasets.items()
         }
+        self.ingestions = {
+            name: Ingestion.from_dict(dataset["ingestion"])
+            for (name, dataset) in raw_datasets.items()
+            if "ingestion" in dataset
+        }
+
+        # Ingestions interrupted by a restart have their raw files saved, so
+        # can be processed again.
+        self._queue.clear()
+        for name, ingestion in self.ingestions.items():
+            if ingestion.state == DatasetState.READY:
+                self._reload_repaired_manifest(name)
+            if ingestion.state in (DatasetState.QUEUED, DatasetState.PROCESSING):
+                ingestion.state = DatasetState.QUEUED
+                self._queue.put(name)
+
+    def _reload_repaired_manifest(self, name: str) -> None:
+        """Picks up manifests repaired while the server was down, queueing
+        their datasets to process the batches they dropped."""
+        ingestion = self.ingestions[name]
+        path = self.manifest_path(name)
+        if ingestion.summary is None or ingestion.finished_at is None:
+            return
+        if not path.is_file() or path.stat().st_mtime <= ingestion.finished_at:
+            return
+
+        manifest = DatasetManifest.load(path)
+        ingestion.summary = manifest.summary() if manifest is not None else None
+        if ingestion.summary is None or not ingestion.summary.complete:
+            logger.info(f"Reprocessing dataset {name}, as its manifest changed")
+            ingestion.state = DatasetState.QUEUED
 
     @override
     def reset(self) -> None:
         super().reset()
+        self._queue.clear()
         self.datasets = {}
+        self.ingestions = {}
+
+    def ingestion(self, name: str) -> Ingestion:
+        """Returns the progress of preprocessing a dataset. Datasets added
+        before ingestion was tracked are ready."""
+        if name not in self.ingestions:
+            return Ingestion(DatasetState.READY)
+        return self.ingestions[name]
+
+    def is_ready(self, name: str) -> bool:
+        return name in self and self.ingestion(name).state == DatasetState.READY
 
     def dataset_folder(self, name: str, folder_type: FolderType) -> Path:
         return self.folder / name / folder_type.value
 
+    def manifest_path(self, name: str) -> Path:
+        return self.folder / name / MANIFEST_FILE
+
+    def preprocessing_report_path(self, name: str) -> Path:
+        return self.folder / name / PREPROCESSING_REPORT_FILE
+
+    def preprocessing_report(self, name: str) -> Optional[Dict[str, Any]]:
+        """Returns the timings and failures of each batch from when the
+        dataset was last preprocessed, if it has been."""
+        try:
+            with open(self.preprocessing_report_path(name)) as report:
+                return json.load(report)
+        except (OSError, ValueError):
+            return None
+
+    def summary(self, name: str) -> Optional[ManifestSummary]:
+        """Returns the number and size of a dataset's raw and processed
+        files, if it was processed with a manifest."""
+        return self.ingestion(name).summary if name in self else None
+
     def is_dataset_processed(self, name: str) -> bool:
+        if not self.is_ready(name):
+            return False
+
+        summary = self.summary(name)
+        if summary is not None:
+            return summary.complete
+
+        # Datasets processed before manifests were kept are checked on disk.
         raw_folder = self.dataset_folder(name, FolderType.Raw)
         processed_folder = self.dataset_folder(name, FolderType.Processed)
         for folder in [raw_folder, processed_folder]:
@@ -68,36 +253,277 @@ class DatasetManager(Manager):
 
     @auto_save
     def add_dataset(self, dataset: Dataset, overwrite=True) -> None:
+        """Copies a dataset's files into its raw folder, and preprocesses
+        them into its processed folder before returning.
+
+        Raises:
+            PreprocessingError: If any of its files couldn't be preprocessed,
+                in which case the dataset isn't added.
+        """
         if overwrite and dataset.name in self:
             return
 
+        self._add(dataset)
+        report = self._preprocess(dataset.name)
+        if len(report.failures) > 0:
+            self.datasets.pop(dataset.name)
+            self.ingestions.pop(dataset.name)
+            raise PreprocessingError(report)
+
+    @auto_save
+    def ingest(self, dataset: Dataset) -> bool:
+        """Copies a dataset's files into its raw folder, and queues them to be
+        preprocessed in the background. The dataset is listed straight away,
+        with the state of its ingestion.
+
+        Returns:
+            False iff a dataset with the same name already exists.
+        """
+        if dataset.name in self:
+            return False
+
+        self._add(dataset)
+        self._start_worker()
+        self._queue.put(dataset.name)
+        return True
+
+    def reserve_upload(self, name: str) -> bool:
+        """Marks a new dataset as being uploaded, until it's released.
+
+        Returns:
+            False iff the dataset already exists or is being uploaded, in which
+            case the upload mustn't write into its folder.
+        """
+        with self._worker_lock:
+            if name in self or name in self._uploading:
+                return False
+            self._uploading.add(name)
+            return True
+
+    def release_upload(self, name: str) -> None:
+        with self._worker_lock:
+            self._uploading.discard(name)
+
+    @auto_save
+    def update_dataset(
+        self, name: str, files: List[Path], removed: Optional[List[str]] = None
+    ) -> None:
+        """Adds or replaces raw files in a dataset, and removes others, then
+        queues it to be preprocessed again in the background.
+
+        Only the transcription files and audio which are new or have changed
+        are processed, and the processed files of removed ones are deleted.
+
+        Raises:
+            ValueError: If the dataset is being processed, or the update would
+                leave it invalid.
+        """
+        dataset = self.datasets[name]
+        if self.ingestion(name).state in (DatasetState.QUEUED, DatasetState.PROCESSING):
+            raise ValueError(f"Dataset {name} is still being processed.")
+        if removed is None:
+            removed = []
+
+        raw_folder = self.dataset_folder(name, FolderType.Raw)
+        names = {file.name for file in dataset.files} - set(removed)
+        names |= {file.name for file in files}
+        updated = Dataset(
+            name=name,
+            # Validation groups files by name, so they must be sorted.
+            files=[raw_folder / file_name for file_name in sorted(names)],
+            cleaning_options=dataset.cleaning_options,
+            elan_options=dataset.elan_options,
+        )
+        if not updated.is_valid():
+            raise ValueError(f"Updating dataset {name} would leave it invalid.")
+
+        for file_name in removed:
+            (raw_folder / file_name).unlink(missing_ok=True)
+        self._place(name, files, raw_folder)
+
+        logger.info(f"Updating dataset {name}")
+        self.datasets[name] = updated
+        self.ingestions[name] = Ingestion(queued_at=time.time())
+        self._start_worker()
+        self._queue.put(name)
+
+    @auto_save
+    def verify_dataset(self, name: str, repair: bool = False) -> Dict[str, Any]:
+        """Compares a dataset's manifest with its files on disk.
+
+        Parameters:
+            name: The name of the dataset.
+            repair: Whether to fix any drift, by forgetting the batches whose
+                files have changed and queueing them to be processed again.
+                Datasets without a manifest are processed again from scratch.
+
+        Returns:
+            The drift found, and whether the dataset was queued to repair it.
+
+        Raises:
+            ValueError: If the dataset is being processed.
+        """
+        if self.ingestion(name).state in (DatasetState.QUEUED, DatasetState.PROCESSING):
+            raise ValueError(f"Dataset {name} is still being processed.")
+
+        manifest = DatasetManifest.load(self.manifest_path(name))
+        if manifest is None:
+            result: Dict[str, Any] = {"ok": False, "manifest": False}
+        else:
+            processed_folder = self.dataset_folder(name, FolderType.Processed)
+            drift = manifest.verify(
+                self.dataset_folder(name, FolderType.Raw), processed_folder
+            )
+            result = drift.to_dict() | {"manifest": True}
+            if repair and not drift.ok:
+                manifest.repair(drift, processed_folder)
+                manifest.save(self.manifest_path(name))
+
+        result["repairing"] = repair and not result["ok"]
+        if result["repairing"]:
+            logger.info(f"Repairing dataset {name}")
+            self.ingestions[name] = Ingestion(queued_at=time.time())
+            self._start_worker()
+            self._queue.put(name)
+        return result
+
+    def _add(self, dataset: Dataset) -> None:
         # Make sure folders exist
         raw_folder = self.dataset_folder(dataset.name, FolderType.Raw)
         processed_folder = self.dataset_folder(dataset.name, FolderType.Processed)
         for folder in [raw_folder, processed_folder]:
             folder.mkdir(exist_ok=True, parents=True)
 
-        # Copy files if needed
-        for file in dataset.files:
-            if file.parent != raw_folder:
-                shutil.copy2(file, raw_folder)
+        self._place(dataset.name, dataset.files, raw_folder)
 
         # Update dataset paths
         raw_files = list(map(lambda file: raw_folder / file.name, dataset.files))
         dataset.files = raw_files
 
-        # Preprocessing
-        batches = dataset.to_batches()
-        for batch in batches:
-            process_batch(batch=batch, output_dir=processed_folder)
-
+        self.ingestions[dataset.name] = Ingestion(queued_at=time.time())
         self.datasets[dataset.name] = dataset
 
+    def _place(self, name: str, files: List[Path], raw_folder: Path) -> None:
+        """Puts files into a dataset's raw folder, sharing their data with the
+        originals where possible."""
+        placements = {placement: 0 for placement in Placement}
+        for file in files:
+            if file.parent == raw_folder:
+                continue
+            if self.link_files:
+                placements[link_or_copy(file, raw_folder / file.name)] += 1
+            else:
+                copy_file_verified(file, raw_folder / file.name)
+                placements[Placement.COPY] += 1
+
+        counts = ", ".join(
+            f"{count} by {placement.value}" for placement, count in placements.items()
+        )
+        logger.info(f"Added files to dataset {name}: {counts}")
+
+    def _start_worker(self) -> None:
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._work, name="dataset-worker", daemon=True
+                )
+                self._worker.start()
+
+    def _work(self) -> None:
+        while True:
+            name = self._queue.get()
+            if name is None or name not in self.datasets:
+                continue
+
+            try:
+                self._preprocess(name)
+            except Exception as e:
+                logger.error(f"Error ingesting dataset: {name}")
+                logger.error(e)
+                self.ingestion(name).state = DatasetState.ERROR
+                self.ingestion(name).error = str(e)
+
+            # Clean up after datasets deleted while being processed.
+            if name not in self.datasets:
+                shutil.rmtree(self.folder / name, ignore_errors=True)
+            self.save()
+
+    def _preprocess(self, name: str) -> PreprocessingReport:
+        """Preprocesses the raw files of a dataset which have been added or
+        changed since it was last processed, tracking its progress."""
+        dataset = self.datasets[name]
+        raw_folder = self.dataset_folder(name, FolderType.Raw)
+        processed_folder = self.dataset_folder(name, FolderType.Processed)
+        # Loaded datasets only have the names of their files.
+        dataset.files = [raw_folder / file.name for file in dataset.files]
+
+        ingestion = self.ingestion(name)
+        ingestion.state = DatasetState.PROCESSING
+        ingestion.processed = ingestion.failed = 0
+        ingestion.started_at = time.time()
+        ingestion.error = None
+        self.save()
+
+        manifest = DatasetManifest.load(self.manifest_path(name))
+        if manifest is None:
+            # Processed files without a manifest can't be traced back to
+            # their inputs, so start again.
+            manifest = DatasetManifest()
+            shutil.rmtree(processed_folder, ignore_errors=True)
+            processed_folder.mkdir(parents=True)
+
+        batches, stale = manifest.plan(list(dataset.to_batches()))
+        for batch_name in stale:
+            manifest.remove_outputs(batch_name, processed_folder)
+        ingestion.total = len(batches)
+
+        pending = {batch.transcription_file.name: batch for batch in batches}
+        last_save = time.monotonic()
+
+        def on_progress(batch: BatchReport) -> None:
+            nonlocal last_save
+            if batch.error is None:
+                ingestion.processed += 1
+                manifest.record(
+                    pending[batch.transcription_file], batch.outputs, processed_folder
+                )
+            else:
+                ingestion.failed += 1
+
+            if time.monotonic() - last_save > MANIFEST_SAVE_INTERVAL_S:
+                manifest.save(self.manifest_path(name))
+                last_save = time.monotonic()
+
+        logger.info(
+            f"Preprocessing {len(batches)} files of dataset {name}, "
+            f"removing the outputs of {len(stale)}"
+        )
+        try:
+            report = self.preprocessing.process(batches, processed_folder, on_progress)
+        finally:
+            if self.manifest_path(name).parent.is_dir():
+                manifest.save(self.manifest_path(name))
+        if self.preprocessing_report_path(name).parent.is_dir():
+            with open(self.preprocessing_report_path(name), "w") as report_file:
+                json.dump(report.to_dict(), report_file)
+
+        ingestion.summary = manifest.summary()
+        ingestion.finished_at = time.time()
+        if len(report.failures) > 0:
+            ingestion.state = DatasetState.ERROR
+            ingestion.error = str(PreprocessingError(report))
+        else:
+            ingestion.state = DatasetState.READY
+            logger.success(f"Dataset {name} is ready")
+        return report
+
     @auto_save
     def delete_dataset(self, name: str) -> None:
+        self._queue.remove(name)
         folder = self.folder / name
         if folder.exists() and folder.is_dir():
             shutil.rmtree(folder)
 
         if name in self.datasets:
             self.datasets.pop(name)
+        self.ingestions.pop(name, None)
@@ -1,5 +1,6 @@
 import json
 import shutil
+import threading
 from abc import ABC, abstractmethod
 from enum import Enum
 from functools import wraps
@@ -31,6 +32,7 @@ class Manager(ABC):
         self.name = name
         self.data_dir = data_dir
         self.data_dir.mkdir(parents=True, exist_ok=True)
+        self._save_lock = threading.Lock()
 
         if not overwrite and self.state_file.exists():
             self.load_state(self.state_file)
@@ -56,8 +58,10 @@ class Manager(ABC):
         ...
 
     def save(self) -> None:
-        with open(self.state_file, "w") as state_file:
-            json.dump(self.serialize(), state_file)
+        # Background workers may save concurrently with request threads.
+        with self._save_lock:
+            with open(self.state_file, "w") as state_file:
+                json.dump(self.serialize(), state_file)
 
     @abstractmethod
     def reset(self) -> None:
@@ -1,16 +1,95 @@
+import atexit
+import copy
 import json
 import shutil
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, field
+from enum import Enum
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
 
-from elpis.trainer import run_job
+from elpis.datasets.processing import create_local_dataset
+from elpis.models import Job
+from elpis.transcriber.transcribe import build_pipeline
 from loguru import logger
 from typing_extensions import override
 
+from server.blob_store import BlobStore
+from server.job_queue import JobQueue
 from server.managers.manager import Manager, ManagerType, auto_save
+from server.metrics import DEFAULT_METRICS_POINTS, MetricsCache
 from server.named_job import JobStatus, NamedJob
+from server.quantization import (
+    DEFAULT_EVAL_SAMPLES,
+    compare,
+    load_report,
+    quantize,
+    quantized_folder,
+    save_quantized,
+    save_report,
+)
+from server.training import (
+    PROGRESS_FILE,
+    TrainingLimits,
+    available_cpus,
+    describe_exit,
+    latest_checkpoint,
+    read_progress,
+    start_training,
+    stop_training,
+)
+from server.uploads import install_folder
 
 LOGS_FILE = "logs.txt"
+TRAINING_JOB_FILE = "training_job.json"
+DEFAULT_TRAINING_CONCURRENCY = 1
+# With concurrency 0, train as many models at once as the cores allow, with
+# this many threads each unless set otherwise.
+AUTO_TRAINING_THREADS = 4
+# Folders of models downloaded from the Hugging Face hub, in the cache.
+HUB_CACHE_PATTERN = "models--*"
+# Give up on resuming a model which keeps being interrupted, in case it's
+# what brings the server down.
+MAX_TRAINING_INTERRUPTIONS = 3
+
+
+@dataclass
+class TrainingSettings:
+    """Options for how the model manager runs its training jobs."""
+
+    concurrency: int = DEFAULT_TRAINING_CONCURRENCY  # 0 to fit to the cores
+    threads: Optional[int] = None  # Intra-op threads per training process
+    memory_bytes: Optional[int] = None  # Memory ceiling per training process
+
+
+class QuantizationState(Enum):
+    QUEUED = "queued"
+    QUANTIZING = "quantizing"
+    DONE = "done"
+    ERROR = "error"
+
+
+@dataclass
+class Quantization:
+    """The progress of building a model's int8 variant in the background."""
+
+    max_samples: int = DEFAULT_EVAL_SAMPLES
+    state: QuantizationState = QuantizationState.QUEUED
+    queued_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return self.state in (QuantizationState.QUEUED, QuantizationState.QUANTIZING)
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = dict(self.__dict__)
+        result["state"] = self.state.value
+        return result
 
 
 class ModelManager(Manager):
@@ -20,8 +99,47 @@ class ModelManager(Manager):
         self,
         data_dir: Path,
         overwrite: bool = False,
+        settings: Optional[TrainingSettings] = None,
+        blobs: Optional[BlobStore] = None,
     ) -> None:
+        self.settings = settings if settings is not None else TrainingSettings()
+        self.blobs = blobs
+
+        # Loading the state requeues jobs, so the queue must exist first.
+        self._queue = JobQueue()
+        self._concurrency, self._threads = self._training_slots()
+        self._workers: List[threading.Thread] = []
+        self._training: List[str] = []
+        self._workers_lock = threading.Lock()
+        self._processes: Dict[str, subprocess.Popen] = {}
+        self._cancelled: Set[str] = set()
+        # Set when the server shuts down, so stopped training resumes after.
+        self._stopping = False
+        self._uploading: Set[str] = set()
+        # Set once the files of an installed model have been deduplicated.
+        self._deduplicated: Dict[str, threading.Event] = {}
+        # Quantizing evaluates models for minutes, so has its own worker.
+        self._quantizations: Dict[str, Quantization] = {}
+        self._quantization_queue = JobQueue()
+        self._quantization_worker: Optional[threading.Thread] = None
+        self._metrics = MetricsCache()
+        atexit.register(self._stop_processes)
+
         super().__init__(ManagerType.MODEL.value, data_dir, overwrite)
+        if len(self._queue) > 0:
+            self._start_workers()
+
+    def _training_slots(self) -> Tuple[int, Optional[int]]:
+        """Returns how many models to train at once, and the threads to give
+        each, dividing the cores between them so that they don't contend."""
+        cpus = available_cpus()
+        threads = self.settings.threads
+        concurrency = self.settings.concurrency
+        if concurrency <= 0:
+            concurrency = max(1, cpus // (threads or AUTO_TRAINING_THREADS))
+        if threads is None and concurrency > 1:
+            threads = max(1, cpus // concurrency)
+        return concurrency, threads
 
     def __contains__(self, model_name: str) -> bool:
         return model_name in self.models
@@ -47,9 +165,36 @@ class ModelManager(Manager):
             name: NamedJob.from_dict(job) for (name, job) in raw_models.items()
         }
 
+        for job in self.models.values():
+            if job.status == JobStatus.TRAINING:
+                self._requeue_interrupted(job)
+
+        # Requeue interrupted models ahead of those of the same priority.
+        self._queue.clear()
+        queued = [job for job in self.models.values() if job.status == JobStatus.QUEUED]
+        for job in sorted(queued, key=lambda job: (not job.resume, job.queued_at or 0)):
+            self._queue.put(job.name, job.priority)
+
+    def _requeue_interrupted(self, job: NamedJob) -> None:
+        job.interruptions += 1
+        if job.interruptions > MAX_TRAINING_INTERRUPTIONS:
+            logger.error(
+                f"Training of {job.name} was interrupted {job.interruptions} times, "
+                "so won't be resumed"
+            )
+            job.status = JobStatus.ERROR
+            return
+
+        logger.warning(f"Training of {job.name} was interrupted, requeueing it")
+        job.status = JobStatus.QUEUED
+        job.resume = True
+
     @override
     def reset(self) -> None:
         super().reset()
+        if self.blobs is not None:
+            self.blobs.release_folder(self.folder)
+        self._queue.clear()
         self.models = {}
 
     def model_folder(self, model_name: str) -> Path:
@@ -58,6 +203,9 @@ class ModelManager(Manager):
     def logs_path(self, model_name: str) -> Path:
         return self.model_folder(model_name) / LOGS_FILE
 
+    def progress_path(self, model_name: str) -> Path:
+        return self.model_folder(model_name) / PROGRESS_FILE
+
     @auto_save
     def add_job(self, job: NamedJob, overwrite=True) -> None:
         if overwrite and job.name in self:
@@ -69,38 +217,289 @@ class ModelManager(Manager):
 
     @auto_save
     def delete_model(self, model_name: str) -> None:
+        self.cancel(model_name)
         folder = self.model_folder(model_name)
         if folder.exists() and folder.is_dir():
             shutil.rmtree(folder)
+        if self.blobs is not None:
+            self.blobs.release_folder(folder)
+        self._metrics.remove(folder)
 
+        self._queue.remove(model_name)
         if model_name in self.models:
             self.models.pop(model_name)
 
     @auto_save
-    def train(self, model_name: str) -> None:
+    def train(self, model_name: str, priority: int = 0) -> Optional[JobStatus]:
+        """Queues a model to be trained once a training slot is free.
+
+        Parameters:
+            model_name: The name of the model to train.
+            priority: Models with higher priorities are trained first.
+
+        Returns:
+            The status of the model, or None if it couldn't be found.
+        """
         if model_name not in self.models:
             return
 
         job = self.models[model_name]
-        if job.status == JobStatus.TRAINING:
-            logger.info(f"Model: {model_name} is already training!")
-            return
+        if job.status in (JobStatus.QUEUED, JobStatus.TRAINING):
+            logger.info(f"Model: {model_name} is already queued or training!")
+            return job.status
+
+        job.status = JobStatus.QUEUED
+        job.priority = priority
+        job.queued_at = time.time()
+        with self._workers_lock:
+            self._cancelled.discard(model_name)
+
+        self._start_workers()
+        self._queue.put(model_name, priority)
+        return job.status
+
+    @auto_save
+    def cancel(self, model_name: str) -> bool:
+        """Removes a queued model from the training queue, or stops its
+        training process if it's already training.
+
+        Returns:
+            True iff the model was queued or training.
+        """
+        if self._queue.remove(model_name):
+            logger.info(f"Cancelled training model: {model_name}")
+            self.models[model_name].status = JobStatus.CANCELLED
+            return True
+
+        # A queued model which isn't waiting has been taken by a worker, which
+        # may not have started its training process yet.
+        with self._workers_lock:
+            status = self.models[model_name].status
+            if status not in (JobStatus.QUEUED, JobStatus.TRAINING):
+                return False
+            self._cancelled.add(model_name)
+            process = self._processes.get(model_name)
+
+        # The training worker sets the status once the process has exited, and
+        # stops a process started after this itself.
+        logger.info(f"Stopping training model: {model_name}")
+        if process is not None:
+            stop_training(process)
+        return True
+
+    def sweep(self, sweep_name: str) -> List[NamedJob]:
+        """Returns the models created by a sweep, in the order of its grid."""
+        return [job for job in self.models.values() if job.sweep == sweep_name]
+
+    def metrics(
+        self, model_name: str, max_points: int = DEFAULT_METRICS_POINTS
+    ) -> Dict[str, Any]:
+        """Returns the metrics logged while training the model, as series of
+        at most max_points steps and values for each tag."""
+        return self._metrics.get(self.model_folder(model_name), max_points)
+
+    def progress(self, model_name: str) -> Optional[Dict[str, Any]]:
+        """Returns the step, epoch and fraction complete of the model's
+        latest training, if it has reported any."""
+        return read_progress(self.progress_path(model_name))
+
+    def queue_position(self, model_name: str) -> Optional[int]:
+        return self._queue.position(model_name)
+
+    def queue_info(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": len(self._queue),
+            "concurrency": self._concurrency,
+            "threads": self._threads,
+            "training": list(self._training),
+        }
+
+    def _start_workers(self) -> None:
+        with self._workers_lock:
+            self._workers = [worker for worker in self._workers if worker.is_alive()]
+            for index in range(len(self._workers), self._concurrency):
+                worker = threading.Thread(
+                    target=self._work,
+                    name=f"training-worker-{index}",
+                    daemon=True,
+                )
+                worker.start()
+                self._workers.append(worker)
+
+    def _work(self) -> None:
+        while True:
+            model_name = self._queue.get()
+            if model_name is None or model_name not in self.models:
+                continue
+
+            with self._workers_lock:
+                self._training.append(model_name)
+            try:
+                self._train(model_name)
+            finally:
+                with self._workers_lock:
+                    self._training.remove(model_name)
+                self.save()
+
+    def _train(self, model_name: str) -> None:
+        """Trains a model in a child process, waiting for it to exit."""
+        job = self.models[model_name]
+        job_file = self.model_folder(model_name) / TRAINING_JOB_FILE
+        self.progress_path(model_name).unlink(missing_ok=True)
 
         try:
             logger.info(f"Begin training model: {model_name}")
             job.status = JobStatus.TRAINING
-            run_job(
-                job=job.job,
-                log_file=self.logs_path(model_name),
+            job.exit_code = None
+            self.save()
+
+            # Training rewrites files in place, which mustn't change blobs,
+            # so wait for any files still being linked to them first.
+            if self.blobs is not None:
+                with self._workers_lock:
+                    deduplicated = self._deduplicated.get(model_name)
+                if deduplicated is not None:
+                    deduplicated.wait()
+                self.blobs.detach_folder(self.model_folder(model_name))
+
+            self._training_job(job).save(job_file)
+            limits = TrainingLimits(self._threads, self.settings.memory_bytes)
+            process = start_training(
+                job_file,
+                self.logs_path(model_name),
+                self.progress_path(model_name),
+                limits,
             )
+            with self._workers_lock:
+                self._processes[model_name] = process
+                cancelled = model_name in self._cancelled
+            if cancelled:
+                # Cancelled before the process could be stopped by cancel.
+                stop_training(process)
+            job.exit_code = process.wait()
         except Exception as e:
             logger.error(f"Error training model: {model_name}")
             logger.error(f"Error: {e}")
             job.status = JobStatus.ERROR
             return
+        finally:
+            with self._workers_lock:
+                self._processes.pop(model_name, None)
+            job.resume = False
+
+        if self._stopping:
+            # Leave it training, so that it's resumed when the server restarts.
+            logger.info(f"Stopped training model for shutdown: {model_name}")
+            return
+
+        with self._workers_lock:
+            cancelled = model_name in self._cancelled
+            self._cancelled.discard(model_name)
+        if cancelled:
+            logger.info(f"Cancelled training model: {model_name}")
+            job.status = JobStatus.CANCELLED
+            return
+
+        if job.exit_code != 0:
+            logger.error(f"Error training model: {model_name}")
+            logger.error(describe_exit(job.exit_code))
+            job.status = JobStatus.ERROR
+            return
 
         logger.success(f"Finished training model: {model_name}")
         job.status = JobStatus.FINISHED
+        job.interruptions = 0
+        self.deduplicate(model_name)
+
+    def reserve_upload(self, model_name: str) -> bool:
+        """Marks a model as being uploaded, until it's released.
+
+        Returns:
+            False iff the model is already being uploaded, in which case a
+            second upload mustn't install over it.
+        """
+        with self._workers_lock:
+            if model_name in self._uploading:
+                return False
+            self._uploading.add(model_name)
+            return True
+
+    def release_upload(self, model_name: str) -> None:
+        with self._workers_lock:
+            self._uploading.discard(model_name)
+
+    def install(self, model_name: str, staging: Path) -> None:
+        """Replaces a model's folder with an extracted upload, then
+        deduplicates its files in the background."""
+        folder = self.model_folder(model_name)
+        if self.blobs is not None:
+            self.blobs.release_folder(folder)
+        install_folder(staging, folder)
+        self._metrics.remove(folder)
+
+        if self.blobs is not None:
+            deduplicated = threading.Event()
+            with self._workers_lock:
+                self._deduplicated[model_name] = deduplicated
+            threading.Thread(
+                target=self._deduplicate_installed,
+                args=(model_name, deduplicated),
+                name=f"deduplicate-{model_name}",
+                daemon=True,
+            ).start()
+
+    def _deduplicate_installed(
+        self, model_name: str, deduplicated: threading.Event
+    ) -> None:
+        try:
+            self.deduplicate(model_name)
+        finally:
+            deduplicated.set()
+            with self._workers_lock:
+                if self._deduplicated.get(model_name) is deduplicated:
+                    del self._deduplicated[model_name]
+
+    def deduplicate(self, model_name: str) -> int:
+        """Shares the large files of a model, and of the base models in the
+        hub cache, with any identical files stored before.
+
+        Returns:
+            The number of bytes no longer duplicated.
+        """
+        if self.blobs is None:
+            return 0
+
+        folders = [self.model_folder(model_name), *self.cache.glob(HUB_CACHE_PATTERN)]
+        try:
+            return sum(self.blobs.add_folder(folder) for folder in folders)
+        except OSError as e:
+            logger.error(f"Error deduplicating model files: {model_name}")
+            logger.error(e)
+            return 0
+
+    def _training_job(self, job: NamedJob) -> Job:
+        """Returns the job to train a model with, which continues from its
+        latest checkpoint if its training was interrupted."""
+        if not job.resume:
+            return job.job
+
+        training_job = copy.deepcopy(job.job)
+        output_dir = Path(training_job.training_args.output_dir)
+        checkpoint = latest_checkpoint(output_dir, remove_incomplete=True)
+        if checkpoint is None:
+            # Start again, rather than have the trainer refuse to write to a
+            # folder which has its partial outputs.
+            logger.info(f"No checkpoint to resume {job.name} from, starting again")
+            training_job.training_args.overwrite_output_dir = True
+        else:
+            logger.info(f"Resuming training {job.name} from {checkpoint.name}")
+            training_job.training_args.overwrite_output_dir = False
+        return training_job
+
+    def _stop_processes(self) -> None:
+        self._stopping = True
+        for process in list(self._processes.values()):
+            stop_training(process)
 
     def status(self, model_name: str) -> Optional[JobStatus]:
         if model_name not in self.models:
@@ -108,5 +507,108 @@ class ModelManager(Manager):
 
         return self.models[model_name].status
 
+    def quantize(
+        self, model_name: str, max_samples: int = DEFAULT_EVAL_SAMPLES
+    ) -> Dict[str, Any]:
+        """Builds an int8 variant of a trained model, which transcription will
+        use in its place, and compares the two on the model's held out set.
+
+        Returns:
+            The comparison of the accuracy and real time factor of each variant.
+        """
+        samples = self.held_out_samples(model_name, max_samples)
+        if len(samples) == 0:
+            raise ValueError(f"No held out samples to evaluate {model_name} with.")
+
+        folder = self.model_folder(model_name)
+        logger.info(f"Quantizing model: {model_name}")
+        full = build_pipeline(str(folder), cache_dir=self.cache)
+        quantized = quantize(build_pipeline(str(folder), cache_dir=self.cache))
+        report = compare(full, quantized, samples)
+        report["created_at"] = time.time()
+
+        save_quantized(quantized, folder)
+        save_report(folder, report)
+        logger.success(f"Quantized model: {model_name}")
+        return report
+
+    def queue_quantization(
+        self, model_name: str, max_samples: int = DEFAULT_EVAL_SAMPLES
+    ) -> Quantization:
+        """Queues a model to be quantized in the background, unless it already
+        is.
+
+        Returns:
+            The progress of quantizing the model.
+        """
+        with self._workers_lock:
+            quantization = self._quantizations.get(model_name)
+            if quantization is not None and quantization.active:
+                return quantization
+
+            quantization = Quantization(max_samples)
+            self._quantizations[model_name] = quantization
+            if (
+                self._quantization_worker is None
+                or not self._quantization_worker.is_alive()
+            ):
+                self._quantization_worker = threading.Thread(
+                    target=self._quantize_work, name="quantization-worker", daemon=True
+                )
+                self._quantization_worker.start()
+        self._quantization_queue.put(model_name)
+        return quantization
+
+    def quantization(self, model_name: str) -> Optional[Quantization]:
+        """Returns the progress of the model's latest quantization since the
+        server started, if any."""
+        return self._quantizations.get(model_name)
+
+    def _quantize_work(self) -> None:
+        while True:
+            model_name = self._quantization_queue.get()
+            quantization = self._quantizations.get(model_name or "")
+            if quantization is None:
+                continue
+
+            quantization.state = QuantizationState.QUANTIZING
+            quantization.started_at = time.time()
+            try:
+                self.quantize(model_name, quantization.max_samples)
+                quantization.state = QuantizationState.DONE
+            except Exception as e:
+                logger.error(f"Error quantizing model: {model_name}")
+                logger.error(e)
+                quantization.state = QuantizationState.ERROR
+                quantization.error = str(e)
+            quantization.finished_at = time.time()
+
+    def quantization_report(self, model_name: str) -> Optional[Dict[str, Any]]:
+        return load_report(self.model_folder(model_name))
+
+    def remove_quantized(self, model_name: str) -> None:
+        folder = quantized_folder(self.model_folder(model_name))
+        if folder.exists():
+            shutil.rmtree(folder)
+        if self.blobs is not None:
+            self.blobs.release_folder(folder)
+
+    def held_out_samples(
+        self, model_name: str, max_samples: int = DEFAULT_EVAL_SAMPLES
+    ) -> List[Tuple[Path, str]]:
+        """Returns pairs of audio files and transcripts from the split of the
+        model's dataset which was held out of training, or an empty list if it
+        wasn't trained on a local dataset."""
+        job = self.models[model_name].job
+        if not Path(job.data_args.dataset_name_or_path).is_dir():
+            return []
+
+        # Recreates the same seeded split the trainer used
+        dataset = create_local_dataset(job)["eval"]
+        dataset = dataset.select(range(min(max_samples, len(dataset))))
+        audio_column = job.data_args.audio_column_name
+        text_column = job.data_args.text_column_name
+        return [(Path(row[audio_column]), row[text_column]) for row in dataset]
+
     def upload_to_hugging_face_hub(self, model_name: str) -> None:
         ...
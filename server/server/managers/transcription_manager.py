@@ -3,19 +3,73 @@ from __future__ import annotations
 import base64
 import json
 import shutil
-from dataclasses import dataclass
+import threading
+import time
+from dataclasses import dataclass, field
 from enum import Enum
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple, Union
 
-from elpis.transcriber.results import build_elan, build_text
-from elpis.transcriber.transcribe import build_pipeline, transcribe
+from elpis.models import Annotation
 from loguru import logger
 from transformers import AutomaticSpeechRecognitionPipeline as ASRPipeline
 from typing_extensions import override
 
+from server.files import folder_fingerprint, hash_file
+from server.inference import (
+    DEFAULT_STREAM_OVERLAP_S,
+    DEFAULT_STREAM_WINDOW_S,
+    InferenceTask,
+    build_task_pipeline,
+    partial_results_file,
+    run_task,
+    warm_up,
+    write_partial_results,
+    write_results,
+)
+from server.inference_pool import InferencePool
+from server.inference_server import DEFAULT_REQUEST_TIMEOUT_S, InferenceClient
+from server.job_queue import JobQueue
 from server.managers import Manager
 from server.managers.manager import Manager, ManagerType, auto_save
+from server.managers.model_manager import LOGS_FILE
+from server.pipeline_cache import DEFAULT_PIPELINE_CACHE_BYTES, PipelineCache
+from server.quantization import quantized_weights
+from server.result_cache import DEFAULT_RESULT_CACHE_BYTES, ResultCache, hub_revision
+from server.vad import DEFAULT_VAD_THRESHOLD_DB
+
+DEFAULT_TRANSCRIPTION_WORKERS = 1
+DEFAULT_TRANSCRIPTION_BATCH_SIZE = 1
+
+
+@dataclass
+class TranscriptionSettings:
+    """Options for how the transcription manager runs its jobs."""
+
+    workers: int = DEFAULT_TRANSCRIPTION_WORKERS
+    batch_size: int = DEFAULT_TRANSCRIPTION_BATCH_SIZE
+    pipeline_cache_bytes: Optional[int] = DEFAULT_PIPELINE_CACHE_BYTES
+    pinned_models: List[str] = field(default_factory=list)
+    streaming: bool = False
+    stream_window_s: float = DEFAULT_STREAM_WINDOW_S
+    stream_overlap_s: float = DEFAULT_STREAM_OVERLAP_S
+    result_cache: bool = True
+    result_cache_bytes: Optional[int] = DEFAULT_RESULT_CACHE_BYTES
+    # If above 0, inference runs in this many worker processes instead of
+    # in the worker threads.
+    inference_processes: int = 0
+    # If set, inference is sent to the inference server listening on this
+    # socket instead, so that server processes can share its pipelines.
+    inference_socket: Optional[str] = None
+    # The most seconds to wait for the inference server to run a request, or
+    # None to wait for as long as it takes.
+    inference_timeout_s: Optional[float] = DEFAULT_REQUEST_TIMEOUT_S
+    # Whether to use the int8 variants of models which have them.
+    use_quantized_models: bool = True
+    # Whether to skip silence, by only transcribing the regions an energy based
+    # voice activity detector finds speech in. Not applied when streaming.
+    vad: bool = False
+    vad_threshold_db: float = DEFAULT_VAD_THRESHOLD_DB
 
 
 def transcription_key(model_location: str, audio_name: str) -> str:
@@ -31,10 +85,49 @@ class TranscriptionManager(Manager):
         data_dir: Path,
         models_dir: Path,
         overwrite: bool = False,
+        settings: Optional[TranscriptionSettings] = None,
     ) -> None:
+        self.settings = settings if settings is not None else TranscriptionSettings()
+
+        # Loading the state requeues jobs, so the queue must exist first.
+        self._queue = JobQueue()
+        # Keep enough threads to give every inference process some work.
+        self._num_workers = max(
+            1, self.settings.workers, self.settings.inference_processes
+        )
+        self._batch_size = max(1, self.settings.batch_size)
+        self._workers: List[threading.Thread] = []
+        self._busy_workers = 0
+        self._workers_lock = threading.Lock()
+
         super().__init__(ManagerType.TRANSCRIPTION.value, data_dir, overwrite)
         self._models_dir = models_dir
-        self._pipelines: Dict[str, ASRPipeline] = {}
+        self.pipelines = PipelineCache(
+            max_bytes=self.settings.pipeline_cache_bytes,
+            pinned=self.settings.pinned_models,
+        )
+        self._preload_states: Dict[str, PreloadState] = {}
+        self.results: Optional[ResultCache] = None
+        if self.settings.result_cache:
+            self.results = ResultCache(
+                self.cache / "results", max_bytes=self.settings.result_cache_bytes
+            )
+
+        self.inference_backend: Optional[Union[InferencePool, InferenceClient]] = None
+        if self.settings.inference_socket:
+            self.inference_backend = InferenceClient(
+                Path(self.settings.inference_socket),
+                timeout=self.settings.inference_timeout_s,
+            )
+        elif self.settings.inference_processes > 0:
+            self.inference_backend = InferencePool(
+                self.settings.inference_processes,
+                pipeline_cache_bytes=self.settings.pipeline_cache_bytes,
+                pinned=self.settings.pinned_models,
+            )
+
+        if len(self._queue) > 0:
+            self._start_workers()
 
     @property
     def transcriptions(self):
@@ -46,7 +139,7 @@ class TranscriptionManager(Manager):
 
     @override
     def serialize(self) -> List[Dict[str, Any]]:
-        return [job.to_dict() for job in self.transcriptions.values()]
+        return [job.to_dict() for job in list(self.transcriptions.values())]
 
     @override
     def load_state(self, state_file: Path) -> None:
@@ -55,14 +148,33 @@ class TranscriptionManager(Manager):
                 TranscriptionJob.from_dict(data) for data in json.load(transcriptions)
             ]
 
+        # Jobs interrupted by a restart are transcribed again, so are requeued
+        # along with those which were waiting, in the order they were queued.
+        # Uploads which were never queued are also waiting, so are left idle.
+        for job in jobs:
+            if job.status == TranscriptionStatus.TRANSCRIBING:
+                job.status = TranscriptionStatus.WAITING
+                job.started_at = None
+
         self.transcriptions = {job.key: job for job in jobs}
+        self._queue.clear()
+        queued = [
+            job
+            for job in jobs
+            if job.status == TranscriptionStatus.WAITING and job.queued_at is not None
+        ]
+        for job in sorted(queued, key=lambda job: job.queued_at or 0):
+            self._queue.put(job.key)
 
     @auto_save
     @override
     def reset(self) -> None:
         super().reset()
+        self._queue.clear()
         self.transcriptions = {}
-        self._pipelines = {}
+        self.pipelines.clear()
+        if self.inference_backend is not None:
+            self.inference_backend.clear()
 
     def get_transcription_job(
         self, model_location: str, audio_name: str
@@ -84,6 +196,7 @@ class TranscriptionManager(Manager):
         if job.key not in self.transcriptions:
             return
 
+        self._queue.remove(job.key)
         self.transcriptions.pop(job.key)
         folder = self.transcription_folder(job)
         if folder.exists:
@@ -103,6 +216,11 @@ class TranscriptionManager(Manager):
     def transcribe(
         self, model_location: str, audio_name: str
     ) -> Optional[TranscriptionStatus]:
+        """Queues a job to be transcribed by the worker pool.
+
+        Returns:
+            The status of the job, or None if it couldn't be found.
+        """
         job = self.get_transcription_job(model_location, audio_name)
         if job is None:
             logger.error(
@@ -110,44 +228,310 @@ class TranscriptionManager(Manager):
             )
             return
 
-        if job.status == TranscriptionStatus.TRANSCRIBING:
-            logger.error(f"Attempted to transcribe a job which is already in progress")
-            return
+        if job.status == TranscriptionStatus.TRANSCRIBING or job.key in self._queue:
+            logger.info(f"Transcription job already in progress: {job.key}")
+            return job.status
+
+        job.status = TranscriptionStatus.WAITING
+        job.queued_at = time.time()
+        job.started_at = None
+        job.finished_at = None
+
+        self._start_workers()
+        self._queue.put(job.key)
+        return job.status
+
+    def queue_position(self, job: TranscriptionJob) -> Optional[int]:
+        return self._queue.position(job.key)
+
+    def queue_info(self) -> Dict[str, int]:
+        return {
+            "queue_depth": len(self._queue),
+            "workers": self._num_workers,
+            "busy_workers": self._busy_workers,
+            "batch_size": self._batch_size,
+            "inference_processes": self.settings.inference_processes,
+        }
+
+    def _start_workers(self) -> None:
+        with self._workers_lock:
+            self._workers = [worker for worker in self._workers if worker.is_alive()]
+            for index in range(len(self._workers), self._num_workers):
+                worker = threading.Thread(
+                    target=self._work,
+                    name=f"transcription-worker-{index}",
+                    daemon=True,
+                )
+                worker.start()
+                self._workers.append(worker)
+
+    def _work(self) -> None:
+        while True:
+            key = self._queue.get()
+            job = self.transcriptions.get(key)
+            if job is None:
+                continue
+
+            with self._workers_lock:
+                self._busy_workers += 1
+
+            try:
+                self._run_jobs([job] + self._take_batch(job))
+            finally:
+                with self._workers_lock:
+                    self._busy_workers -= 1
+
+    def _take_batch(self, job: TranscriptionJob) -> List[TranscriptionJob]:
+        """Takes other waiting jobs which share a model with the given job,
+        so that they can be transcribed together."""
+        if self.settings.streaming:
+            return []
+
+        def shares_model(key: str) -> bool:
+            other = self.transcriptions.get(key)
+            return other is not None and other.model_location == job.model_location
+
+        keys = self._queue.take(shares_model, self._batch_size - 1)
+        jobs = [self.transcriptions.get(key) for key in keys]
+        return [job for job in jobs if job is not None]
+
+    def _run_jobs(self, jobs: List[TranscriptionJob]) -> None:
+        for job in jobs:
+            logger.info(f"Starting transcription job: {job.key}")
+            job.status = TranscriptionStatus.TRANSCRIBING
+            job.started_at = time.time()
+        self.save()
 
         try:
-            self._transcribe_job(job)
+            self._transcribe_jobs(jobs)
         except Exception as e:
-            job.status = TranscriptionStatus.ERROR
-            logger.error(e)
+            if len(jobs) == 1:
+                jobs[0].status = TranscriptionStatus.ERROR
+                logger.error(f"Error with transcription job: {jobs[0].key}")
+                logger.error(e)
+            else:
+                # Retry individually so one bad file doesn't fail the batch.
+                logger.error(f"Error with transcription batch, retrying jobs: {e}")
+                for job in jobs:
+                    self._run_jobs([job])
+                return
+
+        for job in jobs:
+            job.finished_at = time.time()
+            if job.status == TranscriptionStatus.FINISHED:
+                logger.success(f"Finished transcription job: {job.key}")
+        self.save()
+
+    def preload(self, models: List[Tuple[str, bool]]) -> None:
+        """Builds, warms up and pins pipelines in the background, so that the
+        first jobs against them don't pay for loading.
+
+        Parameters:
+            models: Pairs of model locations and whether they are local.
+        """
+        if len(models) == 0:
+            return
 
-        return job.status
+        for model_location, _ in models:
+            self._preload_states[model_location] = PreloadState.LOADING
 
-    def _transcribe_job(self, job: TranscriptionJob):
-        if job.model_location in self._pipelines:
-            logger.info("Using cached pipeline")
-            asr = self._pipelines[job.model_location]
+        thread = threading.Thread(
+            target=self._preload,
+            args=(models,),
+            name="pipeline-preloader",
+            daemon=True,
+        )
+        thread.start()
+
+    def _preload(self, models: List[Tuple[str, bool]]) -> None:
+        for model_location, is_local in models:
+            logger.info(f"Preloading pipeline: {model_location}")
+            try:
+                self._warm_up(model_location, is_local)
+                state = PreloadState.READY
+                logger.success(f"Preloaded pipeline: {model_location}")
+            except Exception as e:
+                self.pipelines.unpin(model_location)
+                state = PreloadState.ERROR
+                logger.error(f"Error preloading pipeline: {model_location}")
+                logger.error(e)
+
+            self._preload_states[model_location] = state
+
+    def pipelines_info(self) -> Dict[str, Any]:
+        """Reports on the cache of the pipelines which inference runs with.
+
+        Each inference process has its own cache, which can't be asked for,
+        so only the pool is reported on when inference runs in processes.
+        """
+        if isinstance(self.inference_backend, InferenceClient):
+            return {"backend": "server", **self.inference_backend.info()}
+        if isinstance(self.inference_backend, InferencePool):
+            return {
+                "backend": "processes",
+                "note": "Each inference process caches its own pipelines.",
+                **self.inference_backend.info(),
+            }
+        return {"backend": "local", **self.pipelines.info()}
+
+    def readiness(self) -> Dict[str, Any]:
+        """Reports whether all preloaded pipelines have finished loading."""
+        states = dict(self._preload_states)
+        return {
+            "ready": PreloadState.LOADING not in states.values(),
+            "models": {location: state.value for location, state in states.items()},
+        }
+
+    def _warm_up(self, model_location: str, is_local: bool) -> None:
+        if self.inference_backend is not None:
+            self.inference_backend.warm_up(
+                self._inference_task(model_location, is_local)
+            )
+            return
+
+        task = self._inference_task(model_location, is_local)
+        warm_up(self._get_pipeline(task))
+        self.pipelines.pin(task.pipeline_key)
+
+    def _pipeline_location(self, model_location: str, is_local: bool) -> str:
+        # Prefix local models with the path to their directory
+        if is_local:
+            return str(self._models_dir / model_location)
+        return model_location
+
+    def _quantized_weights(self, model_location: str, is_local: bool) -> Optional[Path]:
+        """Returns the weights of the model's int8 variant if one has been
+        built and should be used, else None."""
+        if not self.settings.use_quantized_models or not is_local:
+            return None
+        return quantized_weights(self._models_dir / model_location)
+
+    def _get_pipeline(self, task: InferenceTask) -> ASRPipeline:
+        return self.pipelines.get(task.pipeline_key, lambda: build_task_pipeline(task))
+
+    def _inference_task(
+        self,
+        model_location: str,
+        is_local: bool,
+        jobs: Optional[List[TranscriptionJob]] = None,
+    ) -> InferenceTask:
+        return InferenceTask(
+            model_location=model_location,
+            pipeline_location=self._pipeline_location(model_location, is_local),
+            cache_dir=self.cache,
+            audio_files=[self._audio_file(job) for job in jobs or []],
+            batch_size=self._batch_size,
+            streaming=self.settings.streaming,
+            stream_window_s=self.settings.stream_window_s,
+            stream_overlap_s=self.settings.stream_overlap_s,
+            quantized_weights=self._quantized_weights(model_location, is_local),
+            vad=self.settings.vad,
+            vad_threshold_db=self.settings.vad_threshold_db,
+        )
+
+    def _model_revision(self, model_location: str, is_local: bool) -> Optional[str]:
+        """Returns a string which changes whenever the model's weights do, or
+        None if it can't be determined without loading the model."""
+        if is_local:
+            model_folder = self._models_dir / model_location
+            if not model_folder.is_dir():
+                return None
+            return folder_fingerprint(model_folder, ignore=[LOGS_FILE])
+
+        return hub_revision(model_location, self.cache)
+
+    def _result_key(self, job: TranscriptionJob) -> Optional[str]:
+        if self.results is None:
+            return None
+
+        revision = self._model_revision(job.model_location, job.is_local)
+        if revision is None:
+            return None
+
+        if job.audio_hash is None:
+            job.audio_hash = hash_file(self._audio_file(job))
+
+        # Different modes of inference can produce different annotations.
+        mode = "full"
+        if self.settings.streaming:
+            mode = f"stream-{self.settings.stream_window_s}-{self.settings.stream_overlap_s}"
+        elif self.settings.vad:
+            mode = f"vad-{self.settings.vad_threshold_db}"
+        weights = self._quantized_weights(job.model_location, job.is_local)
+        if weights is not None:
+            mode += f"-int8-{folder_fingerprint(weights.parent)}"
+
+        return ResultCache.key(job.audio_hash, job.model_location, revision, mode)
+
+    def _cached_results(self, job: TranscriptionJob) -> Optional[List[Annotation]]:
+        key = self._result_key(job)
+        if self.results is None or key is None:
+            return None
+        return self.results.get(key, self._audio_file(job))
+
+    def _cache_results(
+        self, job: TranscriptionJob, annotations: List[Annotation]
+    ) -> None:
+        key = self._result_key(job)
+        if self.results is None or key is None:
+            return
+        self.results.put(key, annotations)
+
+    def _transcribe_jobs(self, jobs: List[TranscriptionJob]) -> None:
+        """Transcribes jobs which share a model_location, batching them
+        through the pipeline if there's more than one.
+
+        Jobs whose audio has already been transcribed by the same model are
+        answered from the result cache.
+        """
+        pending: List[TranscriptionJob] = []
+        for job in jobs:
+            annotations = self._cached_results(job)
+            if annotations is None:
+                pending.append(job)
+                continue
+
+            logger.info(f"Using cached transcription results: {job.key}")
+            if self.settings.streaming:
+                with open(self.partial_results_file(job), "w") as partial_file:
+                    write_partial_results(partial_file, annotations)
+            write_results(self._audio_file(job), annotations)
+            job.status = TranscriptionStatus.FINISHED
+
+        if len(pending) == 0:
+            return
+
+        model_location, is_local = pending[0].model_location, pending[0].is_local
+        task = self._inference_task(model_location, is_local, pending)
+        if len(pending) > 1:
+            logger.info(f"Transcribing batch of {len(pending)} jobs")
+
+        if self.inference_backend is not None:
+            results = self.inference_backend.run(task)
         else:
-            logger.info("Building new pipeline")
+            results = run_task(task, self._get_pipeline(task))
 
-            # Prefix local models with the path to their directory
-            safe_model_location = job.model_location
-            if job.is_local:
-                safe_model_location = str(self._models_dir / job.model_location)
+        for job, result in zip(pending, results):
+            self._cache_results(job, result.annotations)
+            job.audio_seconds = result.audio_seconds
+            job.skipped_seconds = result.skipped_seconds
+            if result.skipped_seconds > 0:
+                logger.info(
+                    f"Skipped {result.skipped_seconds:.1f}s of silence: {job.key}"
+                )
+            job.status = TranscriptionStatus.FINISHED
 
-            asr = build_pipeline(safe_model_location, cache_dir=self.cache)
-            self._pipelines[job.model_location] = asr
+    def _audio_file(self, job: TranscriptionJob) -> Path:
+        return self.transcription_folder(job) / (job.audio_name + ".wav")
 
-        folder = self.transcription_folder(job)
-        audio_file = folder / (job.audio_name + ".wav")
-        annotations = transcribe(audio_file, asr)
+    def partial_results_file(self, job: TranscriptionJob) -> Path:
+        return partial_results_file(self._audio_file(job))
 
-        # Build text file
-        with open(folder / f"{job.audio_name}.txt", "w") as text_file:
-            text_file.write(build_text(annotations))
 
-        # Build elan file
-        build_elan(annotations).to_file(folder / f"{job.audio_name}.eaf")
-        job.status = TranscriptionStatus.FINISHED
+class PreloadState(Enum):
+    LOADING = "loading"
+    READY = "ready"
+    ERROR = "error"
 
 
 class TranscriptionStatus(Enum):
@@ -163,6 +547,12 @@ class TranscriptionJob:
     audio_name: str
     is_local: bool = True
     status: TranscriptionStatus = TranscriptionStatus.WAITING
+    queued_at: Optional[float] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    audio_hash: Optional[str] = None
+    audio_seconds: Optional[float] = None
+    skipped_seconds: Optional[float] = None
 
     @property
     def key(self) -> str:
@@ -174,10 +564,22 @@ class TranscriptionJob:
             return base64.b64encode(self.model_location.encode()).decode()
         return self.model_location
 
+    @property
+    def wait_seconds(self) -> Optional[float]:
+        if self.queued_at is None or self.started_at is None:
+            return None
+        return self.started_at - self.queued_at
+
+    @property
+    def transcribe_seconds(self) -> Optional[float]:
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
     def transcription_folder(self, base_folder: Path) -> Path:
         return base_folder / self._location_prefix / self.audio_name
 
-    def to_dict(self) -> Dict[str, str]:
+    def to_dict(self) -> Dict[str, Any]:
         result = dict(self.__dict__)
         result["status"] = self.status.value
         return result
@@ -189,4 +591,10 @@ class TranscriptionJob:
             audio_name=data["audio_name"],
             is_local=data["is_local"],
             status=TranscriptionStatus(data["status"]),
+            queued_at=data.get("queued_at"),
+            started_at=data.get("started_at"),
+            finished_at=data.get("finished_at"),
+            audio_hash=data.get("audio_hash"),
+            audio_seconds=data.get("audio_seconds"),
+            skipped_seconds=data.get("skipped_seconds"),
         )
@@ -0,0 +1,266 @@
+"""Reads the metrics logged while training a model, as compact time series.
+
+Metrics come from the trainer_state.json files the trainer saves with each
+checkpoint, and from the TensorBoard event files it appends to as it goes.
+Event files are read incrementally, so refreshing the metrics of a model in
+training only parses what's been logged since. Only the event files of the
+newest run are read, so metrics from earlier trainings of the model aren't
+mixed in.
+"""
+
+import json
+import struct
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from google.protobuf.message import DecodeError
+from tensorboard.compat.proto.event_pb2 import Event
+from tensorboard.util.tensor_util import make_ndarray
+
+from server.training import TRAINER_STATE_FILE, latest_checkpoint
+
+DEFAULT_METRICS_POINTS = 500
+EVENT_FILE_PATTERN = "events.out.tfevents.*"
+# Entries in trainer state logs which are the position, rather than metrics.
+POSITION_KEYS = {"step", "epoch", "total_flos"}
+
+# Each event file record is a length, its checksum, the data, then its checksum.
+RECORD_HEADER = struct.Struct("<QI")
+RECORD_FOOTER_SIZE = 4
+
+Series = Dict[str, Dict[int, float]]
+
+
+def metric_tag(key: str) -> str:
+    """Converts a trainer log key to the tag it's given in event files."""
+    for prefix in ("eval", "test"):
+        if key.startswith(f"{prefix}_"):
+            return f"{prefix}/{key[len(prefix) + 1:]}"
+    return f"train/{key}"
+
+
+def downsample(points: Dict[int, float], max_points: int) -> Tuple[List, List]:
+    """Reduces a series to at most max_points, averaging the values in evenly
+    sized buckets of steps.
+
+    Returns:
+        The steps and values of the reduced series, in order.
+    """
+    ordered = sorted(points.items())
+    if len(ordered) <= max_points:
+        return [step for step, _ in ordered], [value for _, value in ordered]
+
+    steps, values = [], []
+    for bucket in range(max_points):
+        start = bucket * len(ordered) // max_points
+        stop = (bucket + 1) * len(ordered) // max_points
+        chunk = ordered[start:stop]
+        # Label each bucket with its last step, so the final point is exact.
+        steps.append(chunk[-1][0])
+        values.append(sum(value for _, value in chunk) / len(chunk))
+    return steps, values
+
+
+def newest_run(paths: Iterable[Path]) -> List[Path]:
+    """Picks the event files of the newest run, from those of every run.
+
+    Each run of the trainer logs to its own folder, so the newest run is the
+    folder with the most recently written event file.
+    """
+    runs: Dict[Path, int] = {}
+    for path in paths:
+        try:
+            modified = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            continue
+        runs[path.parent] = max(runs.get(path.parent, modified), modified)
+    if not runs:
+        return []
+
+    newest = max(runs, key=lambda run: runs[run])
+    return sorted(newest.glob(EVENT_FILE_PATTERN))
+
+
+class _EventFileReader:
+    """Reads the scalars appended to an event file since it was last read."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.offset = 0
+        self.series: Series = {}
+
+    def read(self) -> bool:
+        """Reads any new complete records.
+
+        Returns:
+            True iff any new scalars were read.
+        """
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            return False
+        if size < self.offset:
+            # The file's been replaced, so start again.
+            self.offset = 0
+            self.series = {}
+        if size == self.offset:
+            return False
+
+        try:
+            with open(self.path, "rb") as events:
+                events.seek(self.offset)
+                data = events.read(size - self.offset)
+        except FileNotFoundError:
+            return False
+
+        changed = False
+        position = 0
+        while position + RECORD_HEADER.size <= len(data):
+            length, _ = RECORD_HEADER.unpack_from(data, position)
+            end = position + RECORD_HEADER.size + length + RECORD_FOOTER_SIZE
+            if end > len(data):
+                # The rest of the record hasn't been written yet.
+                break
+
+            record = data[position + RECORD_HEADER.size : end - RECORD_FOOTER_SIZE]
+            try:
+                changed |= self._add_event(Event.FromString(record))
+            except DecodeError:
+                # Skip a corrupt record, rather than losing the rest of the file.
+                pass
+            position = end
+
+        self.offset += position
+        return changed
+
+    def _add_event(self, event: Event) -> bool:
+        if not event.HasField("summary"):
+            return False
+
+        for value in event.summary.value:
+            if value.HasField("simple_value"):
+                scalar = value.simple_value
+            elif value.HasField("tensor") and not value.tensor.tensor_shape.dim:
+                scalar = float(make_ndarray(value.tensor))
+            else:
+                continue
+            self.series.setdefault(value.tag, {})[event.step] = scalar
+        return len(event.summary.value) > 0
+
+
+class TrainingMetrics:
+    """The metrics of one model, refreshed from its files when they change."""
+
+    def __init__(self, model_folder: Path) -> None:
+        self.model_folder = model_folder
+        self._readers: Dict[Path, _EventFileReader] = {}
+        self._trainer_state: Optional[Tuple[Path, int, int]] = None
+        self._trainer_state_series: Series = {}
+        self._responses: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, max_points: int = DEFAULT_METRICS_POINTS) -> Dict[str, Any]:
+        """Returns each of the model's metrics as a series of steps and values,
+        with at most max_points in each."""
+        with self._lock:
+            if self._refresh():
+                self._responses = {}
+
+            if max_points not in self._responses:
+                series = {}
+                for tag, points in sorted(self._merged().items()):
+                    steps, values = downsample(points, max_points)
+                    series[tag] = {"steps": steps, "values": values}
+                self._responses[max_points] = {"series": series}
+            return self._responses[max_points]
+
+    def _refresh(self) -> bool:
+        changed = self._refresh_trainer_state()
+
+        paths = newest_run(self.model_folder.rglob(EVENT_FILE_PATTERN))
+        for path in paths:
+            if path not in self._readers:
+                self._readers[path] = _EventFileReader(path)
+                changed = True
+        for path, reader in list(self._readers.items()):
+            if path not in paths:
+                del self._readers[path]
+                changed = True
+            else:
+                changed |= reader.read()
+        return changed
+
+    def _refresh_trainer_state(self) -> bool:
+        """Reads the newest trainer state, whose log holds all the metrics
+        logged before it was saved."""
+        path = self.model_folder / TRAINER_STATE_FILE
+        if not path.is_file():
+            checkpoint = latest_checkpoint(self.model_folder)
+            if checkpoint is None:
+                changed = self._trainer_state is not None
+                self._trainer_state = None
+                self._trainer_state_series = {}
+                return changed
+            path = checkpoint / TRAINER_STATE_FILE
+
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            # The checkpoint was rotated out, so read the next one next time.
+            return False
+        identity = (path, stat.st_mtime_ns, stat.st_size)
+        if identity == self._trainer_state:
+            return False
+
+        try:
+            with open(path) as state_file:
+                log_history = json.load(state_file).get("log_history", [])
+        except (OSError, ValueError):
+            # It's being written, so read it next time.
+            return False
+
+        series: Series = {}
+        for entry in log_history:
+            step = entry.get("step")
+            for key, value in entry.items():
+                if key in POSITION_KEYS or not isinstance(value, (int, float)):
+                    continue
+                series.setdefault(metric_tag(key), {})[step] = float(value)
+
+        self._trainer_state = identity
+        self._trainer_state_series = series
+        return True
+
+    def _merged(self) -> Series:
+        """Combines the series from every source. Event files are written as
+        metrics are logged, so take precedence over the trainer state."""
+        merged: Series = {
+            tag: dict(points) for tag, points in self._trainer_state_series.items()
+        }
+        readers = sorted(self._readers.values(), key=lambda reader: reader.path)
+        for reader in readers:
+            for tag, points in reader.series.items():
+                merged.setdefault(tag, {}).update(points)
+        return merged
+
+
+class MetricsCache:
+    """Holds the metrics of each model between requests."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[Path, TrainingMetrics] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self, model_folder: Path, max_points: int = DEFAULT_METRICS_POINTS
+    ) -> Dict[str, Any]:
+        with self._lock:
+            if model_folder not in self._metrics:
+                self._metrics[model_folder] = TrainingMetrics(model_folder)
+            metrics = self._metrics[model_folder]
+        return metrics.get(max_points)
+
+    def remove(self, model_folder: Path) -> None:
+        with self._lock:
+            self._metrics.pop(model_folder, None)
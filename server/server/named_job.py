@@ -1,15 +1,17 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from elpis.models import Job
 
 
 class JobStatus(Enum):
     WAITING = "waiting"
+    QUEUED = "queued"
     TRAINING = "training"
     FINISHED = "finished"
     ERROR = "error"
+    CANCELLED = "cancelled"
 
 
 @dataclass
@@ -17,12 +19,26 @@ class NamedJob:
     name: str
     job: Job
     status: JobStatus = JobStatus.WAITING
+    priority: int = 0
+    queued_at: Optional[float] = None
+    exit_code: Optional[int] = None  # Of the latest training process
+    resume: bool = False  # Continue from the latest checkpoint when trained
+    interruptions: int = 0  # Restarts during training since it last finished
+    sweep: Optional[str] = None  # The sweep the model was created by, if any
+    sweep_parameters: Dict[str, Any] = field(default_factory=dict)
 
     def to_dict(self) -> Dict[str, Any]:
         return {
             "name": self.name,
             "job": self.job.to_dict(),
             "status": self.status.value,
+            "priority": self.priority,
+            "queued_at": self.queued_at,
+            "exit_code": self.exit_code,
+            "resume": self.resume,
+            "interruptions": self.interruptions,
+            "sweep": self.sweep,
+            "sweep_parameters": self.sweep_parameters,
         }
 
     @classmethod
@@ -31,4 +47,11 @@ class NamedJob:
             name=data["name"],
             job=Job.from_dict(data["job"]),
             status=JobStatus(data.get("status", "waiting")),
+            priority=data.get("priority", 0),
+            queued_at=data.get("queued_at"),
+            exit_code=data.get("exit_code"),
+            resume=data.get("resume", False),
+            interruptions=data.get("interruptions", 0),
+            sweep=data.get("sweep"),
+            sweep_parameters=data.get("sweep_parameters", {}),
         )
@@ -0,0 +1,184 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+import torch
+from loguru import logger
+from transformers import AutomaticSpeechRecognitionPipeline as ASRPipeline
+
+DEFAULT_PIPELINE_CACHE_BYTES = 4 * 1024**3
+# Appended to a model's location in the key of its int8 variant.
+QUANTIZED_KEY_SUFFIX = " (int8)"
+
+
+def quantized_key(model_location: str) -> str:
+    """Returns the cache key of the int8 variant of a model."""
+    return f"{model_location}{QUANTIZED_KEY_SUFFIX}"
+
+
+def key_model_location(key: str) -> str:
+    """Returns the location of the model which a cache key is for, whichever
+    variant of it the key is."""
+    if key.endswith(QUANTIZED_KEY_SUFFIX):
+        return key[: -len(QUANTIZED_KEY_SUFFIX)]
+    return key
+
+
+def pipeline_size(asr: ASRPipeline) -> int:
+    """Returns the number of bytes used by the weights and buffers of the
+    pipeline's model.
+
+    These are counted from its state dict, as the packed weights of quantized
+    layers aren't parameters.
+    """
+    tensors = {}
+    for tensor in _tensors(list(asr.model.state_dict().values())):
+        # Tied weights share their storage.
+        tensors[tensor.data_ptr()] = tensor
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors.values())
+
+
+def _tensors(values: Iterable[Any]) -> Iterator[torch.Tensor]:
+    for value in values:
+        if isinstance(value, torch.Tensor):
+            yield value
+        elif isinstance(value, (tuple, list)):
+            yield from _tensors(value)
+
+
+class PipelineCache:
+    """A thread-safe LRU cache of pipelines, bounded by the combined size of
+    their models.
+
+    Pinned pipelines are never evicted, and a pipeline larger than the budget
+    is still cached so that it isn't rebuilt for every job. Models are pinned
+    by location, which pins both their full and int8 variants.
+    """
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = DEFAULT_PIPELINE_CACHE_BYTES,
+        pinned: Iterable[str] = (),
+        size_of: Callable[[ASRPipeline], int] = pipeline_size,
+    ) -> None:
+        self.max_bytes = max_bytes if max_bytes else None
+        self._size_of = size_of
+        self._pipelines: OrderedDict[str, ASRPipeline] = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._pinned: Set[str] = {key_model_location(key) for key in pinned}
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._pipelines
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def get(self, key: str, build: Callable[[], ASRPipeline]) -> ASRPipeline:
+        """Returns the cached pipeline for the key, building and caching it
+        if necessary.
+
+        Parameters:
+            key: The key of the pipeline, i.e. its model location.
+            build: Builds the pipeline on a cache miss.
+        """
+        with self._lock:
+            if key in self._pipelines:
+                return self._hit(key)
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        # Only one thread builds a given pipeline, without blocking lookups
+        # of the others.
+        with build_lock:
+            with self._lock:
+                if key in self._pipelines:
+                    return self._hit(key)
+                self.misses += 1
+
+            logger.info(f"Building new pipeline: {key}")
+            asr = build()
+            self.put(key, asr)
+            return asr
+
+    def put(self, key: str, asr: ASRPipeline) -> None:
+        size = self._size_of(asr)
+        with self._lock:
+            self._pipelines[key] = asr
+            self._pipelines.move_to_end(key)
+            self._sizes[key] = size
+            self._evict(keep=key)
+
+    def pin(self, key: str) -> None:
+        with self._lock:
+            self._pinned.add(key_model_location(key))
+
+    def unpin(self, key: str) -> None:
+        with self._lock:
+            self._pinned.discard(key_model_location(key))
+            self._evict()
+
+    def clear(self, keep_pinned: bool = False) -> None:
+        with self._lock:
+            for key in list(self._pipelines):
+                if not (keep_pinned and self._is_pinned(key)):
+                    self._pipelines.pop(key)
+                    self._sizes.pop(key)
+
+    def info(self) -> Dict[str, Any]:
+        with self._lock:
+            pipelines: List[Dict[str, Any]] = [
+                {
+                    "model_location": key,
+                    "size_bytes": self._sizes[key],
+                    "pinned": self._is_pinned(key),
+                }
+                for key in self._pipelines
+            ]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size_bytes": sum(self._sizes.values()),
+                "max_bytes": self.max_bytes,
+                "pinned": sorted(self._pinned),
+                "pipelines": pipelines,
+            }
+
+    def _is_pinned(self, key: str) -> bool:
+        """Assumes the lock is held."""
+        return key_model_location(key) in self._pinned
+
+    def _hit(self, key: str) -> ASRPipeline:
+        logger.info(f"Using cached pipeline: {key}")
+        self.hits += 1
+        self._pipelines.move_to_end(key)
+        return self._pipelines[key]
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """Evicts least recently used pipelines until the cache fits within
+        its budget. Assumes the lock is held."""
+        if self.max_bytes is None:
+            return
+
+        candidates = [
+            key for key in self._pipelines if not self._is_pinned(key) and key != keep
+        ]
+        for key in candidates:
+            if sum(self._sizes.values()) <= self.max_bytes:
+                break
+
+            logger.info(f"Evicting cached pipeline: {key}")
+            self._pipelines.pop(key)
+            self._sizes.pop(key)
+            self.evictions += 1
+
+        if sum(self._sizes.values()) > self.max_bytes:
+            logger.warning("Pipeline cache is over budget with pinned or in-use models")
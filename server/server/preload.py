@@ -0,0 +1,20 @@
+from flask import Flask
+
+from server.interface import Interface
+
+PRELOAD_MODELS_KEY = "PRELOAD_MODELS"
+
+
+def preload_pipelines(app: Flask) -> None:
+    """Starts loading the configured transcription models in the background.
+
+    Models which match the name of a local model are loaded from the models
+    folder, the rest are treated as Hugging Face hub ids.
+    """
+    interface = Interface.from_app(app)
+    model_locations = app.config.get(PRELOAD_MODELS_KEY, [])
+    models = [
+        (model_location, model_location in interface.model_manager)
+        for model_location in model_locations
+    ]
+    interface.transcription_manager.preload(models)
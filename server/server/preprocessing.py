@@ -0,0 +1,204 @@
+"""Preprocesses the batches of a dataset in parallel.
+
+Cutting and resampling audio is CPU bound, so batches of large datasets are
+spread over a pool of worker processes. Each batch writes its own files into
+the processed folder, so the output is the same as processing them one after
+another.
+"""
+
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass, field
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from elpis.datasets.dataset import ProcessingBatch
+from elpis.datasets.preprocessing import process_batch
+from loguru import logger
+
+from server.training import available_cpus
+
+# Size the pool to the host.
+DEFAULT_PREPROCESSING_WORKERS = 0
+# Datasets with less audio than this are quicker to process than to start
+# worker processes for.
+MIN_POOL_AUDIO_BYTES = 64 * 1024**2
+
+
+@dataclass
+class BatchReport:
+    """How preprocessing one batch, i.e. one transcription file, went."""
+
+    transcription_file: str
+    seconds: float
+    files: int = 0  # Written to the processed folder
+    error: Optional[str] = None
+    # The names of the files written, which are left out of saved reports.
+    outputs: List[str] = field(default_factory=list, repr=False)
+
+
+@dataclass
+class PreprocessingReport:
+    workers: int
+    seconds: float
+    batches: List[BatchReport]
+
+    @property
+    def failures(self) -> List[BatchReport]:
+        return [batch for batch in self.batches if batch.error is not None]
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = asdict(self)
+        for batch in result["batches"]:
+            del batch["outputs"]
+        result["failures"] = len(self.failures)
+        return result
+
+
+ProgressCallback = Callable[[BatchReport], None]
+
+
+class PreprocessingError(ValueError):
+    """Some batches of a dataset couldn't be preprocessed."""
+
+    def __init__(self, report: PreprocessingReport) -> None:
+        names = ", ".join(batch.transcription_file for batch in report.failures)
+        super().__init__(f"Failed to preprocess: {names}")
+        self.report = report
+
+
+def pool_size(workers: int, batches: int) -> int:
+    """Returns the number of processes to preprocess with, where 0 workers
+    means one per available core."""
+    if workers <= 0:
+        workers = available_cpus()
+    return max(1, min(workers, batches))
+
+
+class PreprocessingPool:
+    """Preprocesses batches in a pool of worker processes.
+
+    Worker processes take seconds to start, as they import elpis, so they're
+    started on the first dataset large enough to be worth it, and kept for
+    the next. Smaller datasets are processed in the calling thread.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_PREPROCESSING_WORKERS,
+        min_pool_bytes: int = MIN_POOL_AUDIO_BYTES,
+    ) -> None:
+        self.workers = workers if workers > 0 else available_cpus()
+        self.min_pool_bytes = min_pool_bytes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def process(
+        self,
+        batches: List[ProcessingBatch],
+        output_dir: Path,
+        on_progress: Optional[ProgressCallback] = None,
+    ) -> PreprocessingReport:
+        """Preprocesses batches into the output folder.
+
+        Failed batches don't stop the others, and are reported alongside them.
+
+        Parameters:
+            batches: The batches to process.
+            output_dir: The folder to write the processed files to.
+            on_progress: Called with the report of each batch as it finishes.
+
+        Returns:
+            The timings and any errors of each batch, in the order given.
+        """
+        start = time.perf_counter()
+        workers = pool_size(self.workers, len(batches))
+        if workers > 1 and self._worth_pooling(batches):
+            reports = self._process_in_pool(batches, output_dir, on_progress)
+        else:
+            workers = 1
+            reports = []
+            for batch in batches:
+                reports.append(_process_batch(batch, output_dir))
+                if on_progress is not None:
+                    on_progress(reports[-1])
+
+        report = PreprocessingReport(workers, time.perf_counter() - start, reports)
+        for batch in report.failures:
+            logger.error(f"Error preprocessing {batch.transcription_file}:")
+            logger.error(batch.error)
+        logger.info(
+            f"Preprocessed {len(batches)} batches with {workers} workers "
+            f"in {report.seconds:.1f}s"
+        )
+        return report
+
+    def close(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _worth_pooling(self, batches: List[ProcessingBatch]) -> bool:
+        if self._executor is not None:
+            return True
+        audio_bytes = sum(
+            batch.audio_file.stat().st_size
+            for batch in batches
+            if batch.audio_file.is_file()
+        )
+        return audio_bytes >= self.min_pool_bytes
+
+    def _process_in_pool(
+        self,
+        batches: List[ProcessingBatch],
+        output_dir: Path,
+        on_progress: Optional[ProgressCallback],
+    ) -> List[BatchReport]:
+        executor = self._get_executor()
+        futures = {
+            executor.submit(_process_batch, batch, output_dir): index
+            for index, batch in enumerate(batches)
+        }
+        reports: List[Optional[BatchReport]] = [None] * len(batches)
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                reports[index] = future.result()
+            except Exception as e:
+                # The worker process died, rather than the batch raising.
+                reports[index] = BatchReport(
+                    batches[index].transcription_file.name, 0.0, error=repr(e)
+                )
+                if isinstance(e, BrokenProcessPool):
+                    self.close()
+            if on_progress is not None:
+                on_progress(reports[index])
+        return [report for report in reports if report is not None]
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Start fresh interpreters, as forking a server with running
+                # threads isn't safe.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=get_context("spawn")
+                )
+            return self._executor
+
+
+def _process_batch(batch: ProcessingBatch, output_dir: Path) -> BatchReport:
+    start = time.perf_counter()
+    name = batch.transcription_file.name
+    try:
+        paths = process_batch(batch=batch, output_dir=output_dir)
+        outputs = list(dict.fromkeys(path.name for path in paths))
+    except Exception:
+        return BatchReport(
+            name, time.perf_counter() - start, error=traceback.format_exc()
+        )
+    return BatchReport(name, time.perf_counter() - start, len(outputs), outputs=outputs)
@@ -0,0 +1,63 @@
+"""Reads the resource use of processes from /proc, on Linux."""
+
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+PROC = Path("/proc")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+TCP_ESTABLISHED = "01"
+
+
+@dataclass
+class ProcessStats:
+    cpu_seconds: float  # User and system time used so far
+    rss_bytes: int  # Resident memory
+    sampled_at: float
+
+
+def process_stats(pid: int) -> Optional[ProcessStats]:
+    """Returns the CPU time and memory used by a process, or None if it isn't
+    running or /proc isn't available."""
+    try:
+        stat = (PROC / str(pid) / "stat").read_text()
+    except OSError:
+        return None
+
+    # The command name is in brackets and may contain spaces, so split after it.
+    fields = stat[stat.rindex(")") + 2 :].split()
+    utime, stime, rss_pages = int(fields[11]), int(fields[12]), int(fields[21])
+    return ProcessStats(
+        cpu_seconds=(utime + stime) / CLOCK_TICKS,
+        rss_bytes=rss_pages * PAGE_SIZE,
+        sampled_at=time.monotonic(),
+    )
+
+
+def cpu_percent(previous: ProcessStats, current: ProcessStats) -> Optional[float]:
+    """Returns the CPU use of a process between two samples, where 100 is one
+    core fully used."""
+    elapsed = current.sampled_at - previous.sampled_at
+    if elapsed <= 0:
+        return None
+    return 100 * (current.cpu_seconds - previous.cpu_seconds) / elapsed
+
+
+def established_connections(port: int) -> int:
+    """Returns the number of open TCP connections to a local port."""
+    count = 0
+    for table in ("tcp", "tcp6"):
+        try:
+            lines = (PROC / "net" / table).read_text().splitlines()[1:]
+        except OSError:
+            continue
+
+        for line in lines:
+            fields = line.split()
+            local_port = int(fields[1].rsplit(":", 1)[1], 16)
+            if local_port == port and fields[3] == TCP_ESTABLISHED:
+                count += 1
+    return count
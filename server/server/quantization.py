@@ -0,0 +1,151 @@
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import torch
+from elpis.transcriber.transcribe import transcribe
+from pedalboard.io import ReadableAudioFile
+from transformers import AutomaticSpeechRecognitionPipeline as ASRPipeline
+
+QUANTIZED_FOLDER = "quantized"
+QUANTIZED_WEIGHTS_FILE = "model.pt"
+REPORT_FILE = "report.json"
+DEFAULT_EVAL_SAMPLES = 50
+
+
+def quantized_folder(model_folder: Path) -> Path:
+    return model_folder / QUANTIZED_FOLDER
+
+
+def quantized_weights(model_folder: Path) -> Optional[Path]:
+    """Returns the weights of a model's int8 variant, or None if it hasn't
+    been built."""
+    weights = quantized_folder(model_folder) / QUANTIZED_WEIGHTS_FILE
+    return weights if weights.is_file() else None
+
+
+def quantize(asr: ASRPipeline) -> ASRPipeline:
+    """Replaces the linear layers of a pipeline's model with dynamically
+    quantized int8 versions, which run considerably faster on CPUs."""
+    asr.model = torch.ao.quantization.quantize_dynamic(
+        asr.model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+    return asr
+
+
+def load_quantized(asr: ASRPipeline, weights: Path) -> ASRPipeline:
+    """Quantizes a pipeline, then loads the previously saved int8 weights
+    into it, so it matches the evaluated variant exactly."""
+    asr = quantize(asr)
+    asr.model.load_state_dict(torch.load(weights))
+    return asr
+
+
+def save_quantized(asr: ASRPipeline, model_folder: Path) -> Path:
+    folder = quantized_folder(model_folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    weights = folder / QUANTIZED_WEIGHTS_FILE
+    torch.save(asr.model.state_dict(), weights)
+    return weights
+
+
+def compare(
+    full: ASRPipeline,
+    quantized: ASRPipeline,
+    samples: Sequence[Tuple[Path, str]],
+) -> Dict[str, Any]:
+    """Compares the accuracy and speed of a model with its quantized variant.
+
+    Parameters:
+        full: The pipeline with the original fp32 model.
+        quantized: The pipeline with the int8 model.
+        samples: Pairs of audio files and their reference transcripts.
+
+    Returns:
+        The word and character error rates and real time factors of each
+        variant, along with the differences between them.
+    """
+    audio_seconds = sum(_duration(audio) for audio, _ in samples)
+    references = [transcript for _, transcript in samples]
+    variants = {"fp32": full, "int8": quantized}
+
+    report: Dict[str, Any] = {"samples": len(samples), "audio_seconds": audio_seconds}
+    for name, asr in variants.items():
+        start = time.perf_counter()
+        predictions = [_predict(asr, audio) for audio, _ in samples]
+        seconds = time.perf_counter() - start
+        report[name] = {
+            "wer": word_error_rate(references, predictions),
+            "cer": character_error_rate(references, predictions),
+            "rtf": seconds / audio_seconds if audio_seconds > 0 else None,
+        }
+
+    report["wer_delta"] = report["int8"]["wer"] - report["fp32"]["wer"]
+    report["cer_delta"] = report["int8"]["cer"] - report["fp32"]["cer"]
+    if report["fp32"]["rtf"] and report["int8"]["rtf"]:
+        report["speedup"] = report["fp32"]["rtf"] / report["int8"]["rtf"]
+    return report
+
+
+def save_report(model_folder: Path, report: Dict[str, Any]) -> None:
+    with open(quantized_folder(model_folder) / REPORT_FILE, "w") as report_file:
+        json.dump(report, report_file)
+
+
+def load_report(model_folder: Path) -> Optional[Dict[str, Any]]:
+    report_file = quantized_folder(model_folder) / REPORT_FILE
+    if not report_file.is_file():
+        return None
+
+    with open(report_file) as report:
+        return json.load(report)
+
+
+def word_error_rate(references: List[str], predictions: List[str]) -> float:
+    return _error_rate(
+        [reference.split() for reference in references],
+        [prediction.split() for prediction in predictions],
+    )
+
+
+def character_error_rate(references: List[str], predictions: List[str]) -> float:
+    return _error_rate(
+        [list(reference) for reference in references],
+        [list(prediction) for prediction in predictions],
+    )
+
+
+def _error_rate(references: List[List[str]], predictions: List[List[str]]) -> float:
+    errors = sum(
+        _edit_distance(ref, pred) for ref, pred in zip(references, predictions)
+    )
+    total = sum(len(reference) for reference in references)
+    return errors / total if total > 0 else 0.0
+
+
+def _edit_distance(reference: Sequence[str], prediction: Sequence[str]) -> int:
+    """The minimum number of substitutions, insertions and deletions which
+    turn the prediction into the reference."""
+    previous = list(range(len(prediction) + 1))
+    for i, ref_token in enumerate(reference, start=1):
+        current = [i]
+        for j, pred_token in enumerate(prediction, start=1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (ref_token != pred_token),
+                )
+            )
+        previous = current
+    return previous[-1]
+
+
+def _predict(asr: ASRPipeline, audio: Path) -> str:
+    return " ".join(annotation.transcript for annotation in transcribe(audio, asr))
+
+
+def _duration(audio: Path) -> float:
+    with ReadableAudioFile(str(audio)) as audio_file:
+        return audio_file.duration
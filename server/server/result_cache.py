@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from elpis.models import Annotation
+from huggingface_hub.file_download import repo_folder_name
+from loguru import logger
+
+DEFAULT_RESULT_CACHE_BYTES = 512 * 1024**2
+
+
+def hub_revision(repo_id: str, cache_dir: Path) -> Optional[str]:
+    """Returns the commit hash of the locally cached main revision of a hub
+    model, or None if it hasn't been downloaded yet."""
+    folder_name = repo_folder_name(repo_id=repo_id, repo_type="model")
+    ref = cache_dir / folder_name / "refs" / "main"
+    if not ref.is_file():
+        return None
+    return ref.read_text().strip()
+
+
+class ResultCache:
+    """A persistent, size bounded cache of transcription results.
+
+    Results are stored as one json file per key, and evicted least recently
+    used first. File modification times record use, so the order survives
+    restarts.
+    """
+
+    def __init__(
+        self, folder: Path, max_bytes: Optional[int] = DEFAULT_RESULT_CACHE_BYTES
+    ) -> None:
+        self.folder = folder
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes if max_bytes else None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(audio_hash: str, *model_identity: str) -> str:
+        """Builds a key from the hash of some audio and the parts which
+        identify the model and options it was transcribed with."""
+        return hashlib.sha256(
+            "\0".join([audio_hash, *model_identity]).encode()
+        ).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.folder / key[:2] / f"{key}.json"
+
+    def get(self, key: str, audio_file: Path) -> Optional[List[Annotation]]:
+        """Returns the cached annotations for the key, attributed to the given
+        audio file, or None if there aren't any."""
+        path = self._path(key)
+        with self._lock:
+            try:
+                with open(path) as results:
+                    data = json.load(results)
+                os.utime(path)
+            except (OSError, ValueError):
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        return [
+            Annotation.from_dict({**annotation, "audio_file": str(audio_file)})
+            for annotation in data
+        ]
+
+    def put(self, key: str, annotations: List[Annotation]) -> None:
+        data = []
+        for annotation in annotations:
+            annotation_data = annotation.to_dict()
+            annotation_data.pop("audio_file")
+            data.append(annotation_data)
+
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(temp_path, "w") as results:
+            json.dump(data, results)
+
+        with self._lock:
+            os.replace(temp_path, path)
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            for path in self.folder.glob("*/*.json"):
+                path.unlink(missing_ok=True)
+
+    def info(self) -> Dict[str, Any]:
+        entries = list(self.folder.glob("*/*.json"))
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "size_bytes": sum(_size(path) for path in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+    def _evict(self) -> None:
+        """Removes the least recently used results until the cache fits within
+        its budget. Assumes the lock is held."""
+        if self.max_bytes is None:
+            return
+
+        entries = []
+        for path in self.folder.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+
+            logger.info(f"Evicting cached transcription result: {path.stem}")
+            path.unlink(missing_ok=True)
+            total -= size
+            self.evictions += 1
+
+
+def _size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
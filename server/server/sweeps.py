@@ -0,0 +1,113 @@
+"""Trains variants of a model over a grid of parameters, to compare them.
+
+A sweep is a set of models sharing a base job, each with one combination of
+the values in the grid. The models are ordinary named jobs, which remember
+the sweep they belong to and their parameters.
+"""
+
+import itertools
+import json
+from dataclasses import fields
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from elpis.models import DataArguments, ModelArguments
+from transformers import TrainingArguments
+
+from server.named_job import JobStatus, NamedJob
+
+EVAL_RESULTS_FILE = "eval_results.json"
+MAX_SWEEP_MODELS = 32
+# Set per model, so can't be swept over.
+FIXED_PARAMETERS = {"output_dir"}
+ACTIVE_STATUSES = {JobStatus.WAITING, JobStatus.QUEUED, JobStatus.TRAINING}
+# The metric to rank models by, if they report it. Lower is better.
+RANKING_METRIC = "eval_wer"
+
+
+def job_parameters() -> List[str]:
+    return [
+        field.name
+        for arguments in (ModelArguments, DataArguments, TrainingArguments)
+        for field in fields(arguments)
+        if field.init
+    ]
+
+
+def validate_grid(grid: Any) -> Optional[str]:
+    """Returns the error in a parameter grid, if there is one, else None."""
+    if not isinstance(grid, dict) or len(grid) == 0:
+        return "The grid should map job parameters to lists of values."
+
+    parameters = set(job_parameters()) - FIXED_PARAMETERS
+    for key, values in grid.items():
+        if key not in parameters:
+            return f"Can't sweep over unknown parameter: {key}"
+        if not isinstance(values, list) or len(values) == 0:
+            return f"Values of {key} should be a non-empty list."
+
+    if len(expand_grid(grid)) > MAX_SWEEP_MODELS:
+        return f"Sweeps can have at most {MAX_SWEEP_MODELS} models."
+    return None
+
+
+def expand_grid(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """Returns every combination of the values in a grid, varying the last
+    parameter fastest."""
+    keys = list(grid)
+    return [
+        dict(zip(keys, values))
+        for values in itertools.product(*(grid[key] for key in keys))
+    ]
+
+
+def sweep_model_name(sweep_name: str, index: int) -> str:
+    return f"{sweep_name}-{index + 1}"
+
+
+def load_eval_results(model_folder: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(model_folder / EVAL_RESULTS_FILE) as results:
+            return json.load(results)
+    except (OSError, ValueError):
+        return None
+
+
+def comparison(
+    models: List[NamedJob], model_folder: Callable[[str], Path]
+) -> Dict[str, Any]:
+    """Tabulates the parameters and evaluation results of a sweep's models.
+
+    Parameters:
+        models: The models of the sweep.
+        model_folder: A function from a model's name to its folder.
+
+    Returns:
+        A row for each model, ranked by the ranking metric once known, the
+        name of the best model if any have been evaluated, and whether every
+        model is done training.
+    """
+    rows = []
+    for model in models:
+        rows.append(
+            {
+                "name": model.name,
+                "status": model.status.value,
+                "parameters": model.sweep_parameters,
+                "metrics": load_eval_results(model_folder(model.name)),
+            }
+        )
+
+    def rank(row: Dict[str, Any]):
+        metric = (row["metrics"] or {}).get(RANKING_METRIC)
+        return (metric is None, metric if metric is not None else 0)
+
+    # Sorting is stable, so unevaluated models stay in the grid's order.
+    rows.sort(key=rank)
+    ranked = [row for row in rows if not rank(row)[0]]
+    return {
+        "models": rows,
+        "columns": sorted({key for row in rows for key in row["metrics"] or {}}),
+        "best": ranked[0]["name"] if ranked else None,
+        "done": all(model.status not in ACTIVE_STATUSES for model in models),
+    }
@@ -1,35 +1,187 @@
+import atexit
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
 from flask import Flask
 from loguru import logger
-from tensorboard.program import TensorBoard
-from werkzeug.serving import is_running_from_reloader
 
-from server.interface import Interface
+from server.process_stats import (
+    ProcessStats,
+    cpu_percent,
+    established_connections,
+    process_stats,
+)
 
 HOST = "0.0.0.0"
 DEFAULT_TENSORBOARD_PORT = "6006"
+DEFAULT_TENSORBOARD_IDLE_SECONDS = 600
+TENSORBOARD_KEY = "tensorboard"
+START_TIMEOUT_S = 30
+WATCH_INTERVAL_S = 10
+
+
+class TensorBoardService:
+    """Runs TensorBoard in a subprocess on demand, and stops it once it's been
+    idle for a while.
+
+    TensorBoard is in use while it's being requested through the api, or
+    while a browser has a connection open to it.
+    """
+
+    def __init__(
+        self,
+        port: int = int(DEFAULT_TENSORBOARD_PORT),
+        idle_seconds: float = DEFAULT_TENSORBOARD_IDLE_SECONDS,
+        host: str = HOST,
+    ) -> None:
+        self.port = port
+        self.idle_seconds = idle_seconds
+        self.host = host
+
+        self.logdir: Optional[Path] = None
+        self.started_at: Optional[float] = None
+        self._process: Optional[subprocess.Popen] = None
+        self._last_used = 0.0
+        self._stats: Optional[ProcessStats] = None
+        self._cpu_percent: Optional[float] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        atexit.register(self.stop)
+
+    @classmethod
+    def from_app(cls, app: Flask) -> "TensorBoardService":
+        if TENSORBOARD_KEY not in app.extensions:
+            app.extensions[TENSORBOARD_KEY] = cls(
+                port=int(app.config.get("TENSORBOARD_PORT", DEFAULT_TENSORBOARD_PORT)),
+                idle_seconds=float(
+                    app.config.get(
+                        "TENSORBOARD_IDLE_SECONDS", DEFAULT_TENSORBOARD_IDLE_SECONDS
+                    )
+                ),
+            )
+        return app.extensions[TENSORBOARD_KEY]
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def start(self, logdir: Path) -> None:
+        """Starts TensorBoard over a log folder, restarting it if it's
+        running over another, and waits until it's serving."""
+        with self._lock:
+            self._last_used = time.monotonic()
+            if self.running and self.logdir == logdir:
+                return
+
+            self._stop()
+            logger.info(f"Starting tensorboard for {logdir}")
+            self._process = subprocess.Popen(
+                [
+                    sys.executable,
+                    "-m",
+                    "tensorboard.main",
+                    f"--logdir={logdir}",
+                    f"--port={self.port}",
+                    f"--host={self.host}",
+                ],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            self.logdir = logdir
+            self.started_at = time.time()
+            self._stats = None
+            self._cpu_percent = None
+
+            if self._watcher is None or not self._watcher.is_alive():
+                self._watcher = threading.Thread(target=self._watch, daemon=True)
+                self._watcher.start()
+
+        self._wait_until_serving()
+
+    def stop(self) -> None:
+        with self._lock:
+            self._stop()
+
+    def info(self) -> Dict[str, Any]:
+        """Returns whether TensorBoard is running, and its resource use."""
+        with self._lock:
+            running = self.running
+            if running:
+                self._sample()
+            return {
+                "running": running,
+                "port": self.port,
+                "logdir": str(self.logdir) if running else None,
+                "pid": self._process.pid if running else None,
+                "started_at": self.started_at if running else None,
+                "idle_seconds": time.monotonic() - self._last_used if running else None,
+                "idle_timeout_seconds": self.idle_seconds,
+                "cpu_percent": self._cpu_percent if running else None,
+                "memory_bytes": (
+                    self._stats.rss_bytes if running and self._stats else None
+                ),
+            }
 
+    def _stop(self) -> None:
+        """Stops TensorBoard. Assumes the lock is held."""
+        if self._process is None:
+            return
 
-def launch_tensorboard(app: Flask) -> None:
-    interface = Interface.from_app(app)
-    model_dir = interface.model_manager.folder
+        logger.info("Stopping tensorboard")
+        self._process.terminate()
+        try:
+            self._process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        self._process = None
+        self.logdir = None
+        self.started_at = None
 
-    if _is_running(app):
-        logger.info("Tensorboard already running!")
-        return
+    def _sample(self) -> None:
+        """Updates the resource use of TensorBoard. Assumes the lock is held."""
+        stats = process_stats(self._process.pid)
+        if stats is None:
+            return
+        if self._stats is not None:
+            percent = cpu_percent(self._stats, stats)
+            if percent is not None:
+                self._cpu_percent = percent
+        elif self.started_at is not None:
+            # Until there are two samples, average over its whole run.
+            elapsed = time.time() - self.started_at
+            self._cpu_percent = 100 * stats.cpu_seconds / elapsed if elapsed else None
+        self._stats = stats
 
-    logger.info("Starting tensorboard")
-    tensorboard = TensorBoard()
-    tensorboard.configure(
-        argv=[
-            "tensorboard",
-            f"--logdir={model_dir}",
-            f"--port={app.config.get('TENSORBOARD_PORT', DEFAULT_TENSORBOARD_PORT)}",
-            f"--host={HOST}",
-        ]
-    )
-    url = tensorboard.launch()
-    logger.info(f"Tensorboard running on {url}")
+    def _watch(self) -> None:
+        while True:
+            time.sleep(WATCH_INTERVAL_S)
+            with self._lock:
+                if not self.running:
+                    self._stop()
+                    return
 
+                self._sample()
+                if established_connections(self.port) > 0:
+                    self._last_used = time.monotonic()
+                elif time.monotonic() - self._last_used > self.idle_seconds:
+                    logger.info("Tensorboard has been idle")
+                    self._stop()
+                    return
 
-def _is_running(app: Flask) -> bool:
-    return is_running_from_reloader()
+    def _wait_until_serving(self) -> None:
+        deadline = time.monotonic() + START_TIMEOUT_S
+        while time.monotonic() < deadline:
+            if not self.running:
+                raise RuntimeError("Tensorboard exited while starting")
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError("Timed out waiting for tensorboard to start")
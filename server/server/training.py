@@ -0,0 +1,239 @@
+"""Runs a training job in its own process, so that a crash or running out of
+memory during training can't take the server down with it.
+
+The server starts this module with:
+
+    python -m server.training --job JOB_FILE --log-file LOG_FILE ...
+
+and follows its progress through the progress file it writes.
+"""
+
+import argparse
+import ctypes
+import json
+import os
+import re
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+PROGRESS_FILE = "progress.json"
+CHECKPOINT_PATTERN = re.compile(r"^checkpoint-(\d+)$")
+# Written once the rest of a checkpoint has been saved.
+TRAINER_STATE_FILE = "trainer_state.json"
+PROGRESS_INTERVAL_S = 2.0
+THREAD_ENV_VARS = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"]
+# From <linux/prctl.h>
+PR_SET_PDEATHSIG = 1
+# The folder holding the server package, which training processes import.
+PACKAGE_ROOT = Path(__file__).resolve().parent.parent
+
+
+@dataclass
+class TrainingLimits:
+    """Resource limits for a training process."""
+
+    threads: Optional[int] = None  # Defaults to torch's choice
+    memory_bytes: Optional[int] = None  # Unlimited if None or 0
+
+
+def start_training(
+    job_file: Path,
+    log_file: Path,
+    progress_file: Path,
+    limits: TrainingLimits,
+) -> subprocess.Popen:
+    """Starts a training process for a saved job.
+
+    The process leads its own process group, so that it and any data loader
+    processes it spawns can be stopped together with `stop_training`.
+    """
+    env = dict(os.environ)
+    # Don't rely on the server having been started from the package root, but
+    # keep the working directory, which relative paths are resolved against.
+    python_path = [str(PACKAGE_ROOT), env.get("PYTHONPATH", "")]
+    env["PYTHONPATH"] = os.pathsep.join(path for path in python_path if path)
+    if limits.threads:
+        for name in THREAD_ENV_VARS:
+            env[name] = str(limits.threads)
+
+    command = [
+        sys.executable,
+        "-m",
+        "server.training",
+        "--job",
+        str(job_file),
+        "--log-file",
+        str(log_file),
+        "--progress-file",
+        str(progress_file),
+    ]
+    if limits.threads:
+        command += ["--threads", str(limits.threads)]
+    if limits.memory_bytes:
+        command += ["--memory-bytes", str(limits.memory_bytes)]
+
+    return subprocess.Popen(command, env=env, start_new_session=True)
+
+
+def stop_training(process: subprocess.Popen, timeout: float = 10) -> None:
+    """Asks a training process group to stop, killing it if it hasn't
+    within the timeout."""
+    if process.poll() is not None:
+        return
+
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+
+def available_cpus() -> int:
+    """Returns the number of cores this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def read_progress(progress_file: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(progress_file) as progress:
+            return json.load(progress)
+    except (OSError, ValueError):
+        return None
+
+
+def latest_checkpoint(
+    output_dir: Path, remove_incomplete: bool = False
+) -> Optional[Path]:
+    """Returns the latest complete checkpoint in a training output folder.
+
+    Parameters:
+        output_dir: The training output folder.
+        remove_incomplete: Whether to remove any incomplete checkpoints after
+            the latest complete one, left by training being stopped while
+            saving, so that the trainer doesn't try to resume from them.
+            Only safe when the model isn't training.
+    """
+    if not output_dir.is_dir():
+        return None
+
+    checkpoints = []
+    for path in output_dir.iterdir():
+        match = CHECKPOINT_PATTERN.match(path.name)
+        if match and path.is_dir():
+            checkpoints.append((int(match.group(1)), path))
+
+    for _, checkpoint in sorted(checkpoints, reverse=True):
+        if (checkpoint / TRAINER_STATE_FILE).is_file():
+            return checkpoint
+        if remove_incomplete:
+            shutil.rmtree(checkpoint)
+    return None
+
+
+def describe_exit(returncode: int) -> str:
+    if returncode < 0:
+        name = signal.Signals(-returncode).name
+        return f"Training process was killed by {name}"
+    return f"Training process exited with code {returncode}"
+
+
+def _write_progress(progress_file: Path, data: Dict[str, Any]) -> None:
+    temp_file = progress_file.with_suffix(".tmp")
+    with open(temp_file, "w") as progress:
+        json.dump(data, progress)
+    os.replace(temp_file, progress_file)
+
+
+def _limit_resources(threads: Optional[int], memory_bytes: Optional[int]) -> None:
+    # Stop training if the server dies, rather than being orphaned.
+    if sys.platform.startswith("linux"):
+        libc = ctypes.CDLL(None)
+        libc.prctl(PR_SET_PDEATHSIG, signal.SIGTERM)
+
+    # RLIMIT_DATA covers the heap and anonymous mappings, which is where
+    # tensors live, without counting the address space reserved for shared
+    # libraries as RLIMIT_AS would.
+    if memory_bytes:
+        resource.setrlimit(resource.RLIMIT_DATA, (memory_bytes, memory_bytes))
+
+    if threads:
+        import torch
+
+        torch.set_num_threads(threads)
+
+
+def _install_progress_callback(progress_file: Path) -> None:
+    """Makes the trainer elpis builds report its progress to a file.
+
+    run_job doesn't take callbacks, so the Trainer class it uses is swapped
+    for one which adds ours.
+    """
+    from elpis.trainer import trainer as elpis_trainer
+    from transformers import Trainer, TrainerCallback
+
+    class ProgressCallback(TrainerCallback):
+        last_write = 0.0
+
+        def on_step_end(self, args, state, control, **kwargs):
+            if time.monotonic() - self.last_write < PROGRESS_INTERVAL_S:
+                return
+            self.write(state)
+
+        def on_train_end(self, args, state, control, **kwargs):
+            self.write(state)
+
+        def write(self, state) -> None:
+            self.last_write = time.monotonic()
+            _write_progress(
+                progress_file,
+                {
+                    "step": state.global_step,
+                    "max_steps": state.max_steps,
+                    "epoch": state.epoch,
+                    "progress": (
+                        state.global_step / state.max_steps if state.max_steps else None
+                    ),
+                    "updated_at": time.time(),
+                },
+            )
+
+    class ProgressTrainer(Trainer):
+        def __init__(self, *args, **kwargs) -> None:
+            super().__init__(*args, **kwargs)
+            self.add_callback(ProgressCallback())
+
+    elpis_trainer.Trainer = ProgressTrainer  # type: ignore
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--job", type=Path, required=True)
+    parser.add_argument("--log-file", type=Path, required=True)
+    parser.add_argument("--progress-file", type=Path, required=True)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--memory-bytes", type=int)
+    parsed = parser.parse_args(args)
+
+    _limit_resources(parsed.threads, parsed.memory_bytes)
+    _install_progress_callback(parsed.progress_file)
+
+    from elpis.models import Job
+    from elpis.trainer import run_job
+
+    run_job(job=Job.from_json(parsed.job), log_file=parsed.log_file)
+
+
+if __name__ == "__main__":
+    main()
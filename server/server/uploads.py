@@ -0,0 +1,372 @@
+"""Extracts uploaded zip files as they arrive, rather than saving them first.
+
+Zip files are usually read from their central directory at the end of the
+file, but every entry is also preceded by a local header, so an archive can
+be extracted front to back from a stream.
+"""
+
+import os
+import shutil
+import struct
+import uuid
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path, PurePosixPath
+from typing import Any, BinaryIO, Iterator, Optional, Tuple
+
+DEFAULT_UPLOAD_MAX_BYTES = 32 * 1024**3
+DEFAULT_UPLOAD_MAX_FILES = 10_000
+CHUNK_SIZE = 1024 * 1024
+
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+# Signatures of the records after the last entry.
+END_SIGNATURES = {b"PK\x01\x02", b"PK\x05\x06", b"PK\x06\x06"}
+
+LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+EXTRA_HEADER = struct.Struct("<HH")
+DESCRIPTOR = struct.Struct("<4sIII")
+ZIP64_DESCRIPTOR = struct.Struct("<4sIQQ")
+ZIP64_EXTRA_ID = 0x0001
+ZIP64_MARKER = 0xFFFFFFFF
+
+ENCRYPTED_FLAG = 0x1
+DESCRIPTOR_FLAG = 0x8
+UTF8_FLAG = 0x800
+STORED = 0
+DEFLATED = 8
+
+# Folders of metadata which archivers add, which aren't part of the model.
+IGNORED_FOLDERS = {"__MACOSX"}
+
+
+class UploadError(ValueError):
+    """An upload which isn't a valid zip file, or is over its limits."""
+
+
+@dataclass
+class _Entry:
+    name: str
+    method: int
+    crc: int
+    compressed_size: int
+    size: int
+    has_descriptor: bool
+    zip64: bool
+    file: Optional[BinaryIO] = None
+    inflater: Any = field(default=None, repr=False)
+    data_done: bool = False
+    written: int = 0
+    written_crc: int = 0
+
+
+class StreamingZipExtractor:
+    """A writable file which extracts the zip file written to it into a
+    folder, as the bytes arrive.
+
+    Entries are checked against their CRCs, and paths which would escape the
+    destination are rejected. Stored entries of unknown length, as written
+    by streaming zip writers, are delimited by their data descriptors.
+    """
+
+    def __init__(
+        self,
+        destination: Path,
+        max_bytes: Optional[int] = DEFAULT_UPLOAD_MAX_BYTES,
+        max_files: Optional[int] = DEFAULT_UPLOAD_MAX_FILES,
+    ) -> None:
+        self.destination = destination
+        self.destination.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes if max_bytes else None
+        self.max_files = max_files if max_files else None
+
+        self.total_bytes = 0
+        self.files = 0
+        self._buffer = bytearray()
+        self._entry: Optional[_Entry] = None
+        self._finished = False
+
+    def write(self, data: bytes) -> int:
+        if not self._finished:
+            self._buffer += data
+            self._process()
+        return len(data)
+
+    def close(self) -> None:
+        """Checks that the whole zip file was written.
+
+        Raises:
+            UploadError: If the upload ended part way through an entry.
+        """
+        self.release()
+        if not self._finished:
+            raise UploadError("The upload ended part way through the zip file")
+
+    def release(self) -> None:
+        """Closes the file being extracted, if any."""
+        if self._entry is not None and self._entry.file is not None:
+            self._entry.file.close()
+
+    def _process(self) -> None:
+        while not self._finished:
+            if self._entry is None:
+                if not self._read_header():
+                    return
+            elif not self._entry.data_done:
+                if not self._read_data(self._entry):
+                    return
+            elif not self._read_descriptor(self._entry):
+                return
+
+    def _read_header(self) -> bool:
+        if len(self._buffer) < 4:
+            return False
+
+        signature = bytes(self._buffer[:4])
+        if signature in END_SIGNATURES:
+            # Everything after the entries repeats what's in their headers.
+            self._finished = True
+            self._buffer.clear()
+            return False
+        if signature != LOCAL_HEADER_SIGNATURE:
+            raise UploadError("Not a zip file, or a corrupted one")
+
+        if len(self._buffer) < LOCAL_HEADER.size:
+            return False
+        (
+            _,
+            _,
+            flags,
+            method,
+            _,
+            _,
+            crc,
+            compressed_size,
+            size,
+            name_length,
+            extra_length,
+        ) = LOCAL_HEADER.unpack_from(self._buffer)
+        header_length = LOCAL_HEADER.size + name_length + extra_length
+        if len(self._buffer) < header_length:
+            return False
+
+        name_end = LOCAL_HEADER.size + name_length
+        raw_name = bytes(self._buffer[LOCAL_HEADER.size : name_end])
+        name = raw_name.decode("utf-8" if flags & UTF8_FLAG else "cp437")
+        extra = bytes(self._buffer[name_end:header_length])
+        del self._buffer[:header_length]
+
+        if flags & ENCRYPTED_FLAG:
+            raise UploadError(f"Encrypted zip entries aren't supported: {name}")
+        if method not in (STORED, DEFLATED):
+            raise UploadError(f"Unsupported compression method {method}: {name}")
+
+        zip64 = False
+        for extra_id, data in _extra_fields(extra):
+            if extra_id != ZIP64_EXTRA_ID:
+                continue
+            zip64 = True
+            count = len(data) // 8
+            values = list(struct.unpack(f"<{count}Q", data[: count * 8]))
+            if size == ZIP64_MARKER and values:
+                size = values.pop(0)
+            if compressed_size == ZIP64_MARKER and values:
+                compressed_size = values.pop(0)
+
+        entry = _Entry(
+            name=name,
+            method=method,
+            crc=crc,
+            compressed_size=compressed_size,
+            size=size,
+            has_descriptor=bool(flags & DESCRIPTOR_FLAG),
+            zip64=zip64,
+        )
+        if method == DEFLATED:
+            entry.inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+        self._open(entry)
+        self._entry = entry
+        return True
+
+    def _open(self, entry: _Entry) -> None:
+        parts = PurePosixPath(entry.name.replace("\\", "/")).parts
+        if entry.name.startswith(("/", "\\")) or ".." in parts or not parts:
+            raise UploadError(f"Invalid path in zip file: {entry.name}")
+        if parts[0] in IGNORED_FOLDERS:
+            return
+
+        path = self.destination.joinpath(*parts)
+        if entry.name.endswith(("/", "\\")):
+            path.mkdir(parents=True, exist_ok=True)
+            return
+
+        self.files += 1
+        if self.max_files is not None and self.files > self.max_files:
+            raise UploadError(f"Zip file has more than {self.max_files} files")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry.file = open(path, "wb")
+
+    def _read_data(self, entry: _Entry) -> bool:
+        if entry.inflater is not None:
+            self._inflate(entry)
+        elif entry.has_descriptor:
+            self._copy_until_descriptor(entry)
+        else:
+            self._copy(entry)
+
+        if entry.data_done and not entry.has_descriptor:
+            self._finish(entry, entry.crc, entry.size)
+        return entry.data_done
+
+    def _copy(self, entry: _Entry) -> None:
+        count = min(len(self._buffer), entry.compressed_size - entry.written)
+        self._output(entry, self._buffer[:count])
+        del self._buffer[:count]
+        entry.data_done = entry.written == entry.compressed_size
+
+    def _inflate(self, entry: _Entry) -> None:
+        inflater = entry.inflater
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        # Bound the output of each step, so a zip bomb can't exhaust memory
+        # before the size limit is checked.
+        while not inflater.eof:
+            output = inflater.decompress(data, CHUNK_SIZE)
+            self._output(entry, output)
+            data = inflater.unconsumed_tail
+            if not data and not output:
+                break
+
+        if inflater.eof:
+            self._buffer[:0] = inflater.unused_data + data
+            entry.data_done = True
+
+    def _copy_until_descriptor(self, entry: _Entry) -> None:
+        """Copies stored data up to its data descriptor, which is recognised
+        by its signature, then checked against the data before it."""
+        descriptor = ZIP64_DESCRIPTOR if entry.zip64 else DESCRIPTOR
+        size_mask = ZIP64_MARKER if not entry.zip64 else (1 << 64) - 1
+        start = 0
+        while (index := self._buffer.find(DESCRIPTOR_SIGNATURE, start)) >= 0:
+            if len(self._buffer) - index < descriptor.size:
+                break
+
+            _, crc, compressed_size, _ = descriptor.unpack_from(self._buffer, index)
+            data = self._buffer[:index]
+            if compressed_size == (
+                entry.written + index
+            ) & size_mask and crc == zlib.crc32(data, entry.written_crc):
+                self._output(entry, data)
+                del self._buffer[:index]
+                entry.data_done = True
+                return
+            start = index + 1
+        else:
+            # Keep enough to recognise a signature split across writes.
+            index = max(0, len(self._buffer) - len(DESCRIPTOR_SIGNATURE) + 1)
+
+        self._output(entry, self._buffer[:index])
+        del self._buffer[:index]
+
+    def _read_descriptor(self, entry: _Entry) -> bool:
+        descriptor = ZIP64_DESCRIPTOR if entry.zip64 else DESCRIPTOR
+        if len(self._buffer) < descriptor.size:
+            return False
+
+        if self._buffer.startswith(DESCRIPTOR_SIGNATURE):
+            _, crc, _, size = descriptor.unpack_from(self._buffer)
+            del self._buffer[: descriptor.size]
+        else:
+            # The signature is optional.
+            _, crc, _, size = descriptor.unpack(
+                b"\0\0\0\0" + self._buffer[: descriptor.size - 4]
+            )
+            del self._buffer[: descriptor.size - 4]
+
+        self._finish(entry, crc, size)
+        return True
+
+    def _output(self, entry: _Entry, data: bytes) -> None:
+        if not data:
+            return
+
+        self.total_bytes += len(data)
+        if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+            raise UploadError(
+                f"Zip file contents are larger than {self.max_bytes} bytes"
+            )
+
+        entry.written += len(data)
+        entry.written_crc = zlib.crc32(data, entry.written_crc)
+        if entry.file is not None:
+            entry.file.write(data)
+
+    def _finish(self, entry: _Entry, crc: int, size: int) -> None:
+        if entry.file is not None:
+            entry.file.close()
+        if entry.written_crc != crc or entry.written != size:
+            raise UploadError(f"Corrupted zip entry: {entry.name}")
+        self._entry = None
+
+
+def extract_stream(
+    stream: BinaryIO,
+    destination: Path,
+    max_bytes: Optional[int] = DEFAULT_UPLOAD_MAX_BYTES,
+    max_files: Optional[int] = DEFAULT_UPLOAD_MAX_FILES,
+) -> None:
+    """Extracts a zip file from a stream into a folder, chunk by chunk.
+
+    Raises:
+        UploadError: If the stream isn't a valid zip file, or its contents
+            are over the limits.
+    """
+    extractor = StreamingZipExtractor(destination, max_bytes, max_files)
+    try:
+        while chunk := stream.read(CHUNK_SIZE):
+            extractor.write(chunk)
+    except (zlib.error, struct.error, UnicodeDecodeError) as e:
+        raise UploadError(f"Corrupted zip file: {e}") from e
+    finally:
+        extractor.release()
+    extractor.close()
+
+
+def staging_folder(target: Path) -> Path:
+    """Returns a unique, hidden folder beside the target to extract into, so
+    that it can be moved into place with a rename."""
+    return target.parent / f".{target.name}.{uuid.uuid4().hex}.upload"
+
+
+def install_folder(staging: Path, target: Path) -> None:
+    """Moves an extracted folder into place, replacing the target folder.
+
+    If everything was extracted into a single top folder, that folder's
+    contents are installed instead.
+    """
+    children = list(staging.iterdir())
+    source = staging
+    if len(children) == 1 and children[0].is_dir():
+        source = children[0]
+
+    # Swap the new folder in with renames, so that the target is never
+    # partially written.
+    previous = None
+    if target.exists():
+        previous = staging_folder(target)
+        os.rename(target, previous)
+    os.rename(source, target)
+
+    if previous is not None:
+        shutil.rmtree(previous)
+    if source != staging:
+        shutil.rmtree(staging)
+
+
+def _extra_fields(extra: bytes) -> Iterator[Tuple[int, bytes]]:
+    offset = 0
+    while offset + EXTRA_HEADER.size <= len(extra):
+        extra_id, length = EXTRA_HEADER.unpack_from(extra, offset)
+        offset += EXTRA_HEADER.size
+        yield extra_id, extra[offset : offset + length]
+        offset += length
@@ -0,0 +1,65 @@
+from typing import List, Tuple
+
+import numpy as np
+
+FRAME_S = 0.03
+DEFAULT_VAD_THRESHOLD_DB = 10.0
+MIN_SILENCE_S = 0.5
+PADDING_S = 0.2
+# Frames quieter than this are silent, however quiet the rest of the audio is.
+SILENCE_DBFS = -60.0
+
+
+def speech_regions(
+    audio: np.ndarray,
+    sampling_rate: int,
+    threshold_db: float = DEFAULT_VAD_THRESHOLD_DB,
+    min_silence_s: float = MIN_SILENCE_S,
+    padding_s: float = PADDING_S,
+) -> List[Tuple[int, int]]:
+    """Finds the regions of some audio which are likely to contain speech,
+    by comparing the energy of short frames to the audio's noise floor.
+
+    Parameters:
+        audio: Mono audio samples.
+        sampling_rate: The sampling rate of the audio.
+        threshold_db: How far above the noise floor a frame must be to count
+            as speech.
+        min_silence_s: Gaps between speech shorter than this are kept, so
+            that pauses within an utterance aren't cut.
+        padding_s: The amount of audio kept either side of each region, so
+            that quiet word onsets and endings aren't clipped.
+
+    Returns:
+        The start and end sample of each region, in order.
+    """
+    if len(audio) == 0:
+        return []
+
+    frame = max(1, int(FRAME_S * sampling_rate))
+    frames = np.pad(audio, (0, -len(audio) % frame)).reshape(-1, frame)
+    energy_db = 10 * np.log10(np.mean(frames.astype(np.float64) ** 2, axis=1) + 1e-12)
+
+    floor, loud = np.percentile(energy_db, [10, 90])
+    if loud - floor < threshold_db:
+        # There's no distinctly quieter background, so keep anything audible.
+        is_speech = energy_db > SILENCE_DBFS
+    else:
+        is_speech = energy_db > max(floor + threshold_db, SILENCE_DBFS)
+
+    # Find the frames where runs of speech start and stop.
+    edges = np.diff(np.concatenate([[0], is_speech.astype(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    stops = np.flatnonzero(edges == -1)
+
+    regions: List[Tuple[int, int]] = []
+    min_silence = int(min_silence_s * sampling_rate)
+    padding = int(padding_s * sampling_rate)
+    for start_frame, stop_frame in zip(starts, stops):
+        start = max(0, start_frame * frame - padding)
+        stop = min(len(audio), stop_frame * frame + padding)
+        if regions and start - regions[-1][1] < min_silence:
+            regions[-1] = (regions[-1][0], stop)
+        else:
+            regions.append((start, stop))
+    return regions
@@ -0,0 +1,156 @@
+import io
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+import pytest
+from elpis.datasets.dataset import CleaningOptions
+from flask import Flask
+from flask.testing import FlaskClient
+from humps.main import camelize
+
+from server.api.datasets import dataset_bp
+from server.interface import Interface
+from server.managers.dataset_manager import FolderType
+from server.managers.model_manager import ModelManager
+
+ABUI_DIR = Path(__file__).parent.parent / "data" / "abui"
+
+
+@pytest.fixture()
+def interface(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Interface:
+    monkeypatch.setattr(ModelManager, "_start_workers", lambda self: None)
+    interface = Interface(tmp_path / "data")
+    interface.dataset_manager.datasets = {}
+    interface.dataset_manager.ingestions = {}
+    return interface
+
+
+@pytest.fixture()
+def app(interface: Interface) -> Flask:
+    app = Flask(__name__)
+    app.config["INTERFACE"] = interface
+    app.register_blueprint(dataset_bp)
+    return app
+
+
+@pytest.fixture()
+def client(app: Flask) -> FlaskClient:
+    return app.test_client()
+
+
+@pytest.fixture()
+def corpora(tmp_path: Path, app: Flask) -> Path:
+    """An import root, holding a copy of the abui dataset."""
+    corpora = tmp_path / "corpora"
+    shutil.copytree(ABUI_DIR, corpora / "abui")
+    app.config["IMPORT_ROOTS"] = [corpora]
+    return corpora
+
+
+def import_folder(client: FlaskClient, path: Path, name: str = "abui"):
+    return client.post(
+        "/datasets/import",
+        json={
+            "name": name,
+            "path": str(path),
+            "elanOptions": {
+                "selectionMechanism": "tier_name",
+                "selectionValue": "Phrase",
+            },
+        },
+    )
+
+
+def wait_until_ready(interface: Interface, name: str) -> None:
+    deadline = time.monotonic() + 30
+    while not interface.dataset_manager.is_ready(name):
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+
+
+def test_importing_is_disabled_without_roots(client: FlaskClient, tmp_path: Path):
+    shutil.copytree(ABUI_DIR, tmp_path / "abui")
+    assert import_folder(client, tmp_path / "abui").status_code == 403
+
+
+def test_imports_must_be_within_a_root(
+    client: FlaskClient, corpora: Path, tmp_path: Path
+):
+    outside = tmp_path / "outside"
+    shutil.copytree(ABUI_DIR, outside)
+    assert import_folder(client, outside).status_code == 403
+    assert import_folder(client, corpora / ".." / "outside").status_code == 403
+
+    # A symlinked folder is checked where it leads.
+    (corpora / "link").symlink_to(outside, target_is_directory=True)
+    assert import_folder(client, corpora / "link").status_code == 403
+
+
+def test_imports_skip_files_linked_from_outside_the_roots(
+    client: FlaskClient, interface: Interface, corpora: Path, tmp_path: Path
+):
+    secret = tmp_path / "secret.txt"
+    secret.write_text("secret")
+    (corpora / "abui" / "escape.txt").symlink_to(secret)
+    (corpora / "abui" / "escape.wav").symlink_to(secret)
+
+    assert import_folder(client, corpora / "abui").status_code == 202
+    raw_folder = interface.dataset_manager.dataset_folder("abui", FolderType.Raw)
+    assert sorted(path.name for path in raw_folder.iterdir()) == sorted(
+        path.name for path in ABUI_DIR.iterdir()
+    )
+    wait_until_ready(interface, "abui")
+
+
+def test_imported_files_are_linked_and_processed(
+    client: FlaskClient, interface: Interface, corpora: Path
+):
+    response = import_folder(client, corpora / "abui")
+    assert response.status_code == 202
+    assert import_folder(client, corpora / "abui").status_code == 409
+
+    manager = interface.dataset_manager
+    raw_folder = manager.dataset_folder("abui", FolderType.Raw)
+    for path in (corpora / "abui").iterdir():
+        assert os.path.samefile(path, raw_folder / path.name)
+
+    wait_until_ready(interface, "abui")
+    assert manager.is_dataset_processed("abui")
+
+
+def test_updates_reject_invalid_file_names(
+    client: FlaskClient, interface: Interface, corpora: Path
+):
+    assert import_folder(client, corpora / "abui").status_code == 202
+    wait_until_ready(interface, "abui")
+
+    response = client.post(
+        "/datasets/update/abui",
+        data={"file": (io.BytesIO(b"text"), "..")},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 400
+
+
+def test_creating_an_existing_dataset_leaves_its_files(
+    client: FlaskClient, interface: Interface, corpora: Path
+):
+    assert import_folder(client, corpora / "abui").status_code == 202
+    wait_until_ready(interface, "abui")
+    raw_folder = interface.dataset_manager.dataset_folder("abui", FolderType.Raw)
+    original = (raw_folder / "abui_1.eaf").read_bytes()
+
+    response = client.post(
+        "/datasets/",
+        data={
+            "name": "abui",
+            "cleaningOptions": json.dumps(camelize(CleaningOptions().to_dict())),
+            "file": (io.BytesIO(b"replaced"), "abui_1.eaf"),
+        },
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 409
+    assert (raw_folder / "abui_1.eaf").read_bytes() == original
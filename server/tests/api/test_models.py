@@ -0,0 +1,83 @@
+import io
+import zipfile
+from pathlib import Path
+
+import pytest
+from flask import Flask
+from flask.testing import FlaskClient
+
+from server.api.models import model_bp
+from server.interface import Interface
+from server.managers.model_manager import ModelManager
+
+
+@pytest.fixture()
+def interface(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Interface:
+    monkeypatch.setattr(ModelManager, "_start_workers", lambda self: None)
+    interface = Interface(tmp_path)
+    interface.model_manager.models = {}
+    return interface
+
+
+@pytest.fixture()
+def client(interface: Interface) -> FlaskClient:
+    app = Flask(__name__)
+    app.config["INTERFACE"] = interface
+    app.register_blueprint(model_bp)
+    return app.test_client()
+
+
+def upload(client: FlaskClient, data: bytes):
+    return client.post(
+        "/models/upload?filename=model.zip",
+        data=data,
+        content_type="application/zip",
+    )
+
+
+def test_corrupted_uploads_are_cleaned_up(client: FlaskClient, interface: Interface):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr("config.json", "{}" * 100)
+    data = bytearray(archive.getvalue())
+    data[41:49] = b"\xff" * 8
+
+    assert upload(client, bytes(data)).status_code == 400
+    assert list(interface.model_manager.folder.iterdir()) == []
+
+
+def test_concurrent_uploads_of_a_model_conflict(
+    client: FlaskClient, interface: Interface
+):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        zip_file.writestr("config.json", "{}")
+
+    assert interface.model_manager.reserve_upload("model")
+    assert upload(client, archive.getvalue()).status_code == 409
+
+    interface.model_manager.release_upload("model")
+    assert upload(client, archive.getvalue()).status_code == 204
+    assert (interface.model_manager.model_folder("model") / "config.json").exists()
+
+
+def test_log_tails_are_chunked(
+    client: FlaskClient, interface: Interface, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr("server.api.models.LOG_CHUNK_BYTES", 10)
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        zip_file.writestr("config.json", "{}")
+    assert upload(client, archive.getvalue()).status_code == 204
+    interface.model_manager.logs_path("model").write_text("first\nsecond\nthird\n")
+
+    data = client.get("/models/logs/model?since=0").get_json()
+    assert data == {"lines": ["first"], "offset": 6, "more": True}
+    data = client.get("/models/logs/model?since=6").get_json()
+    assert data == {"lines": ["second"], "offset": 13, "more": True}
+    data = client.get("/models/logs/model?since=13").get_json()
+    assert data == {"lines": ["third"], "offset": 19, "more": False}
+
+    # A truncated log is read again from the start.
+    data = client.get("/models/logs/model?since=100").get_json()
+    assert data == {"lines": ["first"], "offset": 6, "more": True}
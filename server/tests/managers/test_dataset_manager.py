@@ -1,4 +1,5 @@
 import os
+import time
 from pathlib import Path
 
 import pytest
@@ -7,7 +8,7 @@ from elpis.datasets.dataset import CleaningOptions, ElanOptions
 from elpis.models import ElanTierSelector
 
 from server.managers import DatasetManager
-from server.managers.dataset_manager import FolderType
+from server.managers.dataset_manager import DatasetState, FolderType
 from server.managers.manager import ManagerType
 
 TEST_DATA_DIR = Path(__file__).parent.parent / "data"
@@ -17,7 +18,11 @@ ABUI_FILES = [ABUI_DIR / name for name in os.listdir(ABUI_DIR)]
 
 @pytest.fixture()
 def manager(tmp_path: Path) -> DatasetManager:
-    return DatasetManager(tmp_path)
+    manager = DatasetManager(tmp_path)
+    # Datasets are shared between managers, so start each test without any.
+    manager.datasets = {}
+    manager.ingestions = {}
+    return manager
 
 
 @pytest.fixture()
@@ -66,3 +71,151 @@ def test_dataset_managers_share_state(
     other_manager.delete_dataset(dataset.name)
     assert len(manager.datasets) == 0
     assert len(other_manager.datasets) == 0
+
+
+def test_add_dataset_reports_preprocessing(manager: DatasetManager, dataset: Dataset):
+    manager.add_dataset(dataset)
+
+    report = manager.preprocessing_report(dataset.name)
+    assert report is not None
+    assert report["failures"] == 0
+    assert len(report["batches"]) == len(ABUI_FILES) // 2
+
+
+def test_ingest_processes_datasets_in_the_background(
+    manager: DatasetManager, dataset: Dataset
+):
+    assert manager.ingest(dataset)
+    assert dataset.name in manager
+    assert manager.ingestion(dataset.name).state in (
+        DatasetState.QUEUED,
+        DatasetState.PROCESSING,
+    )
+    assert not manager.ingest(dataset)
+
+    deadline = time.monotonic() + 30
+    while manager.ingestion(dataset.name).state != DatasetState.READY:
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+
+    progress = manager.ingestion(dataset.name).progress()
+    assert progress["processed"] == progress["total"] == len(ABUI_FILES) // 2
+    assert progress["fraction"] == 1
+    assert manager.is_dataset_processed(dataset.name)
+    assert manager.serialize()[dataset.name]["ingestion"]["state"] == "ready"
+
+
+def test_interrupted_ingestion_is_requeued(
+    tmp_path: Path, manager: DatasetManager, dataset: Dataset
+):
+    manager.add_dataset(dataset)
+    manager.ingestion(dataset.name).state = DatasetState.PROCESSING
+    manager.save()
+
+    restored = DatasetManager(tmp_path)
+    assert restored.ingestion(dataset.name).state in (
+        DatasetState.QUEUED,
+        DatasetState.PROCESSING,
+        DatasetState.READY,
+    )
+    deadline = time.monotonic() + 30
+    while not restored.is_ready(dataset.name):
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+
+
+def test_update_dataset_only_reprocesses_changes(
+    manager: DatasetManager, dataset: Dataset
+):
+    manager.add_dataset(dataset)
+    processed_folder = manager.dataset_folder(dataset.name, FolderType.Processed)
+    kept = {path.name: path.stat().st_mtime_ns for path in processed_folder.iterdir()}
+
+    manager.update_dataset(dataset.name, [], removed=["abui_4.eaf", "abui_4.wav"])
+    deadline = time.monotonic() + 30
+    while not manager.is_ready(dataset.name):
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+
+    assert manager.ingestion(dataset.name).total == 0
+    assert len(manager.datasets[dataset.name].files) == len(ABUI_FILES) - 2
+    remaining = {path.name for path in processed_folder.iterdir()}
+    assert not any(name.startswith("abui_4") for name in remaining)
+    for name in remaining:
+        assert (processed_folder / name).stat().st_mtime_ns == kept[name]
+
+
+def test_update_dataset_must_leave_it_valid(manager: DatasetManager, dataset: Dataset):
+    manager.add_dataset(dataset)
+    with pytest.raises(ValueError):
+        manager.update_dataset(dataset.name, [], removed=["abui_1.wav"])
+    assert len(manager.datasets[dataset.name].files) == len(ABUI_FILES)
+
+
+def test_processed_datasets_are_summarised(manager: DatasetManager, dataset: Dataset):
+    manager.add_dataset(dataset)
+
+    summary = manager.summary(dataset.name)
+    assert summary is not None and summary.complete
+    processed_folder = manager.dataset_folder(dataset.name, FolderType.Processed)
+    processed = list(processed_folder.iterdir())
+    assert summary.files == len(processed)
+    assert summary.size_bytes == sum(path.stat().st_size for path in processed)
+    assert summary.raw_files == len(ABUI_FILES)
+    assert manager.is_dataset_processed(dataset.name)
+
+
+def test_repairing_a_dataset_reprocesses_missing_files(
+    manager: DatasetManager, dataset: Dataset
+):
+    manager.add_dataset(dataset)
+    assert manager.verify_dataset(dataset.name)["ok"]
+
+    processed_folder = manager.dataset_folder(dataset.name, FolderType.Processed)
+    missing = next(processed_folder.glob("abui_2*"))
+    missing.unlink()
+    result = manager.verify_dataset(dataset.name, repair=True)
+    assert result["missing_outputs"] == [missing.name]
+    assert result["repairing"]
+
+    deadline = time.monotonic() + 30
+    while not manager.is_ready(dataset.name):
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+    assert missing.exists()
+    assert manager.ingestion(dataset.name).total == 1
+    assert manager.verify_dataset(dataset.name)["ok"]
+
+
+def test_datasets_link_files_rather_than_copying(
+    tmp_path: Path, manager: DatasetManager
+):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    for path in ABUI_FILES:
+        (corpus / path.name).write_bytes(path.read_bytes())
+
+    dataset = Dataset(
+        name="linked",
+        files=sorted(corpus.iterdir()),
+        cleaning_options=CleaningOptions(),
+        elan_options=ElanOptions(ElanTierSelector.NAME, "Phrase"),
+    )
+    manager.add_dataset(dataset)
+
+    raw_folder = manager.dataset_folder(dataset.name, FolderType.Raw)
+    for path in corpus.iterdir():
+        assert os.path.samefile(path, raw_folder / path.name)
+
+    # Replacing a linked file leaves the original alone.
+    replacement = tmp_path / "abui_1.wav"
+    replacement.write_bytes((corpus / "abui_2.wav").read_bytes())
+    original = (corpus / "abui_1.wav").read_bytes()
+    manager.update_dataset(dataset.name, [replacement])
+    deadline = time.monotonic() + 30
+    while not manager.is_ready(dataset.name):
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+
+    assert (corpus / "abui_1.wav").read_bytes() == original
+    assert os.path.samefile(replacement, raw_folder / "abui_1.wav")
@@ -0,0 +1,252 @@
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+import pytest
+from elpis.models import Job
+
+from server.blob_store import BlobStore
+from server.managers import model_manager
+from server.managers.model_manager import (
+    MAX_TRAINING_INTERRUPTIONS,
+    ModelManager,
+    QuantizationState,
+    TrainingSettings,
+)
+from server.named_job import JobStatus, NamedJob
+
+
+@pytest.fixture()
+def manager(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> ModelManager:
+    # Keep models queued, rather than training them.
+    monkeypatch.setattr(ModelManager, "_start_workers", lambda self: None)
+    manager = ModelManager(tmp_path, overwrite=True)
+    manager.models = {}
+    return manager
+
+
+def add_model(manager: ModelManager, name: str) -> None:
+    job = Job.from_args(
+        [
+            "--model_name_or_path=test",
+            "--dataset_name_or_path=test",
+            f"--output_dir={manager.model_folder(name)}",
+        ]
+    )
+    manager.add_job(NamedJob(name, job))
+
+
+def test_train_queues_models_by_priority(manager: ModelManager):
+    for name in ["a", "b", "c"]:
+        add_model(manager, name)
+
+    assert manager.train("a") == JobStatus.QUEUED
+    manager.train("b")
+    manager.train("c", priority=1)
+
+    assert manager.queue_position("c") == 0
+    assert manager.queue_position("a") == 1
+    assert manager.train("a") == JobStatus.QUEUED
+    assert manager.train("missing") is None
+
+
+def test_cancel_removes_queued_models(manager: ModelManager):
+    add_model(manager, "a")
+    assert not manager.cancel("a")
+
+    manager.train("a")
+    assert manager.cancel("a")
+    assert manager.status("a") == JobStatus.CANCELLED
+    assert manager.queue_position("a") is None
+
+
+def test_queue_is_restored_from_state(manager: ModelManager, tmp_path: Path):
+    for name in ["a", "b"]:
+        add_model(manager, name)
+    manager.train("a")
+    manager.train("b", priority=1)
+
+    restored = ModelManager(tmp_path)
+    assert restored.queue_position("b") == 0
+    assert restored.queue_position("a") == 1
+
+
+def test_interrupted_training_is_resumed(manager: ModelManager, tmp_path: Path):
+    for name in ["a", "b"]:
+        add_model(manager, name)
+    manager.train("a")
+    manager.models["b"].status = JobStatus.TRAINING
+    manager.save()
+
+    restored = ModelManager(tmp_path)
+    job = restored.models["b"]
+    assert job.status == JobStatus.QUEUED
+    assert job.resume
+    assert restored.queue_position("b") == 0
+
+    # Resume from the latest complete checkpoint.
+    output_dir = Path(job.job.training_args.output_dir)
+    (output_dir / "checkpoint-10").mkdir(parents=True)
+    (output_dir / "checkpoint-10" / "trainer_state.json").write_text("{}")
+    training_job = restored._training_job(job)
+    assert not training_job.training_args.overwrite_output_dir
+
+
+def test_repeatedly_interrupted_training_fails(manager: ModelManager, tmp_path):
+    add_model(manager, "a")
+    manager.models["a"].status = JobStatus.TRAINING
+    manager.models["a"].interruptions = MAX_TRAINING_INTERRUPTIONS
+    manager.save()
+
+    restored = ModelManager(tmp_path)
+    assert restored.status("a") == JobStatus.ERROR
+    assert restored.queue_position("a") is None
+
+
+def test_training_slots_divide_the_cores(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(model_manager, "available_cpus", lambda: 16)
+    monkeypatch.setattr(ModelManager, "_start_workers", lambda self: None)
+
+    def slots(**settings):
+        manager = ModelManager(tmp_path, True, TrainingSettings(**settings))
+        return manager.queue_info()["concurrency"], manager.queue_info()["threads"]
+
+    assert slots() == (1, None)
+    assert slots(concurrency=2) == (2, 8)
+    assert slots(concurrency=0) == (4, 4)
+    assert slots(concurrency=0, threads=8) == (2, 8)
+
+
+def test_sweep_lists_its_models(manager: ModelManager):
+    for name in ["sweep-1", "other", "sweep-2"]:
+        add_model(manager, name)
+    for name in ["sweep-1", "sweep-2"]:
+        manager.models[name].sweep = "sweep"
+
+    assert [job.name for job in manager.sweep("sweep")] == ["sweep-1", "sweep-2"]
+    assert manager.sweep("missing") == []
+
+
+def test_models_are_quantized_in_the_background(
+    manager: ModelManager, monkeypatch: pytest.MonkeyPatch
+):
+    started, release = threading.Event(), threading.Event()
+
+    def quantize(model_name: str, max_samples: int):
+        started.set()
+        release.wait(5)
+        if model_name == "broken":
+            raise ValueError("No held out samples")
+        return {}
+
+    monkeypatch.setattr(manager, "quantize", quantize)
+    quantization = manager.queue_quantization("model", max_samples=3)
+    assert started.wait(5)
+    assert quantization.state == QuantizationState.QUANTIZING
+    # Queueing it again while it's running changes nothing.
+    assert manager.queue_quantization("model") is quantization
+
+    release.set()
+    broken = manager.queue_quantization("broken")
+    deadline = time.monotonic() + 5
+    while broken.active:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    assert quantization.state == QuantizationState.DONE
+    assert broken.state == QuantizationState.ERROR
+    assert broken.error == "No held out samples"
+
+
+def test_training_waits_for_installed_files_to_be_deduplicated(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(ModelManager, "_start_workers", lambda self: None)
+    manager = ModelManager(tmp_path, overwrite=True, blobs=BlobStore(tmp_path / "b"))
+    manager.models = {}
+    add_model(manager, "model")
+
+    events: List[str] = []
+    release = threading.Event()
+
+    def deduplicate(model_name: str) -> int:
+        release.wait(5)
+        events.append("deduplicated")
+        return 0
+
+    def start_training(*args):
+        raise RuntimeError("Not training in tests")
+
+    monkeypatch.setattr(manager, "deduplicate", deduplicate)
+    monkeypatch.setattr(
+        manager.blobs, "detach_folder", lambda folder: events.append("detached")
+    )
+    monkeypatch.setattr(model_manager, "start_training", start_training)
+
+    staging = tmp_path / "staging"
+    staging.mkdir()
+    (staging / "config.json").write_text("{}")
+    manager.install("model", staging)
+
+    training = threading.Thread(target=manager._train, args=("model",))
+    training.start()
+    time.sleep(0.2)
+    assert events == []
+
+    release.set()
+    training.join(5)
+    assert events == ["deduplicated", "detached"]
+
+
+def test_training_stopped_by_shutdown_is_resumed(
+    manager: ModelManager, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    add_model(manager, "a")
+
+    def start_training(*args):
+        return subprocess.Popen(
+            [sys.executable, "-c", "import time; time.sleep(60)"],
+            start_new_session=True,
+        )
+
+    monkeypatch.setattr(model_manager, "start_training", start_training)
+    training = threading.Thread(target=manager._train, args=("a",))
+    training.start()
+    deadline = time.monotonic() + 5
+    while "a" not in manager._processes:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+    manager._stop_processes()
+    training.join(15)
+    assert manager.status("a") == JobStatus.TRAINING
+    manager.save()
+
+    restored = ModelManager(tmp_path)
+    assert restored.models["a"].status == JobStatus.QUEUED
+    assert restored.models["a"].resume
+    assert restored.queue_position("a") == 0
+
+
+def test_cancelling_before_the_process_starts_stops_it(
+    manager: ModelManager, monkeypatch: pytest.MonkeyPatch
+):
+    add_model(manager, "a")
+    manager.train("a")
+    # A worker has taken the model, but not yet started training it.
+    assert manager._queue.get() == "a"
+    assert manager.cancel("a")
+
+    def start_training(*args):
+        return subprocess.Popen(
+            [sys.executable, "-c", "import time; time.sleep(60)"],
+            start_new_session=True,
+        )
+
+    monkeypatch.setattr(model_manager, "start_training", start_training)
+    manager._train("a")
+    assert manager.status("a") == JobStatus.CANCELLED
+    assert not manager.cancel("a")
@@ -0,0 +1,75 @@
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from server.managers.transcription_manager import (
+    TranscriptionJob,
+    TranscriptionManager,
+    TranscriptionSettings,
+    TranscriptionStatus,
+)
+
+
+@pytest.fixture()
+def started(monkeypatch: pytest.MonkeyPatch) -> List[TranscriptionManager]:
+    """Records the managers which start workers, rather than starting them."""
+    started: List[TranscriptionManager] = []
+    monkeypatch.setattr(
+        TranscriptionManager, "_start_workers", lambda self: started.append(self)
+    )
+    return started
+
+
+def test_waiting_and_interrupted_jobs_are_requeued(
+    tmp_path: Path, started: List[TranscriptionManager]
+):
+    manager = TranscriptionManager(tmp_path, tmp_path / "models", overwrite=True)
+    manager.transcriptions = {}
+    statuses = {
+        "finished": (TranscriptionStatus.FINISHED, 1.0),
+        "waiting": (TranscriptionStatus.WAITING, 3.0),
+        "interrupted": (TranscriptionStatus.TRANSCRIBING, 2.0),
+    }
+    for name, (status, queued_at) in statuses.items():
+        job = TranscriptionJob("model", name, status=status, queued_at=queued_at)
+        manager.add_transcription_job(job)
+    assert started == []
+
+    restored = TranscriptionManager(tmp_path, tmp_path / "models")
+    assert started == [restored]
+
+    interrupted = restored.get_transcription_job("model", "interrupted")
+    waiting = restored.get_transcription_job("model", "waiting")
+    assert interrupted is not None and waiting is not None
+    assert interrupted.status == TranscriptionStatus.WAITING
+    assert restored.queue_position(interrupted) == 0
+    assert restored.queue_position(waiting) == 1
+    assert restored.queue_info()["queue_depth"] == 2
+
+
+def test_uploads_which_were_never_queued_stay_idle(
+    tmp_path: Path, started: List[TranscriptionManager]
+):
+    manager = TranscriptionManager(tmp_path, tmp_path / "models", overwrite=True)
+    manager.transcriptions = {}
+    manager.add_transcription_job(TranscriptionJob("model", "uploaded"))
+
+    restored = TranscriptionManager(tmp_path, tmp_path / "models")
+    assert started == []
+    job = restored.get_transcription_job("model", "uploaded")
+    assert job is not None and job.status == TranscriptionStatus.WAITING
+    assert restored.queue_info()["queue_depth"] == 0
+
+
+def test_pipelines_are_reported_from_the_inference_backend(tmp_path: Path):
+    manager = TranscriptionManager(tmp_path, tmp_path / "models", overwrite=True)
+    assert manager.pipelines_info()["backend"] == "local"
+    assert manager.pipelines_info()["pipelines"] == []
+
+    settings = TranscriptionSettings(inference_processes=2)
+    manager = TranscriptionManager(tmp_path, tmp_path / "models", settings=settings)
+    info = manager.pipelines_info()
+    assert info["backend"] == "processes"
+    assert info["processes"] == 2
+    assert "pipelines" not in info
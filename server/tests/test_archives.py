@@ -0,0 +1,91 @@
+import io
+import zipfile
+from pathlib import Path
+
+import pytest
+from flask import Flask
+
+from server.archives import ArchiveCache
+
+
+@pytest.fixture()
+def source(tmp_path: Path) -> Path:
+    folder = tmp_path / "model"
+    (folder / "checkpoint-1").mkdir(parents=True)
+    (folder / "config.json").write_text("{}")
+    (folder / "checkpoint-1" / "weights.bin").write_bytes(bytes(range(256)) * 100)
+    return folder
+
+
+def download(cache: ArchiveCache, source: Path, headers=None):
+    app = Flask(__name__)
+    with app.test_request_context(headers=headers):
+        response = cache.response(source, "model.zip")
+        response.direct_passthrough = False
+        return response.status_code, response.get_data()
+
+
+def test_archives_are_streamed_then_cached(tmp_path: Path, source: Path):
+    cache = ArchiveCache(tmp_path / "archives")
+
+    _, data = download(cache, source)
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert sorted(archive.namelist()) == [
+            "checkpoint-1/",
+            "checkpoint-1/weights.bin",
+            "config.json",
+        ]
+        assert archive.read("checkpoint-1/weights.bin") == bytes(range(256)) * 100
+    assert cache.info()["entries"] == 1
+
+    status, cached = download(cache, source)
+    assert cached == data
+    assert cache.hits == 1
+
+    # Cached archives can be resumed part way.
+    status, part = download(cache, source, headers={"Range": "bytes=100-"})
+    assert status == 206
+    assert part == data[100:]
+
+
+def test_only_cached_archives_accept_ranges(tmp_path: Path, source: Path):
+    cache = ArchiveCache(tmp_path / "archives")
+    with Flask(__name__).test_request_context():
+        streamed = cache.response(source, "model.zip")
+        assert streamed.headers["Accept-Ranges"] == "none"
+        streamed.get_data()
+
+        cached = cache.response(source, "model.zip")
+        assert cached.headers["Accept-Ranges"] == "bytes"
+        cached.close()
+
+
+def test_changed_folders_are_archived_again(tmp_path: Path, source: Path):
+    cache = ArchiveCache(tmp_path / "archives", max_bytes=1)
+    download(cache, source)
+
+    (source / "config.json").write_text('{"changed": true}')
+    _, data = download(cache, source)
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.read("config.json") == b'{"changed": true}'
+
+    assert cache.misses == 2
+    assert cache.evictions == 2
+
+
+def test_excluded_files_are_left_out(tmp_path: Path, source: Path):
+    cache = ArchiveCache(tmp_path / "archives")
+    (source / "audio.partial.jsonl").write_text("{}")
+    app = Flask(__name__)
+    with app.test_request_context():
+        response = cache.response(source, "model.zip", exclude=["*.partial.jsonl"])
+        data = response.get_data()
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert "audio.partial.jsonl" not in archive.namelist()
+        assert "config.json" in archive.namelist()
+
+    # Excluded files don't change the fingerprint.
+    (source / "audio.partial.jsonl").write_text("{}\n{}")
+    with app.test_request_context():
+        cache.response(source, "model.zip", exclude=["*.partial.jsonl"]).close()
+    assert cache.hits == 1
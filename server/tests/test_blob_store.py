@@ -0,0 +1,78 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from server.blob_store import BlobStore
+
+WEIGHTS = bytes(range(256)) * 100
+
+
+@pytest.fixture()
+def models(tmp_path: Path) -> Path:
+    for name in ("a", "b"):
+        folder = tmp_path / "models" / name
+        folder.mkdir(parents=True)
+        (folder / "pytorch_model.bin").write_bytes(WEIGHTS)
+        (folder / "config.json").write_text(name)
+    return tmp_path / "models"
+
+
+def test_identical_files_share_a_blob(tmp_path: Path, models: Path):
+    store = BlobStore(tmp_path / "blobs")
+
+    assert store.add_folder(models / "a") == 0
+    assert store.add_folder(models / "b") == len(WEIGHTS)
+
+    a, b = models / "a" / "pytorch_model.bin", models / "b" / "pytorch_model.bin"
+    assert os.path.samefile(a, b)
+    assert b.read_bytes() == WEIGHTS
+    assert not os.path.samefile(
+        models / "a" / "config.json", models / "b" / "config.json"
+    )
+    assert store.info() == {"blobs": 1, "references": 2, "size_bytes": len(WEIGHTS)}
+
+    # Adding a folder again changes nothing.
+    assert store.add_folder(models / "b") == 0
+    assert store.info()["references"] == 2
+
+
+def test_blobs_are_removed_once_unreferenced(tmp_path: Path, models: Path):
+    store = BlobStore(tmp_path / "blobs")
+    store.add_folder(models / "a")
+    store.add_folder(models / "b")
+
+    store.release_folder(models / "a")
+    assert store.info()["blobs"] == 1
+
+    store.release_folder(models / "b")
+    assert store.info() == {"blobs": 0, "references": 0, "size_bytes": 0}
+    assert (models / "b" / "pytorch_model.bin").read_bytes() == WEIGHTS
+
+
+def test_detached_files_can_be_rewritten(tmp_path: Path, models: Path):
+    store = BlobStore(tmp_path / "blobs")
+    store.add_folder(models / "a")
+    store.add_folder(models / "b")
+
+    store.detach_folder(models / "b")
+    weights = models / "b" / "pytorch_model.bin"
+    weights.write_bytes(b"retrained")
+
+    assert (models / "a" / "pytorch_model.bin").read_bytes() == WEIGHTS
+    assert store.info()["references"] == 1
+
+
+def test_references_are_restored(tmp_path: Path, models: Path):
+    store = BlobStore(tmp_path / "blobs")
+    store.add_folder(models / "a")
+    store.add_folder(models / "b")
+
+    # Folders removed while the server was down are released on loading.
+    for path in (models / "b").iterdir():
+        path.unlink()
+    (models / "b").rmdir()
+
+    restored = BlobStore(tmp_path / "blobs")
+    assert restored.info()["references"] == 1
+    assert restored.add_folder(models / "a") == 0
@@ -0,0 +1,110 @@
+from pathlib import Path
+
+from elpis.datasets.dataset import CleaningOptions, ProcessingBatch
+
+from server.dataset_manifest import DatasetManifest
+
+
+def batch(folder: Path, name: str) -> ProcessingBatch:
+    return ProcessingBatch(
+        transcription_file=folder / f"{name}.eaf",
+        audio_file=folder / f"{name}.wav",
+        cleaning_options=CleaningOptions(),
+        elan_options=None,
+    )
+
+
+def processed(manifest: DatasetManifest, batches, output_dir: Path) -> None:
+    for item in batches:
+        output = output_dir / f"{item.audio_file.stem}_0.wav"
+        output.write_bytes(b"processed")
+        manifest.record(item, [output.name], output_dir)
+
+
+def test_plan_finds_changed_new_and_removed_batches(tmp_path: Path):
+    raw, output_dir = tmp_path / "raw", tmp_path / "processed"
+    raw.mkdir()
+    output_dir.mkdir()
+    for name in ("a", "b", "c"):
+        (raw / f"{name}.eaf").write_text(name)
+        (raw / f"{name}.wav").write_bytes(name.encode())
+
+    manifest = DatasetManifest()
+    batches = [batch(raw, name) for name in ("a", "b", "c")]
+    pending, stale = manifest.plan(batches)
+    assert pending == batches and stale == []
+    processed(manifest, pending, output_dir)
+
+    manifest.save(tmp_path / "manifest.json")
+    manifest = DatasetManifest.load(tmp_path / "manifest.json")
+    assert manifest is not None
+    assert manifest.plan(batches) == ([], [])
+
+    (raw / "b.wav").write_bytes(b"changed")
+    (raw / "c.eaf").unlink()
+    (raw / "c.wav").unlink()
+    (raw / "d.eaf").write_text("d")
+    (raw / "d.wav").write_bytes(b"d")
+    batches = [batch(raw, name) for name in ("a", "b", "d")]
+
+    pending, stale = manifest.plan(batches)
+    assert [item.transcription_file.name for item in pending] == ["b.eaf", "d.eaf"]
+    assert sorted(stale) == ["b.eaf", "c.eaf"]
+
+    for name in stale:
+        manifest.remove_outputs(name, output_dir)
+    assert sorted(path.name for path in output_dir.iterdir()) == ["a_0.wav"]
+
+
+def test_corrupt_manifests_are_ignored(tmp_path: Path):
+    (tmp_path / "manifest.json").write_text("{")
+    assert DatasetManifest.load(tmp_path / "manifest.json") is None
+    assert DatasetManifest.load(tmp_path / "missing.json") is None
+
+
+def test_summary_is_complete_once_every_batch_is_processed(tmp_path: Path):
+    raw, output_dir = tmp_path / "raw", tmp_path / "processed"
+    raw.mkdir()
+    output_dir.mkdir()
+    for name in ("a", "b"):
+        (raw / f"{name}.eaf").write_text(name)
+        (raw / f"{name}.wav").write_bytes(name.encode())
+
+    manifest = DatasetManifest()
+    pending, _ = manifest.plan([batch(raw, name) for name in ("a", "b")])
+    processed(manifest, pending[:1], output_dir)
+    assert not manifest.summary().complete
+
+    processed(manifest, pending[1:], output_dir)
+    summary = manifest.summary()
+    assert summary.complete
+    assert (summary.batches, summary.files, summary.raw_files) == (2, 2, 4)
+    assert summary.size_bytes == 2 * len(b"processed")
+
+
+def test_verify_and_repair_drift(tmp_path: Path):
+    raw, output_dir = tmp_path / "raw", tmp_path / "processed"
+    raw.mkdir()
+    output_dir.mkdir()
+    for name in ("a", "b", "c"):
+        (raw / f"{name}.eaf").write_text(name)
+        (raw / f"{name}.wav").write_bytes(name.encode())
+
+    manifest = DatasetManifest()
+    pending, _ = manifest.plan([batch(raw, name) for name in ("a", "b", "c")])
+    processed(manifest, pending, output_dir)
+    assert manifest.verify(raw, output_dir).ok
+
+    (output_dir / "a_0.wav").unlink()
+    (output_dir / "b_0.wav").write_bytes(b"short")
+    (output_dir / "stray.wav").write_bytes(b"stray")
+    drift = manifest.verify(raw, output_dir)
+    assert drift.missing_outputs == ["a_0.wav"]
+    assert drift.resized_outputs == ["b_0.wav"]
+    assert drift.untracked_outputs == ["stray.wav"]
+    assert drift.drifted_batches == ["a.eaf", "b.eaf"]
+
+    manifest.repair(drift, output_dir)
+    assert sorted(path.name for path in output_dir.iterdir()) == ["c_0.wav"]
+    assert not manifest.summary().complete
+    assert manifest.verify(raw, output_dir).unprocessed_batches == ["a.eaf", "b.eaf"]
@@ -0,0 +1,67 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from server.files import Placement, copy_file_verified, link_or_copy, read_new_lines
+
+
+def test_read_new_lines_leaves_partial_lines(tmp_path):
+    path = tmp_path / "logs.txt"
+    assert read_new_lines(path) == ([], 0)
+
+    path.write_text("one\ntwo\nthr")
+    lines, offset = read_new_lines(path)
+    assert lines == ["one", "two"]
+    assert offset == 8
+
+    with open(path, "a") as file:
+        file.write("ee\n")
+    assert read_new_lines(path, offset) == (["three"], 14)
+
+
+def test_read_new_lines_with_max_bytes(tmp_path):
+    path = tmp_path / "logs.txt"
+    path.write_text("one\ntwo\nthree\n")
+
+    assert read_new_lines(path, max_bytes=6) == (["one"], 4)
+    assert read_new_lines(path, 4, max_bytes=6) == (["two"], 8)
+    # A line longer than the limit is still returned whole.
+    assert read_new_lines(path, 8, max_bytes=2) == (["three"], 14)
+
+
+def test_link_or_copy_hardlinks_on_the_same_filesystem(tmp_path):
+    source = tmp_path / "source.wav"
+    source.write_bytes(b"audio")
+    destination = tmp_path / "destination.wav"
+    destination.write_bytes(b"old")
+
+    assert link_or_copy(source, destination) == Placement.HARDLINK
+    assert os.path.samefile(source, destination)
+
+
+def test_link_or_copy_falls_back_to_copying(tmp_path):
+    source = tmp_path / "source.wav"
+    source.write_bytes(b"audio")
+    destination = tmp_path / "destination.wav"
+
+    with patch("os.link", side_effect=OSError), patch(
+        "server.files.clone_file", side_effect=OSError
+    ):
+        assert link_or_copy(source, destination) == Placement.COPY
+    assert destination.read_bytes() == b"audio"
+    assert not os.path.samefile(source, destination)
+    assert destination.stat().st_mtime_ns == source.stat().st_mtime_ns
+    assert [path.name for path in tmp_path.iterdir()].count("destination.wav") == 1
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_copy_file_verified_rejects_corrupt_copies(tmp_path):
+    source = tmp_path / "source.wav"
+    source.write_bytes(b"audio")
+    destination = tmp_path / "destination.wav"
+
+    with patch("server.files.hash_file", return_value="corrupt"):
+        with pytest.raises(OSError):
+            copy_file_verified(source, destination)
+    assert not destination.exists()
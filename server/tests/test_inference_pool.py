@@ -0,0 +1,57 @@
+import os
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from server import inference_pool
+from server.inference import InferenceTask
+from server.inference_pool import InferencePool
+
+# Tasks run in fresh interpreters, which take a few seconds to start, so the
+# pools here use fakes for the inference itself.
+
+
+def echo_task(task: InferenceTask) -> List[str]:
+    return [f"{os.getpid()}:{path.name}" for path in task.audio_files]
+
+
+def crash_task(task: InferenceTask) -> List[str]:
+    os._exit(1)
+
+
+def task(*names: str) -> InferenceTask:
+    return InferenceTask(
+        model_location="model",
+        pipeline_location="model",
+        cache_dir=Path("cache"),
+        audio_files=[Path(name) for name in names],
+    )
+
+
+def test_tasks_round_trip_through_the_pool(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(inference_pool, "_run_task", echo_task)
+    pool = InferencePool(processes=1)
+    try:
+        results = pool.run(task("a.wav", "b.wav"))
+        pid = results[0].split(":")[0]
+        assert pid != str(os.getpid())
+        assert results == [f"{pid}:a.wav", f"{pid}:b.wav"]
+        assert pool.info()["started"]
+    finally:
+        pool.clear()
+
+
+def test_pool_recovers_from_a_dead_worker(monkeypatch: pytest.MonkeyPatch):
+    pool = InferencePool(processes=1)
+    try:
+        monkeypatch.setattr(inference_pool, "_run_task", crash_task)
+        with pytest.raises(inference_pool.BrokenProcessPool):
+            pool.run(task("a.wav"))
+        assert not pool.info()["started"]
+
+        # The next task starts a fresh pool.
+        monkeypatch.setattr(inference_pool, "_run_task", echo_task)
+        assert pool.run(task("b.wav"))[0].endswith(":b.wav")
+    finally:
+        pool.clear()
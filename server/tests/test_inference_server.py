@@ -0,0 +1,88 @@
+import socket
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, List
+
+import pytest
+import torch
+
+from server import inference_server
+from server.inference import InferenceTask
+from server.inference_server import InferenceClient, InferenceError, InferenceServer
+
+
+@pytest.fixture()
+def server(tmp_path: Path):
+    server = InferenceServer(tmp_path / "inference.sock", pipeline_cache_bytes=None)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture()
+def client(server: InferenceServer):
+    return InferenceClient(Path(server.server_address))
+
+
+def test_inference_server_reports_its_pipelines(client: InferenceClient):
+    info = client.info()
+    assert info["pipelines"] == []
+    assert info["max_bytes"] is None
+
+    client.clear()
+
+
+def test_inference_server_returns_errors(client: InferenceClient):
+    with pytest.raises(InferenceError, match="Unknown request type"):
+        client._request({"type": "unknown"})
+    with pytest.raises(InferenceError, match="Missing the task"):
+        client._request({"type": "run"})
+
+
+def test_clearing_keeps_pinned_pipelines(
+    server: InferenceServer, client: InferenceClient
+):
+    pipeline: Any = SimpleNamespace(model=torch.nn.Linear(1, 1))
+    server.pipelines.put("pinned", pipeline)
+    server.pipelines.put("unpinned", pipeline)
+    server.pipelines.pin("pinned")
+
+    client.clear()
+    assert "pinned" in server.pipelines
+    assert "unpinned" not in server.pipelines
+
+
+def test_client_times_out_on_a_hung_server(tmp_path: Path):
+    socket_path = tmp_path / "hung.sock"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as hung_server:
+        hung_server.bind(str(socket_path))
+        hung_server.listen()
+        client = InferenceClient(socket_path, timeout=0.1)
+        with pytest.raises(InferenceError, match="No response"):
+            client.info()
+
+
+def test_requests_abandoned_by_their_client_are_dropped(
+    server: InferenceServer, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    runs: List[InferenceTask] = []
+    monkeypatch.setattr(server, "_get_pipeline", lambda task: None)
+    monkeypatch.setattr(
+        inference_server, "run_task", lambda task, asr: runs.append(task) or []
+    )
+    task = InferenceTask("model", "model", tmp_path, [tmp_path / "audio.wav"])
+    client = InferenceClient(Path(server.server_address), timeout=0.2)
+
+    # Another request is being run, so this one times out while waiting.
+    with server._inference_lock:
+        with pytest.raises(InferenceError, match="No response"):
+            client.run(task)
+    time.sleep(0.2)
+    assert runs == []
+
+    assert client.run(task) == []
+    assert runs == [task]
@@ -0,0 +1,54 @@
+from server.job_queue import JobQueue
+
+
+def test_queue_is_fifo():
+    queue = JobQueue()
+    for key in "abc":
+        queue.put(key)
+
+    assert len(queue) == 3
+    assert [queue.get(timeout=0) for _ in range(3)] == ["a", "b", "c"]
+    assert queue.get(timeout=0) is None
+
+
+def test_queue_ignores_duplicate_keys():
+    queue = JobQueue()
+    queue.put("a")
+    queue.put("a")
+    assert len(queue) == 1
+
+
+def test_queue_position_and_remove():
+    queue = JobQueue()
+    for key in "abc":
+        queue.put(key)
+
+    assert queue.position("c") == 2
+    assert queue.remove("b")
+    assert not queue.remove("b")
+    assert queue.position("c") == 1
+    assert queue.position("b") is None
+    assert "b" not in queue
+
+
+def test_queue_take_matching_keys_in_order():
+    queue = JobQueue()
+    for key in ["a1", "b1", "a2", "a3"]:
+        queue.put(key)
+
+    assert queue.take(lambda key: key.startswith("a"), 2) == ["a1", "a2"]
+    assert queue.take(lambda key: key.startswith("a"), 0) == []
+    assert [queue.get(timeout=0), queue.get(timeout=0)] == ["b1", "a3"]
+
+
+def test_queue_serves_higher_priorities_first():
+    queue = JobQueue()
+    queue.put("low", priority=-1)
+    queue.put("a")
+    queue.put("high", priority=5)
+    queue.put("b")
+
+    assert queue.priority("high") == 5
+    assert queue.position("b") == 2
+    assert [queue.get(timeout=0) for _ in range(4)] == ["high", "a", "b", "low"]
+    assert queue.priority("high") is None
@@ -0,0 +1,92 @@
+import json
+import os
+import struct
+import time
+from pathlib import Path
+
+import pytest
+from torch.utils.tensorboard import SummaryWriter
+
+from server.metrics import TrainingMetrics, downsample
+
+
+def test_downsample_averages_buckets():
+    points = {step: float(step) for step in range(1, 11)}
+    assert downsample(points, 20) == (
+        list(range(1, 11)),
+        list(map(float, range(1, 11))),
+    )
+    assert downsample(points, 2) == ([5, 10], [3.0, 8.0])
+
+
+def test_metrics_are_read_incrementally(tmp_path: Path):
+    checkpoint = tmp_path / "checkpoint-2"
+    checkpoint.mkdir()
+    log_history = [
+        {"step": 1, "epoch": 0.5, "loss": 2.0, "learning_rate": 0.1},
+        {"step": 2, "epoch": 1.0, "eval_loss": 1.5, "eval_wer": 0.9},
+    ]
+    (checkpoint / "trainer_state.json").write_text(
+        json.dumps({"log_history": log_history})
+    )
+    metrics = TrainingMetrics(tmp_path)
+    series = metrics.get()["series"]
+    assert series["train/loss"] == {"steps": [1], "values": [2.0]}
+    assert series["eval/wer"] == {"steps": [2], "values": [0.9]}
+
+    writer = SummaryWriter(str(tmp_path / "runs" / "run"))
+    for step in [1, 2, 3]:
+        writer.add_scalar("train/loss", 2.0 / step, step)
+    writer.flush()
+    series = metrics.get()["series"]
+    assert series["train/loss"]["steps"] == [1, 2, 3]
+    assert series["eval/loss"] == {"steps": [2], "values": [1.5]}
+
+    # Unchanged files give the same response.
+    assert metrics.get() is metrics.get()
+
+    writer.add_scalar("train/loss", 0.4, 4)
+    writer.close()
+    series = metrics.get()["series"]
+    assert series["train/loss"]["steps"] == [1, 2, 3, 4]
+    assert series["train/loss"]["values"][-1] == pytest.approx(0.4)
+
+
+def test_metrics_skip_corrupt_records(tmp_path: Path):
+    writer = SummaryWriter(str(tmp_path / "runs" / "run"))
+    writer.add_scalar("train/loss", 1.0, 1)
+    writer.close()
+    (events,) = (tmp_path / "runs" / "run").glob("events.out.tfevents.*")
+    # Append a record whose data isn't an event, then a valid record.
+    record = b"\xff" * 8
+    data = events.read_bytes()
+    events.write_bytes(
+        data + struct.pack("<QI", len(record), 0) + record + bytes(4) + data
+    )
+
+    series = TrainingMetrics(tmp_path).get()["series"]
+    assert series["train/loss"] == {"steps": [1], "values": [1.0]}
+
+
+def test_metrics_are_read_from_the_newest_run(tmp_path: Path):
+    old = SummaryWriter(str(tmp_path / "runs" / "old"))
+    for step in [1, 2, 3]:
+        old.add_scalar("train/loss", 1.0, step)
+    old.close()
+    metrics = TrainingMetrics(tmp_path)
+    assert metrics.get()["series"]["train/loss"]["steps"] == [1, 2, 3]
+
+    new = SummaryWriter(str(tmp_path / "runs" / "new"))
+    new.add_scalar("train/loss", 2.0, 1)
+    new.close()
+    (new_events,) = (tmp_path / "runs" / "new").glob("events.out.tfevents.*")
+    os.utime(new_events, ns=(time.time_ns() + 10**9,) * 2)
+    series = metrics.get()["series"]
+    assert series["train/loss"] == {"steps": [1], "values": [2.0]}
+
+
+def test_missing_checkpoint_is_skipped(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(
+        "server.metrics.latest_checkpoint", lambda folder: folder / "checkpoint-9"
+    )
+    assert TrainingMetrics(tmp_path).get() == {"series": {}}
@@ -0,0 +1,71 @@
+from pathlib import Path
+
+from server.inference import InferenceTask
+from server.pipeline_cache import PipelineCache
+
+
+def sized_cache(max_bytes, pinned=()) -> PipelineCache:
+    # Use integer "pipelines" whose size is their value.
+    return PipelineCache(max_bytes=max_bytes, pinned=pinned, size_of=lambda x: x)
+
+
+def test_cache_counts_hits_and_misses():
+    cache = sized_cache(max_bytes=None)
+    assert cache.get("a", lambda: 1) == 1
+    assert cache.get("a", lambda: 2) == 1
+
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_cache_evicts_least_recently_used():
+    cache = sized_cache(max_bytes=10)
+    cache.get("a", lambda: 4)
+    cache.get("b", lambda: 4)
+    cache.get("a", lambda: 4)
+    cache.get("c", lambda: 4)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert cache.evictions == 1
+    assert cache.size == 8
+
+
+def test_cache_never_evicts_pinned_pipelines():
+    cache = sized_cache(max_bytes=10, pinned=["a"])
+    cache.get("a", lambda: 4)
+    cache.get("b", lambda: 4)
+    cache.get("c", lambda: 4)
+
+    assert "a" in cache
+    assert "b" not in cache
+
+    cache.unpin("a")
+    cache.get("d", lambda: 4)
+    assert "a" not in cache
+
+
+def test_cache_keeps_pipeline_larger_than_budget():
+    cache = sized_cache(max_bytes=10)
+    cache.get("a", lambda: 4)
+    cache.get("b", lambda: 20)
+
+    assert "a" not in cache
+    assert "b" in cache
+
+
+def test_pinned_models_keep_their_int8_pipelines():
+    task = InferenceTask(
+        "model", "model", Path("cache"), [], quantized_weights=Path("int8.pt")
+    )
+    cache = sized_cache(max_bytes=10, pinned=[task.model_location])
+    cache.get(task.pipeline_key, lambda: 4)
+    cache.get("b", lambda: 4)
+    cache.get("c", lambda: 4)
+    assert task.pipeline_key in cache
+    assert cache.info()["pipelines"][0]["pinned"]
+
+    cache.unpin(task.model_location)
+    cache.get("d", lambda: 4)
+    assert task.pipeline_key not in cache
@@ -0,0 +1,75 @@
+import os
+from pathlib import Path
+
+from elpis.datasets import Dataset
+from elpis.datasets.dataset import CleaningOptions, ElanOptions
+from elpis.models import ElanTierSelector
+
+from server.preprocessing import PreprocessingPool, pool_size
+
+ABUI_DIR = Path(__file__).parent / "data" / "abui"
+
+
+def batches():
+    dataset = Dataset(
+        name="test",
+        files=[ABUI_DIR / name for name in sorted(os.listdir(ABUI_DIR))],
+        cleaning_options=CleaningOptions(),
+        elan_options=ElanOptions(ElanTierSelector.NAME, "Phrase"),
+    )
+    return list(dataset.to_batches())
+
+
+def test_pool_size():
+    assert pool_size(4, 2) == 2
+    assert pool_size(2, 10) == 2
+    assert pool_size(0, 1) == 1
+    assert pool_size(3, 0) == 1
+
+
+def test_pool_output_matches_serial_output(tmp_path: Path):
+    serial, parallel = tmp_path / "serial", tmp_path / "parallel"
+    serial.mkdir()
+    parallel.mkdir()
+
+    serial_report = PreprocessingPool(workers=2).process(batches(), serial)
+    pool = PreprocessingPool(workers=2, min_pool_bytes=0)
+    try:
+        parallel_report = pool.process(batches(), parallel)
+    finally:
+        pool.close()
+
+    # Datasets this small aren't worth starting processes for.
+    assert serial_report.workers == 1
+    assert parallel_report.workers == 2
+    assert len(parallel_report.failures) == 0
+    assert [batch.transcription_file for batch in parallel_report.batches] == [
+        "abui_1.eaf",
+        "abui_2.eaf",
+        "abui_3.eaf",
+        "abui_4.eaf",
+    ]
+    assert all(batch.files > 0 for batch in parallel_report.batches)
+
+    names = sorted(os.listdir(serial))
+    assert names == sorted(os.listdir(parallel))
+    for name in names:
+        if name.endswith(".json"):
+            serial_text = (serial / name).read_text()
+            assert serial_text.replace(str(serial), str(parallel)) == (
+                (parallel / name).read_text()
+            )
+        else:
+            assert (serial / name).read_bytes() == (parallel / name).read_bytes()
+
+
+def test_failed_batches_are_reported(tmp_path: Path):
+    broken = batches()
+    broken[1].transcription_file = tmp_path / "missing.eaf"
+
+    report = PreprocessingPool(workers=1).process(broken, tmp_path)
+
+    assert [batch.transcription_file for batch in report.failures] == ["missing.eaf"]
+    assert report.failures[0].error is not None
+    assert report.to_dict()["failures"] == 1
+    assert len(report.batches) == 4
@@ -0,0 +1,32 @@
+import os
+import socket
+import time
+
+from server.process_stats import cpu_percent, established_connections, process_stats
+
+
+def test_process_stats_of_this_process():
+    before = process_stats(os.getpid())
+    deadline = time.monotonic() + 0.2
+    while time.monotonic() < deadline:
+        pass
+    after = process_stats(os.getpid())
+
+    assert after.rss_bytes > 0
+    assert after.cpu_seconds >= before.cpu_seconds
+    assert cpu_percent(before, after) > 0
+
+
+def test_missing_process_has_no_stats():
+    assert process_stats(2**22 + 1) is None
+
+
+def test_established_connections():
+    with socket.create_server(("127.0.0.1", 0)) as server:
+        port = server.getsockname()[1]
+        assert established_connections(port) == 0
+
+        with socket.create_connection(("127.0.0.1", port)):
+            connection, _ = server.accept()
+            with connection:
+                assert established_connections(port) == 1
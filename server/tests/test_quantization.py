@@ -0,0 +1,55 @@
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+import torch
+
+from server.pipeline_cache import pipeline_size
+from server.quantization import (
+    character_error_rate,
+    load_quantized,
+    quantize,
+    quantized_weights,
+    save_quantized,
+    word_error_rate,
+)
+
+
+def test_word_error_rate_counts_edits():
+    references = ["the cat sat", "on the mat"]
+    predictions = ["the bat sat down", "on mat"]
+    # One substitution and one insertion, then one deletion, over six words.
+    assert word_error_rate(references, predictions) == pytest.approx(3 / 6)
+
+
+def test_character_error_rate_counts_edits():
+    assert character_error_rate(["abcd"], ["abed"]) == pytest.approx(1 / 4)
+    assert character_error_rate(["abcd"], ["abcd"]) == 0
+
+
+def linear_pipeline() -> Any:
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(torch.nn.Linear(16, 16), torch.nn.Linear(16, 4))
+    return SimpleNamespace(model=model)
+
+
+def test_quantized_models_round_trip(tmp_path: Path):
+    quantized = quantize(linear_pipeline())
+    weights = save_quantized(quantized, tmp_path)
+    assert quantized_weights(tmp_path) == weights
+
+    loaded = load_quantized(linear_pipeline(), weights)
+    inputs = torch.randn(3, 16)
+    assert torch.equal(quantized.model(inputs), loaded.model(inputs))
+
+
+def test_pipeline_size_counts_quantized_weights():
+    full = linear_pipeline()
+    full_size = pipeline_size(full)
+    quantized_size = pipeline_size(quantize(linear_pipeline()))
+
+    # The int8 weights take about a quarter of the space of the fp32 ones.
+    weight_count = 16 * 16 + 16 * 4
+    assert full_size == (weight_count + 16 + 4) * 4
+    assert weight_count <= quantized_size < full_size
@@ -0,0 +1,46 @@
+import os
+from pathlib import Path
+
+from elpis.models import Annotation
+
+from server.result_cache import ResultCache
+
+
+def annotation(text: str, audio_file: str = "a.wav") -> Annotation:
+    return Annotation(
+        transcript=text, start_ms=0, stop_ms=100, audio_file=Path(audio_file)
+    )
+
+
+def test_result_cache_round_trips_annotations(tmp_path: Path):
+    cache = ResultCache(tmp_path)
+    key = ResultCache.key("audio", "model", "revision")
+    assert cache.get(key, Path("b.wav")) is None
+
+    cache.put(key, [annotation("hello")])
+    (result,) = cache.get(key, Path("b.wav"))  # type: ignore
+
+    assert result.transcript == "hello"
+    assert result.audio_file == Path("b.wav")
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_result_cache_key_depends_on_model_identity():
+    assert ResultCache.key("audio", "model", "a") != ResultCache.key(
+        "audio", "model", "b"
+    )
+
+
+def test_result_cache_evicts_least_recently_used(tmp_path: Path):
+    cache = ResultCache(tmp_path, max_bytes=None)
+    cache.put("aa", [annotation("first")])
+    cache.put("bb", [annotation("second")])
+    os.utime(cache._path("aa"), (0, 0))
+
+    cache.max_bytes = cache._path("bb").stat().st_size
+    cache.put("bb", [annotation("second")])
+
+    assert cache.get("aa", Path("a.wav")) is None
+    assert cache.get("bb", Path("a.wav")) is not None
+    assert cache.evictions == 1
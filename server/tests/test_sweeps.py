@@ -0,0 +1,66 @@
+import json
+from pathlib import Path
+
+from elpis.models import Job
+
+from server.named_job import JobStatus, NamedJob
+from server.sweeps import (
+    EVAL_RESULTS_FILE,
+    MAX_SWEEP_MODELS,
+    comparison,
+    expand_grid,
+    validate_grid,
+)
+
+
+def test_expand_grid():
+    grid = {"learning_rate": [1e-4, 3e-4], "num_train_epochs": [1, 2, 3]}
+    combinations = expand_grid(grid)
+
+    assert len(combinations) == 6
+    assert combinations[0] == {"learning_rate": 1e-4, "num_train_epochs": 1}
+    assert combinations[1] == {"learning_rate": 1e-4, "num_train_epochs": 2}
+
+
+def test_validate_grid():
+    assert validate_grid({"learning_rate": [1e-4], "num_train_epochs": [2]}) is None
+    assert validate_grid({}) is not None
+    assert validate_grid({"not_a_parameter": [1]}) is not None
+    assert validate_grid({"output_dir": ["elsewhere"]}) is not None
+    assert validate_grid({"learning_rate": []}) is not None
+    assert validate_grid({"seed": list(range(MAX_SWEEP_MODELS + 1))}) is not None
+
+
+def test_comparison_ranks_evaluated_models(tmp_path: Path):
+    job = Job.from_args(
+        [
+            "--model_name_or_path=test",
+            "--dataset_name_or_path=test",
+            f"--output_dir={tmp_path}",
+        ]
+    )
+    models = []
+    for index, (wer, status) in enumerate(
+        [
+            (0.4, JobStatus.FINISHED),
+            (None, JobStatus.TRAINING),
+            (0.2, JobStatus.FINISHED),
+        ]
+    ):
+        name = f"sweep-{index + 1}"
+        models.append(
+            NamedJob(name, job, status, sweep="sweep", sweep_parameters={"seed": index})
+        )
+        if wer is not None:
+            (tmp_path / name).mkdir()
+            with open(tmp_path / name / EVAL_RESULTS_FILE, "w") as results:
+                json.dump({"eval_wer": wer, "eval_loss": 1.0}, results)
+
+    table = comparison(models, lambda name: tmp_path / name)
+
+    assert [row["name"] for row in table["models"]] == ["sweep-3", "sweep-1", "sweep-2"]
+    assert table["models"][0]["parameters"] == {"seed": 2}
+    assert table["models"][2]["metrics"] is None
+    assert table["columns"] == ["eval_loss", "eval_wer"]
+    assert table["best"] == "sweep-3"
+    assert not table["done"]
@@ -0,0 +1,82 @@
+import signal
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from server import training
+from server.training import (
+    TrainingLimits,
+    describe_exit,
+    latest_checkpoint,
+    read_progress,
+    start_training,
+    stop_training,
+)
+
+
+def test_stop_training_stops_the_process_group():
+    process = subprocess.Popen(
+        [sys.executable, "-c", "import time; time.sleep(60)"],
+        start_new_session=True,
+    )
+    stop_training(process, timeout=5)
+    assert process.returncode == -signal.SIGTERM
+    assert describe_exit(process.returncode) == (
+        "Training process was killed by SIGTERM"
+    )
+
+    # Stopping a finished process does nothing.
+    stop_training(process)
+
+
+def test_read_progress(tmp_path):
+    progress_file = tmp_path / "progress.json"
+    assert read_progress(progress_file) is None
+
+    progress_file.write_text('{"step": 5, "max_steps": 10')
+    assert read_progress(progress_file) is None
+
+    progress_file.write_text('{"step": 5, "max_steps": 10, "progress": 0.5}')
+    assert read_progress(progress_file)["progress"] == 0.5
+
+
+def test_latest_checkpoint_skips_incomplete_checkpoints(tmp_path):
+    assert latest_checkpoint(tmp_path) is None
+
+    for step in [5, 10, 15]:
+        (tmp_path / f"checkpoint-{step}").mkdir()
+    for step in [5, 10]:
+        (tmp_path / f"checkpoint-{step}" / "trainer_state.json").write_text("{}")
+
+    assert latest_checkpoint(tmp_path) == tmp_path / "checkpoint-10"
+    assert (tmp_path / "checkpoint-15").exists()
+
+    latest = latest_checkpoint(tmp_path, remove_incomplete=True)
+    assert latest == tmp_path / "checkpoint-10"
+    assert not (tmp_path / "checkpoint-15").exists()
+
+
+def test_training_processes_can_import_the_server(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    started = []
+    monkeypatch.setattr(
+        training.subprocess, "Popen", lambda command, **kwargs: started.append(kwargs)
+    )
+    start_training(
+        tmp_path / "job.json",
+        tmp_path / "train.log",
+        tmp_path / "progress.json",
+        TrainingLimits(),
+    )
+    monkeypatch.undo()
+
+    # Wherever the server was started from.
+    check = subprocess.run(
+        [sys.executable, "-c", "import server.training"],
+        cwd=tmp_path,
+        env=started[0]["env"],
+    )
+    assert check.returncode == 0
@@ -0,0 +1,110 @@
+import io
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from server.archives import stream_zip
+from server.uploads import (
+    LOCAL_HEADER,
+    UTF8_FLAG,
+    StreamingZipExtractor,
+    UploadError,
+    extract_stream,
+    install_folder,
+    staging_folder,
+)
+
+
+@pytest.fixture()
+def source(tmp_path: Path) -> Path:
+    folder = tmp_path / "model"
+    (folder / "checkpoint-1").mkdir(parents=True)
+    (folder / "config.json").write_text("{}")
+    # Include a data descriptor signature to check stored entries are split
+    # on verified descriptors only.
+    weights = b"PK\x07\x08" + bytes(range(256)) * 1000
+    (folder / "checkpoint-1" / "weights.bin").write_bytes(weights)
+    return folder
+
+
+def extract(data: bytes, destination: Path, chunk_size: int = 1000, **limits):
+    extractor = StreamingZipExtractor(destination, **limits)
+    for start in range(0, len(data), chunk_size):
+        extractor.write(data[start : start + chunk_size])
+    extractor.close()
+
+
+def assert_same_files(expected: Path, actual: Path):
+    for path in expected.rglob("*"):
+        if path.is_file():
+            assert (actual / path.relative_to(expected)).read_bytes() == (
+                path.read_bytes()
+            )
+
+
+@pytest.mark.parametrize("compression", [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_extracts_streamed_zips(tmp_path: Path, source: Path, compression: int):
+    data = b"".join(stream_zip(source, compression))
+    extract(data, tmp_path / "out")
+    assert_same_files(source, tmp_path / "out")
+
+
+def test_install_flattens_single_top_folder(tmp_path: Path, source: Path):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w", zipfile.ZIP_DEFLATED) as archive:
+        for path in source.rglob("*"):
+            archive.write(path, Path("model") / path.relative_to(source))
+
+    target = tmp_path / "models" / "uploaded"
+    target.mkdir(parents=True)
+    (target / "old.txt").write_text("replaced")
+
+    staging = staging_folder(target)
+    extract(data.getvalue(), staging)
+    install_folder(staging, target)
+
+    assert_same_files(source, target)
+    assert not (target / "old.txt").exists()
+    assert list(target.parent.iterdir()) == [target]
+
+
+def test_rejects_invalid_uploads(tmp_path: Path, source: Path):
+    data = b"".join(stream_zip(source))
+    with pytest.raises(UploadError):
+        extract(data, tmp_path / "a", max_bytes=1000)
+    with pytest.raises(UploadError):
+        extract(data, tmp_path / "b", max_files=1)
+    with pytest.raises(UploadError):
+        extract(data[: len(data) // 2], tmp_path / "c")
+
+    escaping = io.BytesIO()
+    with zipfile.ZipFile(escaping, "w") as archive:
+        archive.writestr("../escaped.txt", "")
+    with pytest.raises(UploadError):
+        extract(escaping.getvalue(), tmp_path / "d")
+
+
+def test_corrupted_entries_are_upload_errors(tmp_path: Path):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr("a.txt", "text" * 100)
+    data = archive.getvalue()
+    data_start = LOCAL_HEADER.size + len("a.txt")
+
+    # An invalid deflate block.
+    corrupt_data = data[:data_start] + b"\xff" * 8 + data[data_start + 8 :]
+    with pytest.raises(UploadError):
+        extract_stream(io.BytesIO(corrupt_data), tmp_path / "a")
+
+    # A name flagged as UTF-8 which isn't.
+    flags = int.from_bytes(data[6:8], "little") | UTF8_FLAG
+    corrupt_name = (
+        data[:6]
+        + flags.to_bytes(2, "little")
+        + data[8 : LOCAL_HEADER.size]
+        + b"\xff\xfe.txt"
+        + data[data_start:]
+    )
+    with pytest.raises(UploadError):
+        extract_stream(io.BytesIO(corrupt_name), tmp_path / "b")
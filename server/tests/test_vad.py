@@ -0,0 +1,43 @@
+import numpy as np
+
+from server.vad import speech_regions
+
+SAMPLING_RATE = 16_000
+
+
+def tone(seconds: float, amplitude: float = 0.5) -> np.ndarray:
+    t = np.arange(int(seconds * SAMPLING_RATE)) / SAMPLING_RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def quiet(seconds: float) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    noise = rng.normal(0, 1e-3, int(seconds * SAMPLING_RATE))
+    return noise.astype(np.float32)
+
+
+def test_finds_speech_between_silence():
+    audio = np.concatenate([quiet(2), tone(1), quiet(2)])
+    ((start, stop),) = speech_regions(audio, SAMPLING_RATE, padding_s=0)
+
+    assert abs(start / SAMPLING_RATE - 2) < 0.05
+    assert abs(stop / SAMPLING_RATE - 3) < 0.05
+
+
+def test_keeps_short_pauses():
+    audio = np.concatenate([quiet(2), tone(1), quiet(0.2), tone(1), quiet(2)])
+    assert len(speech_regions(audio, SAMPLING_RATE, min_silence_s=0.5)) == 1
+    assert (
+        len(speech_regions(audio, SAMPLING_RATE, min_silence_s=0.1, padding_s=0)) == 2
+    )
+
+
+def test_keeps_audio_without_silence():
+    audio = tone(3)
+    assert speech_regions(audio, SAMPLING_RATE) == [(0, len(audio))]
+
+
+def test_skips_audio_which_is_all_silent():
+    assert (
+        speech_regions(np.zeros(SAMPLING_RATE, dtype=np.float32), SAMPLING_RATE) == []
+    )